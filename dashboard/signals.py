@@ -1,9 +1,29 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserActivity
+from users.counters import adjust_counter
+from .models import StudySession, UserActivity
 
 @receiver(post_save, sender=User)
 def create_user_activity(sender, instance, created, **kwargs):
     if created:
-        UserActivity.objects.create(user=instance)
\ No newline at end of file
+        UserActivity.objects.create(user=instance)
+
+@receiver(m2m_changed, sender=StudySession.attendees.through)
+def count_session_attendees(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # pk_set is not provided for clear(), so work out who is affected
+        # before the rows disappear.
+        if reverse:
+            adjust_counter([instance.pk], 'sessions_attended', -instance.dashboard_attended_sessions.count())
+        else:
+            adjust_counter(list(instance.attendees.values_list('pk', flat=True)), 'sessions_attended', -1)
+        return
+
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    delta = 1 if action == 'post_add' else -1
+    if reverse:
+        adjust_counter([instance.pk], 'sessions_attended', delta * len(pk_set))
+    else:
+        adjust_counter(list(pk_set), 'sessions_attended', delta)
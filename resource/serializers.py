@@ -1,8 +1,7 @@
 from rest_framework import serializers
 from .models import Resource, ResourceCategory
 from users.serializers import UserProfileSerializer
-from studygroup.serializers import StudyGroupSerializer
-from studygroup.models import StudyGroup
+from .models import StudyGroup
 
 
 class ResourceCategorySerializer(serializers.ModelSerializer):
@@ -15,12 +14,23 @@ class ResourceCategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['slug']
 
 
+class ResourceGroupSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the groups a resource is shared with
+    """
+    is_member = serializers.BooleanField(read_only=True, default=False)
+
+    class Meta:
+        model = StudyGroup
+        fields = ['id', 'name', 'description', 'is_member']
+
+
 class ResourceSerializer(serializers.ModelSerializer):
     """
     Detailed serializer for Resource listing with nested relationships
     """
     uploaded_by = UserProfileSerializer(read_only=True)
-    groups = StudyGroupSerializer(many=True, read_only=True)
+    groups = ResourceGroupSerializer(many=True, read_only=True)
     categories = ResourceCategorySerializer(many=True, read_only=True)
     
     # Computed fields
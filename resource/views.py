@@ -1,6 +1,6 @@
 from django.shortcuts import get_object_or_404
 from django.http import FileResponse
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Prefetch, Q, Value
 
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
@@ -8,7 +8,7 @@ from rest_framework.parsers import MultiPartParser, FormParser,JSONParser
 
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Resource, ResourceCategory
+from .models import Resource, ResourceCategory, StudyGroup
 from .serializers import (
     ResourceSerializer,
     ResourceCreateSerializer,
@@ -19,6 +19,22 @@ from .filters import ResourceFilter
 from .permissions import IsResourceOwnerOrReadOnly
 
 
+def with_serializer_relations(queryset, user):
+    """
+    Prefetch what ResourceSerializer renders. The nested groups carry an
+    ``is_member`` annotation for ``user``, so the whole page costs a fixed
+    number of queries.
+    """
+    if user.is_authenticated:
+        is_member = Exists(StudyGroup.members.through.objects.filter(studygroup=OuterRef('pk'), customuser=user.pk))
+    else:
+        is_member = Value(False)
+    return queryset.select_related('uploaded_by').prefetch_related(
+        Prefetch('groups', queryset=StudyGroup.objects.annotate(is_member=is_member)),
+        'categories',
+    )
+
+
 class ResourceCategoryListAPI(generics.ListAPIView):
     queryset = ResourceCategory.objects.all()
     serializer_class = ResourceCategorySerializer
@@ -30,8 +46,7 @@ class ResourceCategoryListAPI(generics.ListAPIView):
 
 class ResourceListCreateAPI(generics.ListCreateAPIView):
     parser_classes = [MultiPartParser, FormParser, JSONParser]
-    queryset = Resource.objects.select_related('uploaded_by')\
-                               .prefetch_related('groups', 'categories')
+    queryset = Resource.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_class = ResourceFilter
@@ -42,13 +57,16 @@ class ResourceListCreateAPI(generics.ListCreateAPIView):
         return ResourceSerializer
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        
+        return with_serializer_relations(super().get_queryset(), self.request.user)
+
+
 class ResourceDetailAPI(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Resource.objects.select_related('uploaded_by')\
-                               .prefetch_related('groups', 'categories')
+    queryset = Resource.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsResourceOwnerOrReadOnly]
 
+    def get_queryset(self):
+        return with_serializer_relations(super().get_queryset(), self.request.user)
+
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
             return ResourceUpdateSerializer
@@ -87,7 +105,7 @@ class MyResourcesAPI(generics.ListAPIView):
     filterset_class = ResourceFilter
 
     def get_queryset(self):
-        return Resource.objects.filter(
-            uploaded_by=self.request.user
-        ).select_related('uploaded_by')\
-         .prefetch_related('groups', 'categories')
+        return with_serializer_relations(
+            Resource.objects.filter(uploaded_by=self.request.user),
+            self.request.user
+        )
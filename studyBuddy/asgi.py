@@ -10,15 +10,17 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from chat_gp.consumers import ChatConsumer  # Corrected to match your chat_gp app
-from django.urls import path
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'studyBuddy.settings')
 
+# Set up Django before importing consumers, which import models.
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from studygroup.routing import websocket_urlpatterns  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": URLRouter([
-        path('ws/chat/<int:group_id>/', ChatConsumer.as_asgi()),
-    ]),
-})
\ No newline at end of file
+    "http": django_asgi_app,
+    # Sockets authenticate with a JWT, not cookies, so no origin check is needed.
+    "websocket": URLRouter(websocket_urlpatterns),
+})
@@ -0,0 +1,386 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import socket
+import string
+import struct
+import time
+from collections import defaultdict, deque
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+_header = struct.Struct('!I')
+MAX_FRAME = 16 * 1024 * 1024
+# Most messages one receive() reply carries; the rest wait in the broker.
+RECEIVE_BATCH = 100
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+def _encode(frame):
+    body = _dumps(frame)
+    return _header.pack(len(body)) + body
+
+
+def _messages_frame(request_id, payloads):
+    # Messages are kept JSON-encoded in the broker, so a group message is
+    # serialised once however many channels it is queued on.
+    body = b'[%d,"messages",[%s]]' % (request_id, b','.join(payloads))
+    return _header.pack(len(body)) + body
+
+
+async def _read_frame(reader):
+    (length,) = _header.unpack(await reader.readexactly(_header.size))
+    if length > MAX_FRAME:
+        raise ConnectionError(f'frame of {length} bytes is too large')
+    return json.loads(await reader.readexactly(length))
+
+
+class ChannelBroker:
+    """
+    Holds every channel queue and group of a ``UnixSocketChannelLayer``.
+
+    One broker serves all ASGI workers on a host over a Unix domain socket.
+    Frames are a 4-byte length followed by a JSON list:
+
+    * ``["send", id, channel, message]``: answered ``[id, "ok"]`` or
+      ``[id, "full"]`` once the channel holds ``capacity`` messages;
+    * ``["receive", id, channel]``: answered ``[id, "messages", [...]]``
+      with up to ``RECEIVE_BATCH`` queued messages, as soon as there is
+      one (long poll);
+    * ``["cancel", id]``: drop a pending receive, answered
+      ``[id, "cancelled"]`` unless the message was already on its way;
+    * ``["group_add", id, group, channel]``: answered ``[id, "ok"]``, so
+      the membership holds before messages sent from other connections;
+    * ``["group_discard", 0, group, channel]``, ``["group_send", 0, group,
+      message]`` and ``["flush", 0]`` are not answered; frames on one
+      connection are handled in order.
+
+    Messages that wait longer than ``expiry`` seconds are dropped and their
+    channel leaves all groups, since nobody is reading it. Group memberships
+    expire after ``group_expiry`` seconds, as in the in-memory layer.
+    """
+
+    def __init__(self, path, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None):
+        self.path = path
+        self.expiry = expiry
+        self.group_expiry = group_expiry
+        self.layer = BaseChannelLayer(capacity=capacity)
+        self.layer.channel_capacity = self.layer.compile_capacities(channel_capacity or {})
+        self.channels = {}
+        self.waiters = defaultdict(deque)
+        self.groups = defaultdict(dict)
+        self.server = None
+
+    async def serve(self):
+        self._remove_stale_socket()
+        self.server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o600)
+        sweeper = asyncio.create_task(self._sweep_forever())
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            sweeper.cancel()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def _remove_stale_socket(self):
+        if os.path.exists(self.path):
+            # A socket file left behind by a broker that did not shut down
+            # cleanly; a live broker would still be bound to it.
+            probe = socket.socket(socket.AF_UNIX)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise RuntimeError(f'A channel broker is already listening on {self.path}')
+            finally:
+                probe.close()
+
+    async def _handle(self, reader, writer):
+        pending = {}
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                op, request_id = frame[0], frame[1]
+                if op == 'send':
+                    reply = 'ok' if self.send(frame[2], _dumps(frame[3])) else 'full'
+                    writer.write(_encode([request_id, reply]))
+                elif op == 'receive':
+                    self.receive(frame[2], writer, request_id, pending)
+                elif op == 'cancel':
+                    waiter = pending.pop(request_id, None)
+                    if waiter is not None:
+                        waiter[0] = None
+                        writer.write(_encode([request_id, 'cancelled']))
+                elif op == 'group_add':
+                    self.groups[frame[2]][frame[3]] = time.time()
+                    writer.write(_encode([request_id, 'ok']))
+                elif op == 'group_discard':
+                    self.group_discard(frame[2], frame[3])
+                elif op == 'group_send':
+                    payload = _dumps(frame[3])
+                    for channel in list(self.groups.get(frame[2], ())):
+                        self.send(channel, payload)
+                elif op == 'flush':
+                    self.channels.clear()
+                    self.groups.clear()
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ValueError, IndexError, TypeError):
+            logger.warning("Dropping channel broker client that sent a malformed frame", exc_info=True)
+        finally:
+            for waiter in pending.values():
+                waiter[0] = None
+            writer.close()
+
+    def send(self, channel, payload):
+        waiters = self.waiters.get(channel)
+        while waiters:
+            entry = waiters.popleft()[0]
+            if entry is None:
+                continue
+            writer, request_id, pending = entry
+            pending.pop(request_id, None)
+            if not writer.is_closing():
+                writer.write(_messages_frame(request_id, [payload]))
+                return True
+        queue = self.channels.setdefault(channel, deque())
+        if len(queue) >= self.layer.get_capacity(channel):
+            return False
+        queue.append((time.time() + self.expiry, payload))
+        return True
+
+    def receive(self, channel, writer, request_id, pending):
+        queue = self.channels.get(channel)
+        if queue:
+            self._expire(channel, queue)
+        if queue:
+            payloads = [queue.popleft()[1] for _ in range(min(len(queue), RECEIVE_BATCH))]
+            if not queue:
+                del self.channels[channel]
+            writer.write(_messages_frame(request_id, payloads))
+            return
+        # A one-item list so that cancel can blank the waiter in O(1).
+        waiter = [(writer, request_id, pending)]
+        pending[request_id] = waiter
+        self.waiters[channel].append(waiter)
+
+    def group_discard(self, group, channel):
+        members = self.groups.get(group)
+        if members is not None:
+            members.pop(channel, None)
+            if not members:
+                del self.groups[group]
+
+    def _expire(self, channel, queue):
+        now = time.time()
+        expired = False
+        while queue and queue[0][0] < now:
+            queue.popleft()
+            expired = True
+        if expired:
+            for group in list(self.groups):
+                self.group_discard(group, channel)
+        if not queue:
+            self.channels.pop(channel, None)
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(1)
+            for channel, queue in list(self.channels.items()):
+                self._expire(channel, queue)
+            for channel, waiters in list(self.waiters.items()):
+                while waiters and waiters[0][0] is None:
+                    waiters.popleft()
+                if not waiters:
+                    del self.waiters[channel]
+            oldest = time.time() - self.group_expiry
+            for group, members in list(self.groups.items()):
+                for channel, joined in list(members.items()):
+                    if joined < oldest:
+                        self.group_discard(group, channel)
+
+
+class _Connection:
+    """One worker's connection to the broker, bound to one event loop."""
+
+    def __init__(self, reader, writer, on_unclaimed):
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.futures = {}
+        self.ids = itertools.count(1)
+        self.on_unclaimed = on_unclaimed
+        self.listener = self.loop.create_task(self._listen())
+
+    def usable(self):
+        return not self.writer.is_closing() and self.loop is asyncio.get_running_loop()
+
+    async def request(self, frame, reply=True):
+        request_id = next(self.ids) if reply else 0
+        frame[1] = request_id
+        data = _encode(frame)
+        future = None
+        if reply:
+            future = self.futures[request_id] = self.loop.create_future()
+        self.writer.write(data)
+        await self.writer.drain()
+        return request_id, future
+
+    async def _listen(self):
+        error = ConnectionError('Channel broker connection closed')
+        try:
+            while True:
+                reply = await _read_frame(self.reader)
+                future = self.futures.pop(reply[0], None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+                else:
+                    self.on_unclaimed(reply)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as exc:
+            error = ConnectionError(f'Lost connection to the channel broker: {exc!r}')
+        finally:
+            self.writer.close()
+            for future in self.futures.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.futures.clear()
+
+    async def close(self):
+        self.listener.cancel()
+        self.writer.close()
+
+
+class UnixSocketChannelLayer(BaseChannelLayer):
+    """
+    Channel layer for several ASGI workers on one host, without Redis.
+
+    Workers talk to a ``ChannelBroker`` (``manage.py channel_broker``) over
+    the Unix socket at ``path``, so a group message sent in one worker
+    reaches sockets connected to every other worker. Capacity and expiry
+    are enforced by the broker, which reads the same ``CONFIG``. Messages
+    must be JSON-serialisable.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.path = path
+        self.group_expiry = group_expiry
+        self.client_prefix = ''.join(random.choices(string.ascii_letters, k=8))
+        self._connection = None
+        self._connect_lock = None
+        self._connect_loop = None
+        # Messages the broker sent beyond the one a receive() returned, or
+        # to a receive() that was cancelled meanwhile; the next receive()
+        # on that channel returns them first.
+        self._returned = defaultdict(deque)
+        self._receiving = {}
+
+    async def _connect(self):
+        if self._connection is not None and self._connection.usable():
+            return self._connection
+        loop = asyncio.get_running_loop()
+        if loop is not self._connect_loop:
+            self._connect_loop = loop
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._connection is None or not self._connection.usable():
+                reader, writer = await asyncio.open_unix_connection(self.path)
+                self._connection = _Connection(reader, writer, self._unclaimed)
+        return self._connection
+
+    def _unclaimed(self, reply):
+        # Replies to receive() calls that were cancelled meanwhile.
+        channel = self._receiving.pop(reply[0], None)
+        if channel is not None and reply[1] == 'messages':
+            self._keep(channel, reply[2])
+
+    def _keep(self, channel, messages):
+        expires = time.time() + self.expiry
+        self._returned[channel].extend((expires, message) for message in messages)
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+        connection = await self._connect()
+        _, future = await connection.request(['send', 0, channel, message])
+        if (await future)[1] == 'full':
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        returned = self._returned.get(channel)
+        while returned:
+            expires, message = returned.popleft()
+            if expires >= time.time():
+                return message
+        self._returned.pop(channel, None)
+
+        connection = await self._connect()
+        request_id, future = await connection.request(['receive', 0, channel])
+        self._receiving[request_id] = channel
+        try:
+            reply = await future
+        except asyncio.CancelledError:
+            connection.futures.pop(request_id, None)
+            if connection.usable():
+                connection.writer.write(_encode(['cancel', request_id]))
+            raise
+        self._receiving.pop(request_id, None)
+        first, *rest = reply[2]
+        if rest:
+            self._keep(channel, rest)
+        return first
+
+    async def new_channel(self, prefix='specific.'):
+        return '%s.%s!%s' % (prefix, self.client_prefix, ''.join(random.choices(string.ascii_letters, k=12)))
+
+    # Flush extension
+
+    async def flush(self):
+        self._returned.clear()
+        connection = await self._connect()
+        await connection.request(['flush', 0], reply=False)
+
+    async def close(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        connection = await self._connect()
+        _, future = await connection.request(['group_add', 0, group, channel])
+        await future
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        connection = await self._connect()
+        await connection.request(['group_discard', 0, group, channel], reply=False)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        self.require_valid_group_name(group)
+        connection = await self._connect()
+        await connection.request(['group_send', 0, group, message], reply=False)
@@ -0,0 +1,228 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import F, OrderBy, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("cursor") pagination over the queryset's own ordering.
+
+    The cursor stores the ordering values of the row at the edge of a page,
+    and the next page is the rows strictly after it, e.g.
+    ``(created_at, id) < (:created_at, :id)`` for newest-first lists. That
+    is an index range scan, so page 1000 costs the same as page 1. The
+    primary key is appended as a tie-breaker when the ordering lacks it.
+
+    ``?after=<cursor>`` continues in list order (``next`` link) and
+    ``?before=<cursor>`` goes back towards the start (``previous`` link),
+    which is what an infinite-scrolling chat needs in both directions. No
+    ``COUNT(*)`` is run unless ``?count=1`` is passed.
+
+    Orderings that are not plain fields or annotations (e.g. search rank)
+    fall back to offset cursors.
+    """
+    page_size = api_settings.PAGE_SIZE or 50
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    after_query_param = 'after'
+    before_query_param = 'before'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.limit = self.get_page_size(request)
+        self.count = queryset.count() if request.query_params.get(self.count_query_param) in ('1', 'true') else None
+
+        after = self.decode_cursor(request.query_params.get(self.after_query_param))
+        before = self.decode_cursor(request.query_params.get(self.before_query_param))
+        if after is not None and before is not None:
+            raise NotFound(self.invalid_cursor_message)
+
+        self.ordering = self.get_ordering(queryset)
+        if self.ordering is None:
+            return self.paginate_by_offset(queryset, after, before)
+
+        reverse = before is not None
+        cursor = before if reverse else after
+        queryset = queryset.order_by(*(
+            f"{'-' if descending != reverse else ''}{name}" for name, descending in self.ordering
+        ))
+        if cursor is not None:
+            queryset = queryset.filter(self.keyset_filter(queryset.model, cursor, reverse))
+
+        rows = list(queryset[:self.limit + 1])
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        if not rows:
+            self.has_next = self.has_previous = False
+        self.first_cursor = self.row_cursor(rows[0]) if rows else None
+        self.last_cursor = self.row_cursor(rows[-1]) if rows else None
+        return rows
+
+    def paginate_first_page(self, request, rows, has_next, last_cursor):
+        """
+        Paginate a first page built without the queryset, e.g. from a cache.
+        ``last_cursor`` holds the last row's values for ``get_ordering()``.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.count = None
+        self.has_previous, self.has_next = False, has_next and bool(rows)
+        self.first_cursor = None
+        self.last_cursor = self.encode_cursor(last_cursor) if rows else None
+        return rows
+
+    def paginate_by_offset(self, queryset, after, before):
+        cursor = before if before is not None else after
+        if cursor is not None and not isinstance(cursor, dict):
+            raise NotFound(self.invalid_cursor_message)
+        offset = cursor.get('o', 0) if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise NotFound(self.invalid_cursor_message)
+        if before is not None:
+            offset = max(0, offset - self.limit)
+
+        rows = list(queryset[offset:offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        self.has_previous = offset > 0
+        rows = rows[:self.limit]
+        self.first_cursor = self.encode_cursor({'o': offset})
+        self.last_cursor = self.encode_cursor({'o': offset + len(rows)})
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, queryset):
+        """``[(name, descending), ...]`` ending in the primary key, or None."""
+        query = queryset.query
+        order_by = query.order_by or (query.get_meta().ordering if query.default_ordering else ())
+        ordering = []
+        for item in order_by:
+            if isinstance(item, OrderBy) and isinstance(item.expression, F):
+                ordering.append((item.expression.name, item.descending))
+            elif isinstance(item, str) and item != '?' and '__' not in item:
+                ordering.append((item.lstrip('-'), item.startswith('-')))
+            else:
+                return None
+
+        pk_name = queryset.model._meta.pk.name
+        ordering = [('pk' if name == pk_name else name, descending) for name, descending in ordering]
+        if not any(name == 'pk' for name, _ in ordering):
+            ordering.append(('pk', ordering[-1][1] if ordering else False))
+        return ordering
+
+    def keyset_filter(self, model, cursor, reverse):
+        if not isinstance(cursor, list) or len(cursor) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        values = [self.to_python(model, name, value) for (name, _), value in zip(self.ordering, cursor)]
+
+        condition = Q()
+        for position in reversed(range(len(self.ordering))):
+            name, descending = self.ordering[position]
+            lookup = 'lt' if descending != reverse else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[position]})
+            if position < len(self.ordering) - 1:
+                step |= Q(**{name: values[position]}) & condition
+            condition = step
+        return condition
+
+    def to_python(self, model, name, value):
+        try:
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        try:
+            return field.to_python(value)
+        except DjangoValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def row_cursor(self, row):
+        return self.encode_cursor([_encode_value(getattr(row, name)) for name, _ in self.ordering])
+
+    def encode_cursor(self, value):
+        return base64.urlsafe_b64encode(json.dumps(value, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+        try:
+            return json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+        except (binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def page_link(self, param, cursor):
+        url = remove_query_param(self.base_url, self.before_query_param)
+        url = remove_query_param(url, self.after_query_param)
+        return replace_query_param(url, param, cursor)
+
+    def get_next_link(self):
+        if not self.has_next or self.last_cursor is None:
+            return None
+        return self.page_link(self.after_query_param, self.last_cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_cursor is None:
+            return None
+        return self.page_link(self.before_query_param, self.first_cursor)
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data}
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'description': f'Only with ?{self.count_query_param}=1'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.after_query_param, 'required': False, 'in': 'query',
+             'description': 'Cursor from the "next" link', 'schema': {'type': 'string'}},
+            {'name': self.before_query_param, 'required': False, 'in': 'query',
+             'description': 'Cursor from the "previous" link', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'description': f'Results per page (max {self.max_page_size})', 'schema': {'type': 'integer'}},
+            {'name': self.count_query_param, 'required': False, 'in': 'query',
+             'description': 'Set to 1 to include the total count', 'schema': {'type': 'boolean'}},
+        ]
@@ -53,12 +53,14 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'studyBuddy.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 SPECTACULAR_SETTINGS = {
@@ -74,6 +76,64 @@ CHANNEL_LAYERS = {
         "BACKEND": "channels.layers.InMemoryChannelLayer",
     },
 }
+
+# With more than one ASGI worker on a host, set CHANNEL_BROKER_SOCKET and run
+# `manage.py channel_broker` so that workers share groups through it.
+CHANNEL_BROKER_SOCKET = os.environ.get('CHANNEL_BROKER_SOCKET')
+if CHANNEL_BROKER_SOCKET:
+    CHANNEL_LAYERS['default'] = {
+        "BACKEND": "studyBuddy.channel_layer.UnixSocketChannelLayer",
+        "CONFIG": {
+            "path": CHANNEL_BROKER_SOCKET,
+            "capacity": 100,
+            "expiry": 60,
+        },
+    }
+
+# WebSocket chat messages are written in batches: after FLUSH_INTERVAL_MS or
+# once MAX_BATCH are queued, whichever comes first. Beyond MAX_PENDING
+# unsaved messages, new ones are refused until the database catches up. A
+# message that fails to save MAX_ATTEMPTS times is logged and dropped.
+CHAT_WRITE_BUFFER = {
+    'FLUSH_INTERVAL_MS': 50,
+    'MAX_BATCH': 200,
+    'MAX_PENDING': 10000,
+    'MAX_ATTEMPTS': 5,
+}
+
+# The newest PER_GROUP messages of active groups are kept in memory to serve
+# chat history on connect; least recently read groups go beyond MAX_BYTES.
+CHAT_RECENT_MESSAGES = {
+    'PER_GROUP': 100,
+    'MAX_BYTES': 32 * 1024 * 1024,
+    'HISTORY_ON_CONNECT': 50,
+}
+
+# Thread endpoint limits: replies nested deeper than MAX_DEPTH, or beyond
+# MAX_MESSAGES in total, are loaded from a deeper message's own thread.
+CHAT_THREAD = {
+    'MAX_DEPTH': 20,
+    'MAX_MESSAGES': 500,
+}
+
+# A user is online in a group for TTL seconds after their last heartbeat or
+# ping, checked every TICK seconds; last_active is saved at most once per
+# LAST_ACTIVE_RESOLUTION seconds. Presence is kept in each worker process's
+# memory, so route chat sockets and /presence/ to a single worker.
+PRESENCE = {
+    'TTL': 60,
+    'TICK': 5,
+    'LAST_ACTIVE_RESOLUTION': 60,
+}
+
+# Session calendar: the range endpoint serves windows of at most
+# MAX_WINDOW_DAYS; iCal feeds hold sessions from PAST_DAYS ago on, and
+# sessions without an end time last DEFAULT_DURATION_MINUTES.
+SESSION_CALENDAR = {
+    'MAX_WINDOW_DAYS': 366,
+    'PAST_DAYS': 90,
+    'DEFAULT_DURATION_MINUTES': 60,
+}
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -167,6 +227,7 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": True,
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
     "TOKEN_BLACKLIST_ENABLED": True,
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.TokenRefreshSerializer",
 }
 FRONTEND_URL = "http://localhost:3000"
 AUTH_USER_MODEL = 'users.CustomUser'
@@ -186,4 +247,77 @@ CORS_ALLOWED_ORIGINS = [
     "https://study-buddy-plum.vercel.app",  # Your deployed frontend
 ]
 
-CORS_ALLOW_CREDENTIALS = True  # Allow cookies to be included in CORS requests
\ No newline at end of file
+CORS_ALLOW_CREDENTIALS = True  # Allow cookies to be included in CORS requests
+
+# Logins buffer ``last_active`` in memory and write it back in one batch
+# every few seconds (0 writes it through on every login).
+LAST_ACTIVE_FLUSH_INTERVAL = 5
+
+# Chat read pointers are buffered the same way.
+READ_POINTER_FLUSH_INTERVAL = 5
+
+# Password hashing runs on a bounded pool; once MAX_QUEUE_DEPTH hashes are
+# waiting, further logins/registrations get a 503 instead of queueing.
+PASSWORD_HASHING = {
+    'EXECUTOR': 'thread',  # 'process' to hash in separate worker processes
+    'MAX_WORKERS': None,  # defaults to the number of CPUs
+    'MAX_QUEUE_DEPTH': 64,
+}
+
+# Cached users, settings, group visibility and chat history are invalidated
+# through the default cache, so with several worker processes it must be
+# shared (`manage.py check --deploy` warns otherwise), e.g.
+#   CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache
+#   CACHE_LOCATION=cache_table  (after `manage.py createcachetable`)
+# With the per-process default, such entries live at most
+# PROCESS_LOCAL_CACHE_TIMEOUT seconds (see users/caching.py).
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+}
+PROCESS_LOCAL_CACHE_TIMEOUT = 5
+
+# Authenticated users are cached per process for TTL seconds (see CACHES
+# for how saves reach other processes).
+AUTH_USER_CACHE = {
+    'MAXSIZE': 10000,
+    'TTL': 60,
+}
+
+# Refresh-token blacklist checks go through an in-memory Bloom filter that
+# pulls rows blacklisted by other processes every REFRESH_INTERVAL seconds.
+TOKEN_BLACKLIST_FILTER = {
+    'CAPACITY': 100000,
+    'REFRESH_INTERVAL': 1,
+}
+
+# Outgoing mail is queued in the OutgoingEmail table and delivered by
+# `manage.py send_queued_mail --loop`.
+MAIL_OUTBOX = {
+    'BATCH_SIZE': 50,
+    'MAX_PER_MINUTE': 60,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF': 30,  # seconds, doubled after each failed attempt
+    'RETENTION': 24 * 60 * 60,  # seconds sent/failed messages are kept
+}
+
+# Seconds a user's settings stay in the default cache (see CACHES).
+USER_SETTINGS_CACHE_TIMEOUT = 3600
+
+# Uploaded avatars are re-encoded without metadata; square renditions are
+# built in a background thread after commit (backfill with
+# `manage.py build_avatar_renditions`).
+AVATAR_MAX_PIXELS = 50_000_000
+AVATAR_RENDITION_SIZES = (48, 128, 512)
+AVATAR_WORKERS = 1
+
+# Seconds a user's member-group ids stay in the default cache for the group
+# listing (see CACHES).
+GROUP_VISIBILITY_CACHE_TIMEOUT = 3600
+
+# Full-text search returns at most this many ranked matches the user can
+# see (with an explicit ?ordering, every match). Existing rows are indexed
+# with `manage.py rebuild_search_index`.
+SEARCH_MAX_RESULTS = 500
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class StudygroupConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'studygroup'
+
+    def ready(self):
+        import studygroup.signals
@@ -0,0 +1,121 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from users.authentication import CachedJWTAuthentication
+from .messaging import BufferFull, chat_buffer, group_channel_name, recent_history
+from .models import GroupChat
+from .presence import presence
+from .recent import absolutize
+from .unread import mark_read
+from .visibility import member_group_ids
+
+MAX_MESSAGE_LENGTH = 4000
+HISTORY_ON_CONNECT = getattr(settings, 'CHAT_RECENT_MESSAGES', {}).get('HISTORY_ON_CONNECT', 50)
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    ws/chat/<group_id>/?token=<access token>
+
+    The JWT and the group membership are checked once, when the socket
+    connects, which is answered with ``{"type": "history", "messages":
+    [...]}``, the newest messages first. The user counts as online in the
+    group while the socket is open; ``{"type": "ping"}`` heartbeats, at
+    least every ``PRESENCE['TTL']`` seconds, keep it so. Incoming ``{"message": "...", "parent": <id or null>}``
+    frames are queued in ``chat_buffer``, which stores them in batches and
+    then broadcasts each one to the group as ``{"type": "message", ...}``.
+    """
+
+    async def connect(self):
+        self.group_id = self.scope['url_route']['kwargs']['group_id']
+        self.user = await self.authenticate()
+        if self.user is None:
+            await self.close(code=4401)
+            return
+        if not await self.is_member():
+            await self.close(code=4403)
+            return
+
+        self.group_name = group_channel_name(self.group_id)
+        self.base_url = self.get_base_url()
+        presence.connect(self.user.pk, self.group_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        history = await database_sync_to_async(recent_history)(self.group_id, HISTORY_ON_CONNECT)
+        await self.send_json({
+            'type': 'history',
+            'messages': [absolutize(message, self.base_url) for message in history],
+        })
+
+    async def disconnect(self, code):
+        if getattr(self, 'group_name', None):
+            presence.disconnect(self.user.pk, self.group_id)
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    def get_base_url(self):
+        # Media URLs in messages are made absolute, as the REST API does.
+        host = dict(self.scope.get('headers', ())).get(b'host')
+        if not host:
+            return ''
+        scheme = 'https' if self.scope.get('scheme') == 'wss' else 'http'
+        return f'{scheme}://{host.decode("latin-1")}'
+
+    @database_sync_to_async
+    def authenticate(self):
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        raw_token = (params.get('token') or [''])[0]
+        if not raw_token:
+            return None
+        auth = CachedJWTAuthentication()
+        try:
+            user = auth.get_user(auth.get_validated_token(raw_token))
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            return None
+        return user if user.is_active else None
+
+    @database_sync_to_async
+    def is_member(self):
+        return self.group_id in member_group_ids(self.user.pk)
+
+    @database_sync_to_async
+    def is_valid_parent(self, parent_id):
+        return GroupChat.objects.filter(pk=parent_id, group_id=self.group_id).exists()
+
+    async def receive_json(self, content, **kwargs):
+        if not isinstance(content, dict):
+            return await self.send_error('Expected a JSON object.')
+        presence.touch(self.user.pk, [self.group_id])
+        if content.get('type') == 'ping':
+            return await self.send_json({'type': 'pong'})
+        message = content.get('message')
+        if not isinstance(message, str) or not message.strip():
+            return await self.send_error('Message cannot be empty.')
+        if len(message) > MAX_MESSAGE_LENGTH:
+            return await self.send_error(f'Message is longer than {MAX_MESSAGE_LENGTH} characters.')
+
+        parent_id = content.get('parent')
+        if parent_id is not None and (not isinstance(parent_id, int) or not await self.is_valid_parent(parent_id)):
+            return await self.send_error('Parent message not found in this group.')
+
+        now = timezone.now()
+        chat = GroupChat(
+            group_id=self.group_id, user=self.user, message=message,
+            parent_id=parent_id, created_at=now, updated_at=now,
+        )
+        try:
+            await chat_buffer.add(chat)
+        except BufferFull:
+            return await self.send_error('Server is busy, please retry shortly.')
+        mark_read(self.user.pk, self.group_id, now)
+
+    async def send_error(self, detail):
+        await self.send_json({'type': 'error', 'detail': detail})
+
+    async def chat_message(self, event):
+        await self.send_json({'type': 'message', **absolutize(event['message'], self.base_url)})
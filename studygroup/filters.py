@@ -1,5 +1,9 @@
 import django_filters
+from django.db.models import Case, When
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
 from .models import StudyGroup
+from .search import MAX_RESULTS
 
 class StudyGroupFilter(django_filters.FilterSet):
     subject = django_filters.CharFilter(field_name='subject__name', lookup_expr='iexact')
@@ -12,4 +16,64 @@ class StudyGroupFilter(django_filters.FilterSet):
         fields = {
             'name': ['icontains'],
             'description': ['icontains'],
-        }
\ No newline at end of file
+        }
+
+class RankedSearchFilter(BaseFilterBackend):
+    """
+    Full-text search through ``view.search_index`` with the ``q`` query
+    parameter (``search`` is accepted too). Results come back best match
+    first unless the client asks for an explicit ``ordering``.
+
+    Ranked results are the first ``MAX_RESULTS`` matches that the view's
+    queryset (already narrowed to what the user may see) contains; the
+    index is read a page at a time until that many are found. With any
+    other ``ordering`` every match is returned, through a subquery, and
+    the database orders and pages them.
+
+    Views with a scoped index define ``get_search_scope()``. An ``ordering``
+    listed in the view's ``search_newest_orderings`` asks the index for its
+    newest matches rather than its best ones.
+    """
+    search_params = ('q', 'search')
+
+    def get_query(self, request):
+        for param in self.search_params:
+            query = request.query_params.get(param, '').strip()
+            if query:
+                return query
+        return ''
+
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_query(request)
+        if not query:
+            return queryset
+        ordering = request.query_params.get(api_settings.ORDERING_PARAM)
+        scope = view.get_search_scope() if hasattr(view, 'get_search_scope') else 0
+        newest = ordering in getattr(view, 'search_newest_orderings', ())
+        if ordering and not newest:
+            return queryset.filter(pk__in=view.search_index.matching(query, scope=scope))
+        ids = self.ranked_ids(queryset, view.search_index, query, scope, newest)
+        queryset = queryset.filter(pk__in=ids)
+        if ids and not ordering:
+            queryset = queryset.order_by(Case(*(When(pk=pk, then=rank) for rank, pk in enumerate(ids))))
+        return queryset
+
+    def ranked_ids(self, queryset, index, query, scope, newest):
+        ids, offset = [], 0
+        while len(ids) < MAX_RESULTS:
+            page = index.search(query, scope=scope, limit=MAX_RESULTS, newest=newest, offset=offset)
+            kept = set(queryset.filter(pk__in=page).order_by().values_list('pk', flat=True))
+            ids.extend(pk for pk in page if pk in kept)
+            if len(page) < MAX_RESULTS:
+                break
+            offset += len(page)
+        return ids[:MAX_RESULTS]
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': 'q',
+            'required': False,
+            'in': 'query',
+            'description': 'Full-text search; every word is matched as a prefix',
+            'schema': {'type': 'string'},
+        }]
@@ -0,0 +1,148 @@
+import hashlib
+import itertools
+from datetime import timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Session
+
+User = get_user_model()
+
+_config = getattr(settings, 'SESSION_CALENDAR', {})
+
+FEED_SALT = 'studygroup.ical-feed'
+# Bump when the feed's output changes, so cached copies are not reused.
+FEED_FORMAT = 1
+LINE_OCTETS = 75
+
+
+def feed_token(user):
+    """
+    The secret part of a user's feed URL; calendar apps cannot send a JWT.
+    It signs the user's ``tokens_valid_after`` too, so logging out
+    everywhere also revokes feed URLs handed out before.
+    """
+    return signing.Signer(salt=FEED_SALT).sign(f'{user.pk}:{_revocation_stamp(user)}')
+
+
+def feed_user(token):
+    """The active user whose feed ``token`` opens, or None if it is forged or revoked."""
+    try:
+        user_id, stamp = signing.Signer(salt=FEED_SALT).unsign(token).split(':')
+        user = User.objects.only('pk', 'tokens_valid_after').filter(pk=int(user_id), is_active=True).first()
+    except (signing.BadSignature, ValueError):
+        return None
+    if user is None or stamp != _revocation_stamp(user):
+        return None
+    return user
+
+
+def _revocation_stamp(user):
+    return str(int(user.tokens_valid_after.timestamp())) if user.tokens_valid_after else '0'
+
+
+def feed_sessions(group_ids):
+    """
+    Sessions in ``group_ids`` from ``PAST_DAYS`` before today on, read
+    through the ``(group, start_time)`` index. The window starts at
+    midnight so the feed, and its ETag, only move once a day.
+    """
+    today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    since = today - timedelta(days=_config.get('PAST_DAYS', 90))
+    return Session.objects.filter(group_id__in=group_ids, start_time__gte=since)
+
+
+def feed_etag(group_ids, sessions):
+    """
+    The ETag of a feed of ``sessions``, from one aggregate query. There is
+    no Last-Modified: deleting a session or leaving a group changes the
+    feed without making any remaining row newer.
+    """
+    stats = sessions.order_by().aggregate(
+        count=Count('pk'), session=Max('updated_at'), group=Max('group__updated_at'),
+    )
+    state = f"{FEED_FORMAT}|{','.join(map(str, sorted(group_ids)))}|{stats['count']}|{stats['session']}|{stats['group']}"
+    return f'"{hashlib.md5(state.encode()).hexdigest()}"'
+
+
+def ical_feed(sessions, host):
+    """
+    The iCalendar (RFC 5545) text for ``sessions``, yielded event by event
+    as rows are read, so memory use does not grow with the feed.
+    """
+    yield _fold('BEGIN:VCALENDAR')
+    yield _fold('VERSION:2.0')
+    yield _fold('PRODID:-//BuddyBack//Study sessions//EN')
+    yield _fold('CALSCALE:GREGORIAN')
+    yield _fold('X-WR-CALNAME:Study sessions')
+    default_duration = timedelta(minutes=_config.get('DEFAULT_DURATION_MINUTES', 60))
+    sessions = sessions.select_related('group').order_by('start_time', 'pk')
+    for session in sessions.iterator(chunk_size=500):
+        yield ''.join(_fold(line) for line in _event(session, host, default_duration))
+    yield _fold('END:VCALENDAR')
+
+
+async def aical_feed(sessions, host, chunk_size=500):
+    """
+    ``ical_feed`` for ASGI servers, which would buffer a sync iterator
+    whole before sending it. Rows are read in the sync thread,
+    ``chunk_size`` events at a time, and each chunk is sent as it comes.
+    """
+    events = ical_feed(sessions, host)
+    next_chunk = sync_to_async(lambda: list(itertools.islice(events, chunk_size)))
+    try:
+        while chunk := await next_chunk():
+            yield ''.join(chunk)
+    finally:
+        await sync_to_async(events.close)()
+
+
+def _event(session, host, default_duration):
+    yield 'BEGIN:VEVENT'
+    yield f'UID:session-{session.pk}@{host}'
+    yield f'DTSTAMP:{_datetime(session.updated_at)}'
+    yield f'LAST-MODIFIED:{_datetime(session.updated_at)}'
+    yield f'DTSTART:{_datetime(session.start_time)}'
+    yield f'DTEND:{_datetime(session.end_time or session.start_time + default_duration)}'
+    yield f'SUMMARY:{_text(session.title)}'
+    if session.description:
+        yield f'DESCRIPTION:{_text(session.description)}'
+    location = session.location or (session.meeting_link if session.is_virtual else '')
+    if location:
+        yield f'LOCATION:{_text(location)}'
+    if session.meeting_link:
+        yield f'URL:{session.meeting_link}'
+    yield f'CATEGORIES:{_text(session.group.name)}'
+    yield f"STATUS:{'CANCELLED' if session.status == 'CANCELLED' else 'CONFIRMED'}"
+    yield 'END:VEVENT'
+
+
+def _datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _text(value):
+    return (
+        value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '')
+    )
+
+
+def _fold(line):
+    # Lines longer than 75 octets continue on lines starting with a space,
+    # split between, never inside, UTF-8 characters.
+    encoded = line.encode()
+    parts, start, limit = [], 0, LINE_OCTETS
+    while len(encoded) - start > limit:
+        end = start + limit
+        while encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode())
+        start, limit = end, LINE_OCTETS - 1
+    parts.append(encoded[start:].decode())
+    return '\r\n '.join(parts) + '\r\n'
@@ -0,0 +1,143 @@
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from studyBuddy.channel_layer import ChannelBroker, UnixSocketChannelLayer
+
+GROUP = 'bench'
+
+
+async def join_receivers(layer, receivers, messages, timeout):
+    """Join ``receivers`` channels to the group and collect one-way latencies (seconds)."""
+    channels = [await layer.new_channel() for _ in range(receivers)]
+    for channel in channels:
+        await layer.group_add(GROUP, channel)
+
+    async def drain(channel):
+        latencies = []
+        for _ in range(messages):
+            try:
+                message = await asyncio.wait_for(layer.receive(channel), timeout)
+            except asyncio.TimeoutError:
+                break
+            latencies.append(time.time() - message['sent'])
+        return latencies
+
+    return channels, drain
+
+
+def run_broker(path, capacity):
+    asyncio.run(ChannelBroker(path, capacity=capacity).serve())
+
+
+def run_worker(path, capacity, receivers, messages, timeout, results):
+    async def main():
+        layer = UnixSocketChannelLayer(path, capacity=capacity)
+        channels, drain = await join_receivers(layer, receivers, messages, timeout)
+        # Acknowledged, so the broker has handled our group_adds before it.
+        await layer.send('bench.ready', {'type': 'ready'})
+        latencies = await asyncio.gather(*(drain(channel) for channel in channels))
+        await layer.close()
+        return [latency for per_channel in latencies for latency in per_channel]
+
+    results.put(asyncio.run(main()))
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure group_send throughput and fan-out latency of the in-memory channel layer and of '
+        'UnixSocketChannelLayer with receivers spread over several worker processes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receivers', type=int, default=200, help='Channels in the group')
+        parser.add_argument('--messages', type=int, default=200, help='Messages sent to the group')
+        parser.add_argument('--workers', type=int, default=2, help='Processes the broker receivers are spread over')
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Milliseconds between sends; 0 sends in one burst, which measures queueing rather than latency',
+        )
+        parser.add_argument('--timeout', type=float, default=10)
+
+    def handle(self, *args, **options):
+        self.report('in-memory, 1 process', asyncio.run(self.bench_in_memory(options)), options)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'broker.sock')
+            self.report(f"broker, {options['workers']} processes", self.bench_broker(path, options), options)
+
+    async def bench_in_memory(self, options):
+        layer = InMemoryChannelLayer(capacity=options['messages'] + 1)
+        channels, drain = await join_receivers(layer, options['receivers'], options['messages'], options['timeout'])
+        receivers = [asyncio.create_task(drain(channel)) for channel in channels]
+        sending = await self.send_messages(layer, options)
+        latencies = [latency for per_channel in await asyncio.gather(*receivers) for latency in per_channel]
+        return sending, latencies, time.perf_counter()
+
+    def bench_broker(self, path, options):
+        context = multiprocessing.get_context('fork')
+        capacity = options['messages'] + 1
+        broker = context.Process(target=run_broker, args=(path, capacity), daemon=True)
+        broker.start()
+        try:
+            while not os.path.exists(path):
+                time.sleep(0.01)
+
+            results = context.Queue()
+            shares = [options['receivers'] // options['workers']] * options['workers']
+            shares[0] += options['receivers'] - sum(shares)
+            workers = [
+                context.Process(
+                    target=run_worker,
+                    args=(path, capacity, share, options['messages'], options['timeout'], results),
+                    daemon=True,
+                )
+                for share in shares
+            ]
+            for worker in workers:
+                worker.start()
+
+            async def send():
+                layer = UnixSocketChannelLayer(path, capacity=capacity)
+                for _ in workers:
+                    await layer.receive('bench.ready')
+                sending = await self.send_messages(layer, options)
+                await layer.close()
+                return sending
+
+            sending = asyncio.run(send())
+            latencies = [latency for _ in workers for latency in results.get(timeout=options['timeout'] * 10)]
+            finished = time.perf_counter()
+            for worker in workers:
+                worker.join()
+            return sending, latencies, finished
+        finally:
+            broker.terminate()
+            broker.join()
+
+    async def send_messages(self, layer, options):
+        started = time.perf_counter()
+        for _ in range(options['messages']):
+            await layer.group_send(GROUP, {'type': 'bench.message', 'sent': time.time()})
+            if options['interval']:
+                await asyncio.sleep(options['interval'] / 1000)
+        return started, time.perf_counter()
+
+    def report(self, label, result, options):
+        (started, sent), latencies, finished = result
+        expected = options['receivers'] * options['messages']
+        if not latencies:
+            self.stderr.write(f"{label}: no messages delivered")
+            return
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"{label:22} {options['messages'] / (sent - started):8.0f} group_send/s, "
+            f"{len(latencies) / (finished - started):8.0f} deliveries/s, "
+            f"fan-out latency p50 {quantiles[49] * 1000:.1f} ms, p99 {quantiles[98] * 1000:.1f} ms, "
+            f"{expected - len(latencies)} lost"
+        )
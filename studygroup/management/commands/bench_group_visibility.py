@@ -0,0 +1,104 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from studygroup.models import GroupMembership, StudyGroup, Subject
+from studygroup.visibility import invalidate, visible_groups
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the group listing query (OR + join + DISTINCT) with the cached visibility set, '
+        'on a throwaway test database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--groups', type=int, default=10_000)
+        parser.add_argument('--memberships', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=20_000)
+        parser.add_argument('--samples', type=int, default=20, help='Users whose listing is timed')
+        parser.add_argument('--page-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            users = self.populate(options)
+            self.compare(users, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def populate(self, options):
+        User = get_user_model()
+        rng = random.Random(0)
+        started = time.perf_counter()
+
+        User.objects.bulk_create(
+            (User(email=f'bench{i}@example.com', full_name=f'Bench {i}', password='!') for i in range(options['users'])),
+            batch_size=5000,
+        )
+        user_ids = list(User.objects.values_list('pk', flat=True))
+        subject = Subject.objects.create(name='Benchmark', code='BENCH')
+        StudyGroup.objects.bulk_create(
+            (
+                StudyGroup(
+                    name=f'Group {i}', description='', subject=subject, creator_id=rng.choice(user_ids),
+                    privacy=rng.choice(['PUBLIC', 'PRIVATE', 'RESTRICTED']),
+                )
+                for i in range(options['groups'])
+            ),
+            batch_size=5000,
+        )
+        group_ids = list(StudyGroup.objects.values_list('pk', flat=True))
+
+        per_user, extra = divmod(options['memberships'], len(user_ids))
+        batch = []
+        for index, user_id in enumerate(user_ids):
+            count = min(len(group_ids), per_user + (1 if index < extra else 0))
+            batch.extend(GroupMembership(user_id=user_id, group_id=group_id) for group_id in rng.sample(group_ids, count))
+            if len(batch) >= 20_000:
+                GroupMembership.objects.bulk_create(batch, batch_size=5000)
+                batch = []
+        GroupMembership.objects.bulk_create(batch, batch_size=5000)
+
+        self.stdout.write(
+            f"populated {len(user_ids)} users, {len(group_ids)} groups, "
+            f"{GroupMembership.objects.count()} memberships in {time.perf_counter() - started:.1f}s"
+        )
+        return rng.sample(list(User.objects.all()), min(options['samples'], len(user_ids)))
+
+    def compare(self, users, options):
+        page = options['page_size']
+
+        def join_distinct(user):
+            return StudyGroup.objects.filter(Q(privacy='PUBLIC') | Q(members=user)).distinct()
+
+        def visibility_set(user):
+            return visible_groups(StudyGroup.objects.all(), user)
+
+        for label, build, cold in (
+            ('OR + join + DISTINCT', join_distinct, False),
+            ('visibility set (cold cache)', visibility_set, True),
+            ('visibility set (warm cache)', visibility_set, False),
+        ):
+            timings = []
+            for user in users:
+                if cold:
+                    invalidate(user.pk)
+                started = time.perf_counter()
+                queryset = build(user).order_by('-created_at')
+                list(queryset.values_list('pk', flat=True)[:page])
+                queryset.count()
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{label:30} median {statistics.median(timings):8.2f} ms   "
+                f"max {max(timings):8.2f} ms   (page of {page} + count, {len(users)} users)"
+            )
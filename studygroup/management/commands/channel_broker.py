@@ -0,0 +1,37 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from studyBuddy.channel_layer import ChannelBroker, UnixSocketChannelLayer
+
+
+class Command(BaseCommand):
+    help = 'Run the local broker that UnixSocketChannelLayer workers on this host exchange messages through'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layer', default='default', help='Alias in CHANNEL_LAYERS to serve')
+        parser.add_argument('--socket', help='Override CONFIG["path"]')
+
+    def handle(self, *args, **options):
+        layer = getattr(settings, 'CHANNEL_LAYERS', {}).get(options['layer'])
+        if layer is None:
+            raise CommandError(f"CHANNEL_LAYERS has no {options['layer']!r} layer")
+        if not issubclass(import_string(layer['BACKEND']), UnixSocketChannelLayer):
+            raise CommandError(
+                f"The {options['layer']!r} layer uses {layer['BACKEND']}; set CHANNEL_BROKER_SOCKET to use the broker"
+            )
+
+        config = dict(layer.get('CONFIG', {}))
+        if options['socket']:
+            config['path'] = options['socket']
+        if 'path' not in config:
+            raise CommandError('The layer CONFIG has no "path"')
+
+        broker = ChannelBroker(**config)
+        self.stdout.write(f"Channel broker listening on {broker.path}")
+        try:
+            asyncio.run(broker.serve())
+        except KeyboardInterrupt:
+            pass
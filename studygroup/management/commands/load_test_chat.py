@@ -0,0 +1,139 @@
+import asyncio
+import json
+import time
+
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import InMemoryChannelLayer, channel_layers
+from channels.routing import URLRouter
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework_simplejwt.tokens import AccessToken
+
+from studygroup.messaging import chat_buffer
+from studygroup.models import GroupChat, GroupMembership, StudyGroup, Subject
+from studygroup.routing import websocket_urlpatterns
+
+
+class SimulatedClient(ApplicationCommunicator):
+    """A WebSocket client speaking ASGI directly to the consumer, without a server."""
+
+    def __init__(self, application, path, query_string):
+        super().__init__(application, {
+            'type': 'websocket', 'path': path, 'query_string': query_string.encode(),
+            'headers': [], 'subprotocols': [],
+        })
+
+    async def connect(self, timeout):
+        await self.send_input({'type': 'websocket.connect'})
+        response = await self.receive_output(timeout)
+        if response['type'] != 'websocket.accept':
+            return False
+        await self.receive_json(timeout)  # recent history
+        return True
+
+    async def send_json(self, content):
+        await self.send_input({'type': 'websocket.receive', 'text': json.dumps(content)})
+
+    async def receive_json(self, timeout):
+        response = await self.receive_output(timeout)
+        return json.loads(response['text'])
+
+    async def disconnect(self):
+        await self.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.wait(1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Connect many simulated WebSocket clients to group chats on a throwaway test database '
+        'and compare write-behind batching with one INSERT per message'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=300)
+        parser.add_argument('--groups', type=int, default=6)
+        parser.add_argument('--messages', type=int, default=5, help='Messages sent by each client')
+        parser.add_argument('--timeout', type=float, default=120)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        previous_layer = channel_layers.set('default', InMemoryChannelLayer(capacity=100_000))
+        try:
+            clients = self.populate(options)
+            for label, interval, max_batch in (
+                ('one INSERT per message', 0, 1),
+                ('write-behind buffer', chat_buffer.interval, chat_buffer.max_batch),
+            ):
+                asyncio.run(self.run_clients(label, clients, interval, max_batch, options))
+        finally:
+            channel_layers.set('default', previous_layer)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def populate(self, options):
+        User = get_user_model()
+        User.objects.bulk_create(
+            User(email=f'load{i}@example.com', full_name=f'Load {i}', password='!') for i in range(options['clients'])
+        )
+        users = list(User.objects.order_by('pk'))
+        subject = Subject.objects.create(name='Load test', code='LOAD')
+        StudyGroup.objects.bulk_create(
+            StudyGroup(name=f'Room {i}', description='', subject=subject, creator=users[0]) for i in range(options['groups'])
+        )
+        groups = list(StudyGroup.objects.values_list('pk', flat=True))
+        clients = [(user, groups[index % len(groups)]) for index, user in enumerate(users)]
+        GroupMembership.objects.bulk_create(GroupMembership(user=user, group_id=group_id) for user, group_id in clients)
+        return [(str(AccessToken.for_user(user)), group_id) for user, group_id in clients]
+
+    async def run_clients(self, label, clients, interval, max_batch, options):
+        original = chat_buffer.interval, chat_buffer.max_batch, chat_buffer.persist
+        batches = []
+
+        def counting_persist(chats):
+            batches.append(len(chats))
+            return original[2](chats)
+
+        chat_buffer.interval, chat_buffer.max_batch, chat_buffer.persist = interval, max_batch, counting_persist
+        application = URLRouter(websocket_urlpatterns)
+        sockets = [
+            SimulatedClient(application, f'/ws/chat/{group_id}/', f'token={token}') for token, group_id in clients
+        ]
+        rows_before = await asyncio.to_thread(GroupChat.objects.count)
+        try:
+            connected = await asyncio.gather(*(socket.connect(timeout=options['timeout']) for socket in sockets))
+            if not all(connected):
+                self.stderr.write(f"{label}: {connected.count(False)} clients were refused")
+                return
+
+            per_group = {}
+            for _, group_id in clients:
+                per_group[group_id] = per_group.get(group_id, 0) + options['messages']
+
+            started = time.perf_counter()
+
+            async def client(socket, group_id, index):
+                for n in range(options['messages']):
+                    await socket.send_json({'message': f'client {index} message {n}'})
+                for _ in range(per_group[group_id]):
+                    await socket.receive_json(options['timeout'])
+
+            await asyncio.gather(*(
+                client(socket, group_id, index) for index, (socket, (_, group_id)) in enumerate(zip(sockets, clients))
+            ))
+            elapsed = time.perf_counter() - started
+        finally:
+            await asyncio.gather(*(socket.disconnect() for socket in sockets), return_exceptions=True)
+            chat_buffer.interval, chat_buffer.max_batch, chat_buffer.persist = original
+
+        sent = len(clients) * options['messages']
+        stored = await asyncio.to_thread(GroupChat.objects.count) - rows_before
+        delivered = sum(per_group[group_id] for _, group_id in clients)
+        self.stdout.write(
+            f"{label:24} {len(clients)} clients: {sent} messages in {elapsed:.2f}s "
+            f"({sent / elapsed:.0f} msg/s, {delivered / elapsed:.0f} deliveries/s), "
+            f"{len(batches)} INSERT batches, {stored} rows stored"
+        )
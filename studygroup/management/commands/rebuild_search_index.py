@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from studygroup.models import GroupChat, StudyGroup
+from studygroup.search import chat_index, group_index, index_chats, index_groups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the study group and chat message full-text search indexes from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument(
+            '--index', choices=['groups', 'chats'], action='append',
+            help='Only rebuild this index (may be repeated); default: all',
+        )
+
+    def handle(self, *args, **options):
+        indexes = {
+            'groups': (group_index, index_groups, StudyGroup.objects.select_related('subject')),
+            'chats': (chat_index, index_chats, GroupChat.objects.only('pk', 'group_id', 'message')),
+        }
+        for name in options['index'] or indexes:
+            index, index_objects, queryset = indexes[name]
+            self.rebuild(name, index, index_objects, queryset.order_by('pk'), options['chunk_size'])
+
+    def rebuild(self, name, index, index_objects, queryset, chunk_size):
+        started = time.monotonic()
+        with transaction.atomic():
+            index.clear()
+            batch = []
+            for obj in queryset.iterator(chunk_size=chunk_size):
+                batch.append(obj)
+                if len(batch) >= chunk_size:
+                    index_objects(batch)
+                    batch = []
+            index_objects(batch)
+        backend = 'FTS5' if index.uses_fts() else 'posting tables'
+        self.stdout.write(f"indexed {queryset.count()} {name} ({backend}) in {time.monotonic() - started:.2f}s")
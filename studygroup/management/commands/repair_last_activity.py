@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from studygroup.models import StudyGroup
+
+
+class Command(BaseCommand):
+    help = 'Recompute StudyGroup.last_activity_at from group updates, chat messages and sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Groups checked per batch')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        checked = repaired = 0
+        last_pk = 0
+        while True:
+            chunk = list(
+                StudyGroup.objects.filter(pk__gt=last_pk).order_by('pk')
+                .with_computed_last_activity()
+                .values_list('pk', 'last_activity_at', 'computed_last_activity')[:options['chunk_size']]
+            )
+            if not chunk:
+                break
+            for pk, stored, computed in chunk:
+                if stored != computed:
+                    # Only overwrite the value we read, so a concurrent bump wins.
+                    repaired += StudyGroup.objects.filter(pk=pk, last_activity_at=stored).update(
+                        last_activity_at=computed
+                    )
+            checked += len(chunk)
+            last_pk = chunk[-1][0]
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"checked {checked} groups, repaired {repaired} in {elapsed:.2f}s")
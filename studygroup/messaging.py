@@ -0,0 +1,215 @@
+import asyncio
+import logging
+from collections import defaultdict, deque
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import prefetch_related_objects
+
+from .models import GroupChat, StudyGroup
+from .recent import recent_messages
+from .search import index_chats
+from .serializers import GroupChatSerializer
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'CHAT_WRITE_BUFFER', {})
+
+
+class BufferFull(Exception):
+    pass
+
+
+def group_channel_name(group_id):
+    return f'chat-group-{group_id}'
+
+
+def message_payload(chat):
+    """
+    ``GroupChatSerializer`` output for ``chat`` without a request, so media
+    URLs are relative; see ``recent.absolutize()``.
+    """
+    return GroupChatSerializer(chat).data
+
+
+def publish_messages(chats):
+    """Add committed ``chats`` to ``recent_messages``; returns their payloads."""
+    payloads = [message_payload(chat) for chat in chats]
+    by_group = defaultdict(list)
+    for payload in payloads:
+        by_group[payload['group']].append(payload)
+    for group_id, group_payloads in by_group.items():
+        recent_messages.publish(group_id, group_payloads)
+    return payloads
+
+
+def recent_history(group_id, limit):
+    """
+    Payloads of the newest ``limit`` messages of a group, newest first,
+    from ``recent_messages`` or, for a cold group, the database.
+    """
+    messages = recent_messages.get(group_id, limit)
+    if messages is None:
+        version = recent_messages.version(group_id)
+        chats = list(
+            GroupChat.objects.filter(group_id=group_id)
+            .select_related('user').prefetch_related('attachments').with_reply_stats()
+            .order_by('-created_at', '-pk')[:recent_messages.per_group]
+        )
+        payloads = [message_payload(chat) for chat in reversed(chats)]
+        recent_messages.fill(group_id, version, payloads, complete=len(chats) < recent_messages.per_group)
+        messages = payloads[::-1][:limit]
+    return messages
+
+
+def persist_messages(chats):
+    """
+    Insert ``chats`` with one ``bulk_create`` and apply what the skipped
+    ``post_save`` handlers would have: the messages are added to the
+    search index, each group's ``last_activity_at`` is bumped once and
+    the messages are published to ``recent_messages``.
+    Returns the message payloads.
+    """
+    close_old_connections()
+    with transaction.atomic():
+        GroupChat.objects.bulk_create(chats)
+        if any(chat.pk is None for chat in chats):
+            _fetch_pks(chats)
+        index_chats(chats)
+        latest = defaultdict(lambda: None)
+        for chat in chats:
+            if latest[chat.group_id] is None or chat.created_at > latest[chat.group_id]:
+                latest[chat.group_id] = chat.created_at
+        for group_id, when in latest.items():
+            StudyGroup.objects.filter(pk=group_id).bump_last_activity(when)
+    prefetch_related_objects(chats, 'attachments')
+    return publish_messages(chats)
+
+
+def _fetch_pks(chats):
+    # Not every backend returns primary keys from a bulk insert. Read them
+    # back by what identifies a message; identical messages (same group,
+    # author, text and microsecond) are interchangeable.
+    rows = GroupChat.objects.filter(
+        group_id__in={chat.group_id for chat in chats},
+        created_at__in={chat.created_at for chat in chats},
+    ).order_by('pk').values_list('pk', 'group_id', 'user_id', 'created_at', 'message')
+    pks = defaultdict(deque)
+    for pk, *key in rows:
+        pks[tuple(key)].append(pk)
+    for chat in chats:
+        chat.pk = pks[(chat.group_id, chat.user_id, chat.created_at, chat.message)].popleft()
+
+
+class ChatWriteBuffer:
+    """
+    Write-behind buffer for chat messages received over WebSockets.
+
+    Messages are queued in memory and written with one ``bulk_create``
+    once ``max_batch`` are waiting or ``interval`` seconds after the first
+    one arrived, whichever comes first. Only after the batch is committed
+    is each message broadcast to its group, so clients never see a message
+    that is not stored and every broadcast carries the real id.
+
+    If a batch fails to write, its messages are written one by one so that
+    a bad message does not hold back the rest. Messages that still fail
+    are retried with the next flush, and dropped (and logged) after
+    ``max_attempts``. Once ``max_pending`` messages are queued, ``add()``
+    raises ``BufferFull``.
+    """
+
+    def __init__(self, interval, max_batch, max_pending, max_attempts=5, persist=persist_messages):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.persist = persist
+        # [chat, failed attempts] pairs, oldest first.
+        self._pending = []
+        self._loop = None
+        self._timer = None
+        self._lock = None
+
+    def _bind(self):
+        # Locks and timers belong to one event loop; start afresh if the
+        # loop changed (e.g. between test cases).
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._timer = None
+            self._lock = asyncio.Lock()
+
+    async def add(self, chat):
+        self._bind()
+        if len(self._pending) >= self.max_pending:
+            raise BufferFull()
+        self._pending.append([chat, 0])
+        if len(self._pending) >= self.max_batch:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = self._loop.call_later(self.interval, self._flush_soon)
+
+    def _flush_soon(self):
+        self._timer = None
+        self._loop.create_task(self.flush())
+
+    async def flush(self):
+        self._bind()
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            while self._pending:
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+                failed = await self._write(batch)
+                if len(batch) > 1 and failed:
+                    logger.warning("Persisting %d chat messages failed; writing them one by one", len(batch))
+                    failed = [entry for entry in batch if await self._write([entry])]
+                retry = []
+                for entry in failed:
+                    entry[1] += 1
+                    if entry[1] < self.max_attempts:
+                        retry.append(entry)
+                    else:
+                        chat = entry[0]
+                        logger.error(
+                            "Dropping chat message from user %s in group %s after %d failed attempts: %r",
+                            chat.user_id, chat.group_id, entry[1], chat.message,
+                        )
+                if retry:
+                    self._pending[:0] = retry
+                    self._timer = self._loop.call_later(max(self.interval, 1), self._flush_soon)
+                    return
+
+    async def _write(self, batch):
+        """Persist and broadcast ``batch``; returns it if persisting failed, else []."""
+        chats = [chat for chat, _ in batch]
+        try:
+            payloads = await sync_to_async(self.persist, thread_sensitive=False)(chats)
+        except Exception:
+            logger.exception("Persisting %d chat messages failed", len(chats))
+            for chat in chats:
+                # Undo what the rolled-back insert set, so it can be retried.
+                chat.pk = None
+                chat._state.adding = True
+            return batch
+        await self.broadcast(payloads)
+        return []
+
+    async def broadcast(self, payloads):
+        channel_layer = get_channel_layer()
+        for payload in payloads:
+            await channel_layer.group_send(group_channel_name(payload['group']), {
+                'type': 'chat.message',
+                'message': payload,
+            })
+
+
+chat_buffer = ChatWriteBuffer(
+    interval=_config.get('FLUSH_INTERVAL_MS', 50) / 1000,
+    max_batch=_config.get('MAX_BATCH', 200),
+    max_pending=_config.get('MAX_PENDING', 10000),
+    max_attempts=_config.get('MAX_ATTEMPTS', 5),
+)
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studygroup', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studygroup',
+            name='avatar_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Storage names of the resized avatar images', verbose_name='avatar renditions'),
+        ),
+    ]
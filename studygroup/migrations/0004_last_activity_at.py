@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-17 01:55
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def populate_last_activity(apps, schema_editor):
+    StudyGroup = apps.get_model('studygroup', 'StudyGroup')
+    Session = apps.get_model('studygroup', 'Session')
+    GroupChat = apps.get_model('studygroup', 'GroupChat')
+
+    latest_session = Session.objects.filter(group=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+    latest_chat = GroupChat.objects.filter(group=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+    StudyGroup.objects.update(last_activity_at=Greatest(
+        'updated_at',
+        Coalesce(Subquery(latest_session), 'updated_at'),
+        Coalesce(Subquery(latest_chat), 'updated_at'),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studygroup', '0003_avatar_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studygroup',
+            name='last_activity_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False, help_text='Latest group update, chat message or session change', verbose_name='last activity at'),
+        ),
+        migrations.RunPython(populate_last_activity, migrations.RunPython.noop),
+    ]
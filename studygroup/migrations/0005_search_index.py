@@ -0,0 +1,75 @@
+# Generated by Django 5.1.6 on 2026-10-17 02:01
+
+from django.db import OperationalError, migrations, models
+
+
+def create_fts_table(apps, schema_editor):
+    # SQLite with FTS5 uses a virtual table; other databases (or SQLite
+    # builds without FTS5) use the SearchPosting/SearchDocument tables, and
+    # existing groups are indexed there by ``manage.py rebuild_search_index``.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts_studygroup USING fts5("
+                "scope UNINDEXED, name, subject, description, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            cursor.execute(
+                "INSERT INTO search_fts_studygroup (rowid, scope, name, subject, description) "
+                "SELECT g.id, 0, g.name, s.name, g.description FROM studygroup_studygroup g "
+                "JOIN studygroup_subject s ON s.id = g.subject_id"
+            )
+    except OperationalError as exc:
+        # This SQLite build lacks FTS5.
+        if 'no such module: fts5' not in str(exc):
+            raise
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS search_fts_studygroup")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studygroup', '0004_last_activity_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.CharField(max_length=30, verbose_name='index')),
+                ('scope', models.BigIntegerField(default=0, verbose_name='scope')),
+                ('object_id', models.BigIntegerField(verbose_name='object id')),
+                ('length', models.PositiveIntegerField(default=0, verbose_name='length')),
+            ],
+            options={
+                'verbose_name': 'search document',
+                'verbose_name_plural': 'search documents',
+                'indexes': [models.Index(fields=['index', 'scope'], name='studygroup__index_93a247_idx')],
+                'constraints': [models.UniqueConstraint(fields=('index', 'object_id'), name='unique_search_document')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.CharField(max_length=30, verbose_name='index')),
+                ('scope', models.BigIntegerField(default=0, verbose_name='scope')),
+                ('term', models.CharField(max_length=64, verbose_name='term')),
+                ('object_id', models.BigIntegerField(verbose_name='object id')),
+                ('frequency', models.PositiveIntegerField(verbose_name='frequency')),
+            ],
+            options={
+                'verbose_name': 'search posting',
+                'verbose_name_plural': 'search postings',
+                'indexes': [models.Index(fields=['index', 'scope', 'term'], name='studygroup__index_d1dad4_idx'), models.Index(fields=['index', 'object_id'], name='studygroup__index_aa63fc_idx')],
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
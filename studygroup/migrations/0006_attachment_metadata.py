@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-17 02:08
+
+import mimetypes
+
+from django.db import migrations, models
+
+FILE_EXTENSIONS = {
+    'DOCUMENT': ['pdf', 'doc', 'docx', 'txt'],
+    'IMAGE': ['jpg', 'jpeg', 'png', 'gif'],
+    'AUDIO': ['mp3'],
+    'VIDEO': ['mp4'],
+}
+
+
+def populate_metadata(apps, schema_editor):
+    ChatAttachment = apps.get_model('studygroup', 'ChatAttachment')
+    for attachment in ChatAttachment.objects.iterator(chunk_size=500):
+        try:
+            attachment.size = attachment.file.size
+        except OSError:
+            attachment.size = 0
+        attachment.mime_type = mimetypes.guess_type(attachment.file.name)[0] or 'application/octet-stream'
+        if not attachment.file_type:
+            extension = attachment.file.name.rsplit('.', 1)[-1].lower()
+            attachment.file_type = next(
+                (file_type for file_type, extensions in FILE_EXTENSIONS.items() if extension in extensions), 'OTHER'
+            )
+        attachment.save(update_fields=['size', 'mime_type', 'file_type'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studygroup', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatattachment',
+            name='mime_type',
+            field=models.CharField(blank=True, editable=False, help_text='MIME type derived from the file extension', max_length=100, verbose_name='MIME type'),
+        ),
+        migrations.AddField(
+            model_name='chatattachment',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0, editable=False, help_text='File size in bytes, recorded at upload', verbose_name='size'),
+        ),
+        migrations.RunPython(populate_metadata, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studygroup', '0006_attachment_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupmembership',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, help_text='Creation time of the newest group chat message the user has read', null=True, verbose_name='last read at'),
+        ),
+    ]
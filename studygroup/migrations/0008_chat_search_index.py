@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-17 09:12
+
+from django.db import OperationalError, migrations
+
+
+def create_fts_table(apps, schema_editor):
+    # As in 0005: only SQLite with FTS5 gets the virtual table. Elsewhere
+    # the index lives in SearchPosting/SearchDocument and existing messages
+    # are indexed by ``manage.py rebuild_search_index``.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        with schema_editor.connection.cursor() as cursor:
+            # scope (the group id) is indexed so that a search in one group
+            # does not visit matches in every other group.
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts_groupchat USING fts5("
+                "scope, message, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            cursor.execute(
+                "INSERT INTO search_fts_groupchat (rowid, scope, message) "
+                "SELECT id, group_id, message FROM studygroup_groupchat"
+            )
+    except OperationalError as exc:
+        # This SQLite build lacks FTS5.
+        if 'no such module: fts5' not in str(exc):
+            raise
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS search_fts_groupchat")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studygroup', '0007_membership_last_read'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-17 02:28
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_updated_at(apps, schema_editor):
+    # Existing sessions were last changed no later than their creation as
+    # far as anyone knows; without this, repair_last_activity would move
+    # every group with a session to the time of this migration.
+    Session = apps.get_model('studygroup', 'Session')
+    Session.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studygroup', '0008_chat_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='When the session was last updated', verbose_name='updated at'),
+        ),
+        migrations.RunPython(populate_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['group', 'start_time'], name='studygroup__group_i_c10011_idx'),
+        ),
+    ]
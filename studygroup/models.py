@@ -1,26 +1,70 @@
+import mimetypes
+
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Count
+from django.db.models import Count, Max
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Greatest
+from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
 from django.utils import timezone
 
 User = get_user_model()
 
 
-class StudyGroupManager(models.Manager):
+class StudyGroupQuerySet(models.QuerySet):
     def annotate_member_count(self):
-        return self.annotate(member_count=Count('members'))
-
-    def with_last_activity(self):
+        active = GroupMembership.objects.filter(
+            group=models.OuterRef('pk'), is_active=True
+        ).order_by().values('group').annotate(count=Count('pk')).values('count')
+        return self.annotate(member_count=Coalesce(models.Subquery(active), 0))
+
+    def bump_last_activity(self, when):
+        """
+        Move ``last_activity_at`` forward to ``when``. The condition keeps
+        it monotonic when writes race or arrive out of order.
+        """
+        return self.filter(last_activity_at__lt=when).update(last_activity_at=when)
+
+    def with_computed_last_activity(self):
+        """Annotate ``computed_last_activity`` from the underlying rows; used for repair."""
+        latest_session = Session.objects.filter(
+            group=models.OuterRef('pk')
+        ).order_by('-updated_at').values('updated_at')[:1]
+        latest_chat = GroupChat.objects.filter(
+            group=models.OuterRef('pk')
+        ).order_by('-created_at').values('created_at')[:1]
         return self.annotate(
-            last_activity=models.Subquery(
-                Session.objects.filter(
-                    group=models.OuterRef('pk')
-                ).order_by('-start_time').values('start_time')[:1]
+            computed_last_activity=Greatest(
+                'updated_at',
+                Coalesce(models.Subquery(latest_session), 'updated_at'),
+                Coalesce(models.Subquery(latest_chat), 'updated_at'),
             )
         )
 
+    def with_user_membership(self, user):
+        """
+        Prefetch ``user``'s membership of each group into
+        ``user_memberships`` (a list of zero or one items), so serializers
+        can answer is_member/membership without a query per group.
+        """
+        if not user.is_authenticated:
+            return self
+        return self.prefetch_related(models.Prefetch(
+            'memberships_set',
+            queryset=GroupMembership.objects.filter(user=user).select_related('user'),
+            to_attr='user_memberships',
+        ))
+
+    def for_listing(self, user):
+        """Everything ``StudyGroupSerializer`` reads, in a fixed number of queries."""
+        return self.select_related('subject', 'creator').annotate_member_count() \
+                   .with_user_membership(user)
+
+
+StudyGroupManager = models.Manager.from_queryset(StudyGroupQuerySet)
+
 class Subject(models.Model):
     name = models.CharField(_('name'), max_length=100, unique=True)
     code = models.CharField(_('code'), max_length=10, unique=True)
@@ -53,9 +97,11 @@ class StudyGroup(models.Model):
     creator = models.ForeignKey(User, on_delete=models.PROTECT, related_name='created_groups', verbose_name=_('creator'), help_text=_('User who created this group'))
     members = models.ManyToManyField(User, through='GroupMembership', related_name='study_groups_set', verbose_name=_('members'), help_text=_('Users who are members of this group'))
     avatar = models.ImageField(_('avatar'), upload_to='group_avatars/%Y/%m/%d/', null=True, blank=True, help_text=_('Group profile picture'))
+    avatar_renditions = models.JSONField(_('avatar renditions'), default=dict, blank=True, editable=False, help_text=_('Storage names of the resized avatar images'))
     privacy = models.CharField(_('privacy'), max_length=10, choices=PRIVACY_CHOICES, default='PUBLIC', help_text=_('Visibility and join permissions for the group'))
     created_at = models.DateTimeField(_('created at'), auto_now_add=True, help_text=_('When the group was created'))
     updated_at = models.DateTimeField(_('updated at'), auto_now=True, help_text=_('Last time the group was updated'))
+    last_activity_at = models.DateTimeField(_('last activity at'), default=timezone.now, editable=False, db_index=True, help_text=_('Latest group update, chat message or session change'))
 
     objects = StudyGroupManager()
 
@@ -74,21 +120,19 @@ class StudyGroup(models.Model):
     @property
     def member_count(self):
         """Return the number of active members in the group."""
-        return self.memberships.filter(is_active=True).count()
+        if hasattr(self, '_member_count'):
+            return self._member_count
+        return self.memberships_set.filter(is_active=True).count()
+
+    @member_count.setter
+    def member_count(self, value):
+        # Set by StudyGroupQuerySet.annotate_member_count().
+        self._member_count = value
 
     @property
     def last_activity(self):
         """Return the timestamp of the last activity in the group."""
-        last_session = self.sessions.order_by('-start_time').first()
-        last_chat = self.chats.order_by('-created_at').first()
-
-        dates = [self.updated_at]
-        if last_session:
-            dates.append(last_session.start_time)
-        if last_chat:
-            dates.append(last_chat.created_at)
-
-        return max(dates) if dates else self.created_at
+        return self.last_activity_at
 
 class GroupMembership(models.Model):
     ROLE_CHOICES = [
@@ -102,6 +146,7 @@ class GroupMembership(models.Model):
     role = models.CharField(_('role'), max_length=10, choices=ROLE_CHOICES, default='MEMBER', help_text=_('Role of the user in the group'))
     joined_at = models.DateTimeField(_('joined at'), auto_now_add=True, help_text=_('When the user joined the group'))
     is_active = models.BooleanField(_('is active'), default=True, help_text=_('Whether the membership is currently active'))
+    last_read_at = models.DateTimeField(_('last read at'), null=True, blank=True, help_text=_('Creation time of the newest group chat message the user has read'))
 
     class Meta:
         verbose_name = _('group membership')
@@ -137,6 +182,7 @@ class Session(models.Model):
     is_virtual = models.BooleanField(_('is virtual'), default=False, help_text=_('Whether this is a virtual session'))
     meeting_link = models.URLField(_('meeting link'), blank=True, help_text=_('Link for virtual sessions'))
     created_at = models.DateTimeField(_('created at'), auto_now_add=True, help_text=_('When the session was created'))
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True, help_text=_('When the session was last updated'))
 
     class Meta:
         verbose_name = _('session')
@@ -144,6 +190,7 @@ class Session(models.Model):
         ordering = ['-start_time']
         indexes = [
             models.Index(fields=['start_time']),
+            models.Index(fields=['group', 'start_time']),
             models.Index(fields=['status']),
         ]
 
@@ -165,6 +212,45 @@ class Session(models.Model):
             )
 
 
+class GroupChatQuerySet(models.QuerySet):
+    def with_reply_stats(self):
+        """
+        Annotate ``reply_count`` and ``last_reply_at`` with one subquery
+        each; only replies in the message's own group count.
+        """
+        replies = GroupChat.objects.filter(
+            parent=models.OuterRef('pk'), group=models.OuterRef('group'),
+        ).order_by().values('parent')
+        return self.annotate(
+            reply_count=Coalesce(models.Subquery(replies.annotate(count=Count('pk')).values('count')), 0),
+            last_reply_at=models.Subquery(replies.annotate(latest=Max('created_at')).values('latest')),
+        )
+
+    def thread(self, root_id, group_id, max_depth, limit):
+        """
+        The message ``root_id`` of group ``group_id`` and its replies in
+        that group, at most ``max_depth`` levels down and ``limit`` messages in all
+        (shallowest first), found by one recursive CTE over ``parent``.
+        """
+        table = self.model._meta.db_table
+        return self.filter(pk__in=RawSQL(
+            f"""
+            WITH RECURSIVE thread(id, depth) AS (
+                SELECT id, 0 FROM {table} WHERE id = %s AND group_id = %s
+                UNION ALL
+                SELECT reply.id, thread.depth + 1
+                FROM {table} reply JOIN thread ON reply.parent_id = thread.id
+                WHERE thread.depth < %s AND reply.group_id = %s
+            )
+            SELECT id FROM thread ORDER BY depth LIMIT %s
+            """,
+            [root_id, group_id, max_depth, group_id, limit],
+        ))
+
+
+GroupChatManager = models.Manager.from_queryset(GroupChatQuerySet)
+
+
 class GroupChat(models.Model):
     group = models.ForeignKey(StudyGroup, on_delete=models.CASCADE, related_name='chats', verbose_name=_('group'), help_text=_('Group this chat belongs to'))
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='group_chats', verbose_name=_('user'), help_text=_('User who sent the message'))
@@ -173,6 +259,8 @@ class GroupChat(models.Model):
     updated_at = models.DateTimeField(_('updated at'), auto_now=True, help_text=_('When the message was last updated'))
     parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='replies', verbose_name=_('parent message'), help_text=_('Original message this is replying to'))
 
+    objects = GroupChatManager()
+
     class Meta:
         verbose_name = _('group chat')
         verbose_name_plural = _('group chats')
@@ -194,9 +282,18 @@ class ChatAttachment(models.Model):
         ('OTHER', _('Other')),
     ]
 
+    FILE_EXTENSIONS = {
+        'DOCUMENT': ['pdf', 'doc', 'docx', 'txt'],
+        'IMAGE': ['jpg', 'jpeg', 'png', 'gif'],
+        'AUDIO': ['mp3'],
+        'VIDEO': ['mp4'],
+    }
+
     chat = models.ForeignKey(GroupChat, on_delete=models.CASCADE, related_name='attachments', verbose_name=_('chat'), help_text=_('Chat message this attachment belongs to'))
     file = models.FileField(_('file'), upload_to='chat_attachments/%Y/%m/%d/', help_text=_('Uploaded file attachment'), validators=[FileExtensionValidator(allowed_extensions=['pdf', 'doc', 'docx', 'jpg', 'jpeg', 'png', 'gif', 'mp3', 'mp4', 'txt'])])
     file_type = models.CharField(_('file type'), max_length=10, choices=FILE_TYPES, help_text=_('Type of the attached file'))
+    size = models.PositiveBigIntegerField(_('size'), editable=False, default=0, help_text=_('File size in bytes, recorded at upload'))
+    mime_type = models.CharField(_('MIME type'), max_length=100, blank=True, editable=False, help_text=_('MIME type derived from the file extension'))
     uploaded_at = models.DateTimeField(_('uploaded at'), auto_now_add=True, help_text=_('When the file was uploaded'))
 
     class Meta:
@@ -205,7 +302,23 @@ class ChatAttachment(models.Model):
         ordering = ['-uploaded_at']
 
     def __str__(self):
-        return f"Attachment for chat {self.chat.id}"
+        return f"Attachment for chat {self.chat_id}"
+
+    def save(self, *args, **kwargs):
+        if self.file and not self.pk:  # New instance with file
+            self.size = self.file.size
+            self.mime_type = mimetypes.guess_type(self.file.name)[0] or 'application/octet-stream'
+            if not self.file_type:
+                self.file_type = self.determine_file_type()
+        super().save(*args, **kwargs)
+
+    def determine_file_type(self):
+        """Detect the file type from the file extension"""
+        extension = self.file.name.rsplit('.', 1)[-1].lower()
+        for file_type, extensions in self.FILE_EXTENSIONS.items():
+            if extension in extensions:
+                return file_type
+        return 'OTHER'
 
     @property
     def filename(self):
@@ -213,4 +326,41 @@ class ChatAttachment(models.Model):
 
     @property
     def filesize(self):
-        return self.file.size
+        return self.size
+
+
+class SearchDocument(models.Model):
+    """Per-document length for the portable search index (see ``studygroup.search``)."""
+
+    index = models.CharField(_('index'), max_length=30)
+    scope = models.BigIntegerField(_('scope'), default=0)
+    object_id = models.BigIntegerField(_('object id'))
+    length = models.PositiveIntegerField(_('length'), default=0)
+
+    class Meta:
+        verbose_name = _('search document')
+        verbose_name_plural = _('search documents')
+        constraints = [
+            models.UniqueConstraint(fields=['index', 'object_id'], name='unique_search_document'),
+        ]
+        indexes = [
+            models.Index(fields=['index', 'scope']),
+        ]
+
+
+class SearchPosting(models.Model):
+    """Inverted-index entry: ``term`` occurs in ``object_id`` with a weighted frequency."""
+
+    index = models.CharField(_('index'), max_length=30)
+    scope = models.BigIntegerField(_('scope'), default=0)
+    term = models.CharField(_('term'), max_length=64)
+    object_id = models.BigIntegerField(_('object id'))
+    frequency = models.PositiveIntegerField(_('frequency'))
+
+    class Meta:
+        verbose_name = _('search posting')
+        verbose_name_plural = _('search postings')
+        indexes = [
+            models.Index(fields=['index', 'scope', 'term']),
+            models.Index(fields=['index', 'object_id']),
+        ]
@@ -12,7 +12,7 @@ class IsGroupMemberOrPublic(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return obj.members.filter(id=request.user.id).exists()
         
-        return obj.creator == request.user or obj.memberships.filter(
+        return obj.creator == request.user or obj.memberships_set.filter(
             user=request.user, 
             role__in=['ADMIN', 'MODERATOR']
         ).exists()
\ No newline at end of file
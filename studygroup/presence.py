@@ -0,0 +1,155 @@
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils import timezone
+
+from users.activity import last_active_buffer
+
+_config = getattr(settings, 'PRESENCE', {})
+
+
+class TimerWheel:
+    """
+    Expires keys between ``ttl`` and ``ttl + tick`` seconds after they were
+    last touched.
+
+    Keys sit in one of ``ttl / tick + 2`` slots; touching moves a key to the
+    slot that expires last. There is no timer per key: the wheel turns
+    lazily, by however many ticks have passed, whenever it is used, and
+    each turn expires one whole slot. Touching and expiring a key are O(1).
+    """
+
+    def __init__(self, ttl, tick, on_expire, clock=time.monotonic):
+        self.tick = tick
+        self.size = math.ceil(ttl / tick) + 2
+        self.slots = [set() for _ in range(self.size)]
+        self.slot_of = {}
+        self.on_expire = on_expire
+        self.clock = clock
+        self.turned = int(clock() / tick)
+
+    def touch(self, key):
+        self.advance()
+        slot = (self.turned + self.size - 1) % self.size
+        current = self.slot_of.get(key)
+        if current != slot:
+            if current is not None:
+                self.slots[current].discard(key)
+            self.slots[slot].add(key)
+            self.slot_of[key] = slot
+
+    def discard(self, key):
+        slot = self.slot_of.pop(key, None)
+        if slot is not None:
+            self.slots[slot].discard(key)
+
+    def advance(self):
+        now = int(self.clock() / self.tick)
+        for turned in range(self.turned + 1, min(now, self.turned + self.size) + 1):
+            slot = self.slots[turned % self.size]
+            expired = list(slot)
+            slot.clear()
+            for key in expired:
+                del self.slot_of[key]
+                self.on_expire(key)
+        self.turned = max(self.turned, now)
+
+
+class Presence:
+    """
+    Who is online in which study group, kept in process memory.
+
+    A user is online in a group from a WebSocket connection or heartbeat,
+    or an HTTP ping, until ``ttl`` seconds pass without another one, or
+    until their last socket in the group closes. Lookups are a set read
+    per group. ``last_active`` is written through ``last_active_buffer``,
+    at most once per ``resolution`` seconds per user.
+
+    Online sets are per worker process and are not shared through the
+    channel layer: with several workers, each one only knows the users
+    whose sockets and pings it served, so counts are partial unless the
+    chat sockets and presence endpoints are routed to a single worker.
+    """
+
+    def __init__(self, ttl, tick, resolution):
+        self.ttl = ttl
+        self.resolution = resolution
+        self.groups = defaultdict(set)
+        self.user_groups = defaultdict(set)
+        self.sockets = defaultdict(int)
+        self.recorded = {}
+        self.wheel = TimerWheel(ttl, tick, self._expire)
+        self._lock = threading.Lock()
+
+    def touch(self, user_id, group_ids):
+        now = time.monotonic()
+        with self._lock:
+            for group_id in group_ids:
+                self.wheel.touch((user_id, group_id))
+                self.groups[group_id].add(user_id)
+                self.user_groups[user_id].add(group_id)
+            record = now - self.recorded.get(user_id, -math.inf) >= self.resolution
+            if record:
+                self.recorded[user_id] = now
+        if record:
+            last_active_buffer.add(user_id, timezone.now())
+
+    def connect(self, user_id, group_id):
+        with self._lock:
+            self.sockets[(user_id, group_id)] += 1
+        self.touch(user_id, [group_id])
+
+    def disconnect(self, user_id, group_id):
+        key = (user_id, group_id)
+        with self._lock:
+            self.sockets[key] -= 1
+            if self.sockets[key] > 0:
+                return
+            del self.sockets[key]
+            self.wheel.discard(key)
+            self._leave(user_id, group_id)
+
+    def online(self, group_id):
+        """Ids of the users online in a group."""
+        with self._lock:
+            self.wheel.advance()
+            return set(self.groups.get(group_id, ()))
+
+    def counts(self, group_ids):
+        with self._lock:
+            self.wheel.advance()
+            return {group_id: len(self.groups.get(group_id, ())) for group_id in group_ids}
+
+    def clear(self):
+        with self._lock:
+            self.groups.clear()
+            self.user_groups.clear()
+            self.sockets.clear()
+            self.recorded.clear()
+            self.wheel = TimerWheel(self.ttl, self.wheel.tick, self._expire)
+
+    def _expire(self, key):
+        self._leave(*key)
+
+    def _leave(self, user_id, group_id):
+        members = self.groups.get(group_id)
+        if members is not None:
+            members.discard(user_id)
+            if not members:
+                del self.groups[group_id]
+        groups = self.user_groups.get(user_id)
+        if groups is not None:
+            groups.discard(group_id)
+            if not groups:
+                del self.user_groups[user_id]
+                self.recorded.pop(user_id, None)
+
+
+presence = Presence(
+    ttl=_config.get('TTL', 60),
+    tick=_config.get('TICK', 5),
+    resolution=_config.get('LAST_ACTIVE_RESOLUTION', 60),
+)
@@ -0,0 +1,181 @@
+import json
+import random
+import threading
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+from users.caching import invalidation_timeout
+
+_config = getattr(settings, 'CHAT_RECENT_MESSAGES', {})
+
+
+class _Ring:
+    __slots__ = ('version', 'messages', 'size', 'complete')
+
+    def __init__(self, version, maxlen, complete):
+        self.version = version
+        self.messages = deque(maxlen=maxlen)
+        self.size = 0
+        # True while the ring holds the group's entire history, so that an
+        # empty or short ring is still an answer.
+        self.complete = complete
+
+
+class RecentMessages:
+    """
+    The last ``per_group`` serialized messages of each active group, kept
+    in process memory and evicted least-recently-used across groups once
+    they take more than ``max_bytes``.
+
+    Each group has a counter in the default cache that every write bumps. A
+    ring is only served while its version is the current one, so a message
+    stored by another worker, an edit or a delete makes it reload. The
+    worker that bumps the counter from the ring's version appends its own
+    messages instead of dropping the ring. Other workers' bumps only arrive
+    through a shared cache; otherwise counters expire after
+    ``PROCESS_LOCAL_CACHE_TIMEOUT`` seconds, and the re-minted version makes
+    every ring reload.
+
+    Payloads hold relative media URLs; ``absolutize()`` them when serving.
+    """
+
+    def __init__(self, per_group, max_bytes):
+        self.per_group = per_group
+        self.max_bytes = max_bytes
+        self._rings = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.timeout = invalidation_timeout(None)
+
+    def key(self, group_id):
+        return f'chat-recent:{group_id}'
+
+    def version(self, group_id):
+        version = cache.get(self.key(group_id))
+        if version is None:
+            # Start at a random number so that a ring from before the
+            # counter was evicted cannot match the new one.
+            cache.add(self.key(group_id), random.getrandbits(48), timeout=self.timeout)
+            version = cache.get(self.key(group_id))
+        return version
+
+    def _bump(self, group_id):
+        try:
+            return cache.incr(self.key(group_id))
+        except ValueError:
+            self.version(group_id)
+            return cache.incr(self.key(group_id))
+
+    def get(self, group_id, limit):
+        """Up to ``limit`` payloads, newest first, or None if not cached."""
+        version = self.version(group_id)
+        with self._lock:
+            ring = self._rings.get(group_id)
+            if ring is None or ring.version != version:
+                return None
+            if limit > len(ring.messages) and not ring.complete:
+                return None
+            self._rings.move_to_end(group_id)
+            return [message for message, _ in reversed(ring.messages)][:limit]
+
+    def fill(self, group_id, version, payloads, complete):
+        """Cache payloads (oldest first) read from the database at ``version``."""
+        ring = _Ring(version, self.per_group, complete)
+        with self._lock:
+            self._drop(group_id)
+            self._rings[group_id] = ring
+            self._extend(ring, payloads)
+            self._evict()
+
+    def publish(self, group_id, payloads):
+        """Record newly stored messages (oldest first)."""
+        version = self._bump(group_id)
+        with self._lock:
+            ring = self._rings.get(group_id)
+            if ring is None:
+                return
+            if ring.version != version - 1:
+                self._drop(group_id)
+                return
+            newest = ring.messages[-1][0]['id'] if ring.messages else 0
+            ring.version = version
+            payloads = [payload for payload in payloads if payload['id'] > newest]
+            self._count_replies(ring, payloads)
+            self._extend(ring, payloads)
+            self._rings.move_to_end(group_id)
+            self._evict()
+
+    def invalidate(self, group_id):
+        """Call after a message or one of its attachments changed or was deleted."""
+        self._bump(group_id)
+        with self._lock:
+            self._drop(group_id)
+
+    def clear(self):
+        with self._lock:
+            self._rings.clear()
+            self._size = 0
+
+    def _extend(self, ring, payloads):
+        for payload in payloads:
+            if len(ring.messages) == ring.messages.maxlen:
+                _, size = ring.messages[0]
+                ring.size -= size
+                self._size -= size
+                ring.complete = False
+            size = len(json.dumps(payload, separators=(',', ':')))
+            ring.messages.append((payload, size))
+            ring.size += size
+            self._size += size
+
+    def _count_replies(self, ring, replies):
+        # Cached parents carry reply_count/last_reply_at; replace them with
+        # updated copies, since readers may hold the old dicts.
+        positions = {message['id']: index for index, (message, _) in enumerate(ring.messages)}
+        for reply in replies:
+            index = positions.get(reply['parent'])
+            if index is None:
+                continue
+            parent, size = ring.messages[index]
+            ring.messages[index] = ({
+                **parent,
+                'reply_count': parent['reply_count'] + 1,
+                'last_reply_at': reply['created_at'],
+            }, size)
+
+    def _drop(self, group_id):
+        ring = self._rings.pop(group_id, None)
+        if ring is not None:
+            self._size -= ring.size
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._rings) > 1:
+            _, ring = self._rings.popitem(last=False)
+            self._size -= ring.size
+
+
+def absolutize(payload, base_url):
+    """A copy of ``payload`` with its media URLs made absolute against ``base_url``."""
+    def absolute(url):
+        return base_url.rstrip('/') + url if url and url.startswith('/') else url
+
+    user = dict(payload['user'])
+    user['avatar'] = absolute(user.get('avatar'))
+    if user.get('avatar_renditions'):
+        user['avatar_renditions'] = {
+            size: {extension: absolute(url) for extension, url in urls.items()}
+            for size, urls in user['avatar_renditions'].items()
+        }
+    attachments = [
+        {**attachment, 'file': absolute(attachment['file']), 'file_url': absolute(attachment['file'])}
+        for attachment in payload['attachments']
+    ]
+    return {**payload, 'user': user, 'attachments': attachments}
+
+
+recent_messages = RecentMessages(
+    per_group=_config.get('PER_GROUP', 100),
+    max_bytes=_config.get('MAX_BYTES', 32 * 1024 * 1024),
+)
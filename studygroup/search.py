@@ -0,0 +1,252 @@
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.expressions import RawSQL
+
+from users.caching import TTLCache
+from .models import SearchDocument, SearchPosting
+
+MAX_RESULTS = getattr(settings, 'SEARCH_MAX_RESULTS', 500)
+MAX_QUERY_TERMS = 8
+TERM_LENGTH = SearchPosting._meta.get_field('term').max_length
+
+# BM25 parameters, the same defaults SQLite's FTS5 uses.
+K1 = 1.2
+B = 0.75
+
+_word = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lowercase words with diacritics removed, as FTS5's unicode61 tokenizer does."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [word[:TERM_LENGTH] for word in _word.findall(text.lower())]
+
+
+class SearchIndex:
+    """
+    A named full-text index over some model's text fields.
+
+    On SQLite the index is an FTS5 virtual table (created by the migration
+    that introduces the index) and ranking is FTS5's ``bm25()``. On other
+    databases it falls back to ``SearchPosting``/``SearchDocument`` rows,
+    scored with BM25 in Python. Either way every query term is a prefix
+    match and all terms must match.
+
+    ``fields`` maps field names to BM25 weights. ``scope`` partitions the
+    index (e.g. by group); searches only see documents of one scope. With
+    ``scope_indexed`` the FTS5 table indexes the scope column too, so that
+    a search in one scope of a large index intersects posting lists rather
+    than visiting every match in every scope.
+    """
+
+    def __init__(self, name, fields, scope_indexed=False):
+        self.name = name
+        self.fields = fields
+        self.scope_indexed = scope_indexed
+        self.table = f'search_fts_{name}'
+        self._fts = None
+        self._stats = TTLCache(maxsize=1024, ttl=60)
+
+    def uses_fts(self):
+        if self._fts is None:
+            self._fts = connection.vendor == 'sqlite' and self.table in connection.introspection.table_names()
+        return self._fts
+
+    # -- writes ------------------------------------------------------------
+
+    def update(self, object_id, values, scope=0):
+        """(Re)index one document; ``values`` maps field names to text."""
+        self.update_many([(object_id, scope, values)])
+
+    def update_many(self, documents):
+        documents = list(documents)
+        if not documents:
+            return
+        with transaction.atomic():
+            self.remove([object_id for object_id, _, _ in documents])
+            if self.uses_fts():
+                self._fts_insert(documents)
+            else:
+                self._postings_insert(documents)
+
+    def remove(self, object_ids):
+        object_ids = list(object_ids)
+        if not object_ids:
+            return
+        if self.uses_fts():
+            with connection.cursor() as cursor:
+                placeholders = ', '.join(['%s'] * len(object_ids))
+                cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({placeholders})", object_ids)
+        else:
+            SearchPosting.objects.filter(index=self.name, object_id__in=object_ids).delete()
+            SearchDocument.objects.filter(index=self.name, object_id__in=object_ids).delete()
+
+    def clear(self):
+        if self.uses_fts():
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {self.table}")
+        else:
+            SearchPosting.objects.filter(index=self.name).delete()
+            SearchDocument.objects.filter(index=self.name).delete()
+        self._stats.clear()
+
+    def _fts_insert(self, documents):
+        columns = ', '.join(['rowid', 'scope', *self.fields])
+        placeholders = ', '.join(['%s'] * (len(self.fields) + 2))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} ({columns}) VALUES ({placeholders})",
+                [
+                    [object_id, scope, *(values.get(field) or '' for field in self.fields)]
+                    for object_id, scope, values in documents
+                ],
+            )
+
+    def _postings_insert(self, documents):
+        postings, lengths = [], []
+        for object_id, scope, values in documents:
+            frequencies = Counter()
+            for field, weight in self.fields.items():
+                for term in tokenize(values.get(field)):
+                    frequencies[term] += weight
+            lengths.append(SearchDocument(
+                index=self.name, scope=scope, object_id=object_id, length=sum(frequencies.values())
+            ))
+            postings.extend(
+                SearchPosting(index=self.name, scope=scope, term=term, object_id=object_id, frequency=frequency)
+                for term, frequency in frequencies.items()
+            )
+        SearchDocument.objects.bulk_create(lengths, batch_size=1000)
+        SearchPosting.objects.bulk_create(postings, batch_size=1000)
+
+    # -- queries -----------------------------------------------------------
+
+    def search(self, query, scope=0, limit=MAX_RESULTS, newest=False, offset=0):
+        """
+        Ids of matching documents in ``scope``, best match first or, with
+        ``newest``, highest id first, skipping the first ``offset``.
+        """
+        terms = self._terms(query)
+        if not terms:
+            return []
+        if self.uses_fts():
+            return self._fts_search(terms, scope, limit, newest, offset)
+        return self._postings_search(terms, scope, limit, newest, offset)
+
+    def matching(self, query, scope=0):
+        """
+        An unranked subquery of the ids of every match in ``scope``, for
+        ``pk__in``, so that the database can order and page the matches.
+        """
+        terms = self._terms(query)
+        if not terms:
+            return SearchPosting.objects.none().values('object_id')
+        if self.uses_fts():
+            return RawSQL(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s AND scope = %s",
+                [self._fts_match(terms, scope), scope],
+            )
+        postings = SearchPosting.objects.filter(index=self.name, scope=scope)
+        matches = None
+        for term in terms:
+            rows = postings.filter(term__gte=term, term__lt=term + '\U0010ffff')
+            if matches is not None:
+                rows = rows.filter(object_id__in=matches)
+            matches = rows.values('object_id')
+        return matches
+
+    def _terms(self, query):
+        return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+    def _fts_match(self, terms, scope):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        if self.scope_indexed:
+            match = f'scope : "{int(scope)}" {match}'
+        return match
+
+    def _fts_search(self, terms, scope, limit, newest, offset):
+        if newest:
+            # FTS5 walks its posting lists in rowid order, so this stops
+            # after ``offset + limit`` matches instead of ranking all of them.
+            order = 'rowid DESC'
+        else:
+            weights = ', '.join(['0', *(str(weight) for weight in self.fields.values())])
+            order = f'bm25({self.table}, {weights})'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s AND scope = %s "
+                f"ORDER BY {order} LIMIT %s OFFSET %s",
+                [self._fts_match(terms, scope), scope, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _collection_stats(self, scope):
+        stats = self._stats.get(scope)
+        if stats is None:
+            totals = SearchDocument.objects.filter(index=self.name, scope=scope).aggregate(
+                count=Count('pk'), length=Sum('length')
+            )
+            count = totals['count']
+            stats = (count, (totals['length'] or 0) / count if count else 0.0)
+            self._stats.set(scope, stats)
+        return stats
+
+    def _postings_search(self, terms, scope, limit, newest, offset):
+        document_count, average_length = self._collection_stats(scope)
+        postings = SearchPosting.objects.filter(index=self.name, scope=scope)
+
+        matches = []
+        for term in terms:
+            frequencies = defaultdict(int)
+            rows = postings.filter(term__gte=term, term__lt=term + '\U0010ffff').values_list('object_id', 'frequency')
+            for object_id, frequency in rows:
+                frequencies[object_id] += frequency
+            if not frequencies:
+                return []
+            matches.append(frequencies)
+
+        candidates = set.intersection(*(set(frequencies) for frequencies in matches))
+        if not candidates:
+            return []
+        if newest:
+            return sorted(candidates, reverse=True)[offset:offset + limit]
+        lengths = dict(
+            SearchDocument.objects.filter(index=self.name, object_id__in=candidates).values_list('object_id', 'length')
+        )
+
+        document_count = max(document_count, len(candidates))
+        average_length = average_length or 1.0
+        scores = dict.fromkeys(candidates, 0.0)
+        for frequencies in matches:
+            idf = math.log(1 + (document_count - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+            for object_id in candidates:
+                tf = frequencies[object_id]
+                norm = 1 - B + B * lengths.get(object_id, average_length) / average_length
+                scores[object_id] += idf * tf * (K1 + 1) / (tf + K1 * norm)
+        return sorted(candidates, key=lambda object_id: (-scores[object_id], object_id))[offset:offset + limit]
+
+
+group_index = SearchIndex('studygroup', {'name': 10, 'subject': 5, 'description': 1})
+
+
+def group_document(group):
+    return {'name': group.name, 'subject': group.subject.name, 'description': group.description}
+
+
+def index_groups(groups):
+    group_index.update_many((group.pk, 0, group_document(group)) for group in groups)
+
+
+chat_index = SearchIndex('groupchat', {'message': 1}, scope_indexed=True)
+
+
+def index_chats(chats):
+    """(Re)index chat messages, each in the scope of its group."""
+    chat_index.update_many((chat.pk, chat.group_id, {'message': chat.message}) for chat in chats)
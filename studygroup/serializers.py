@@ -1,22 +1,30 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from .models import (
     Subject, StudyGroup, GroupMembership,
     Session, GroupChat, ChatAttachment
 )
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from users.avatars import rendition_urls, sanitize_image
 
 User = get_user_model()
 
 
 class UserSerializer(serializers.ModelSerializer):
+    avatar_renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields = ['id', 'full_name', 'email', 'avatar']
+        fields = ['id', 'full_name', 'email', 'avatar', 'avatar_renditions']
         extra_kwargs = {
             'password': {'write_only': True}
         }
 
+    def get_avatar_renditions(self, obj):
+        return rendition_urls(obj, self.context.get('request'))
+
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
@@ -45,30 +53,41 @@ class StudyGroupSerializer(serializers.ModelSerializer):
     subject = SubjectSerializer(read_only=True)
     creator = UserSerializer(read_only=True)
     member_count = serializers.IntegerField(read_only=True)
-    last_activity = serializers.DateTimeField(read_only=True)
+    last_activity = serializers.DateTimeField(source='last_activity_at', read_only=True)
     is_member = serializers.SerializerMethodField()
     membership = serializers.SerializerMethodField()
+    avatar_renditions = serializers.SerializerMethodField()
     
     class Meta:
         model = StudyGroup
         fields = [
             'id', 'name', 'description', 'subject', 'creator',
-            'avatar', 'privacy', 'created_at', 'updated_at',
+            'avatar', 'avatar_renditions', 'privacy', 'created_at', 'updated_at',
             'member_count', 'last_activity', 'is_member', 'membership'
         ]
+
+    def validate_avatar(self, value):
+        return sanitize_image(value) if value else value
+
+    def get_avatar_renditions(self, obj):
+        return rendition_urls(obj, self.context.get('request'))
     
-    def get_is_member(self, obj):
+    def _user_membership(self, obj):
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.members.filter(id=request.user.id).exists()
-        return False
+        if not (request and request.user.is_authenticated):
+            return None
+        if hasattr(obj, 'user_memberships'):
+            # Prefetched by StudyGroupQuerySet.with_user_membership().
+            return obj.user_memberships[0] if obj.user_memberships else None
+        return obj.memberships_set.filter(user=request.user).select_related('user').first()
+
+    def get_is_member(self, obj):
+        return self._user_membership(obj) is not None
     
     def get_membership(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            membership = obj.memberships.filter(user=request.user).first()
-            if membership:
-                return GroupMembershipSerializer(membership).data
+        membership = self._user_membership(obj)
+        if membership:
+            return GroupMembershipSerializer(membership, context=self.context).data
         return None
 
 
@@ -98,7 +117,7 @@ class SessionSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'group', 'title', 'description', 'start_time', 'end_time',
             'location', 'created_by', 'status', 'max_attendees', 'is_virtual',
-            'meeting_link', 'created_at', 'duration'
+            'meeting_link', 'created_at', 'updated_at', 'duration'
         ]
     
     def get_duration(self, obj):
@@ -107,21 +126,18 @@ class SessionSerializer(serializers.ModelSerializer):
 
 class ChatAttachmentSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
-    file_size = serializers.SerializerMethodField()
+    file_size = serializers.IntegerField(source='size', read_only=True)
     
     class Meta:
         model = ChatAttachment
-        fields = ['id', 'file', 'file_url', 'file_size', 'file_type', 'uploaded_at']
-        read_only_fields = ['file_type', 'uploaded_at']
+        fields = ['id', 'file', 'file_url', 'file_size', 'mime_type', 'file_type', 'uploaded_at']
+        read_only_fields = ['file_type', 'mime_type', 'uploaded_at']
     
     def get_file_url(self, obj):
         request = self.context.get('request')
         if obj.file and request:
             return request.build_absolute_uri(obj.file.url)
         return None
-    
-    def get_file_size(self, obj):
-        return obj.file.size
 
 
 class GroupChatSerializer(serializers.ModelSerializer):
@@ -129,21 +145,45 @@ class GroupChatSerializer(serializers.ModelSerializer):
     group = serializers.PrimaryKeyRelatedField(queryset=StudyGroup.objects.all())
     attachments = ChatAttachmentSerializer(many=True, read_only=True)
     parent = serializers.PrimaryKeyRelatedField(queryset=GroupChat.objects.all(), required=False, allow_null=True)
+    # Annotated by GroupChatQuerySet.with_reply_stats(); new messages have no replies.
+    reply_count = serializers.IntegerField(read_only=True, default=0)
+    last_reply_at = serializers.DateTimeField(read_only=True, default=None)
     
     class Meta:
         model = GroupChat
         fields = [
             'id', 'group', 'user', 'message', 'created_at', 
-            'updated_at', 'attachments', 'parent'
+            'updated_at', 'attachments', 'parent', 'reply_count', 'last_reply_at'
         ]
         read_only_fields = ['user', 'created_at', 'updated_at']
+
+    def validate(self, data):
+        request = self.context.get('request')
+        file_field = ChatAttachment._meta.get_field('file')
+        for attachment in request.FILES.getlist('attachments') if request else []:
+            try:
+                file_field.run_validators(attachment)
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError({'attachments': exc.messages})
+        parent = data.get('parent')
+        if parent is not None and parent.group_id != self.get_group_id(data):
+            raise serializers.ValidationError({'parent': 'Parent message not found in this group.'})
+        return data
+
+    def get_group_id(self, data):
+        # Views under /groups/<group_id>/ save the message to that group,
+        # whatever group the request body names.
+        group_id = getattr(self.context.get('view'), 'kwargs', {}).get('group_id')
+        if group_id is not None:
+            return group_id
+        group = data.get('group') or getattr(self.instance, 'group', None)
+        return group.pk if group is not None else None
     
+    @transaction.atomic
     def create(self, validated_data):
         attachments_data = self.context.get('request').FILES
-        chat = GroupChat.objects.create(
-            user=self.context['request'].user,
-            **validated_data
-        )
+        validated_data.setdefault('user', self.context['request'].user)
+        chat = GroupChat.objects.create(**validated_data)
         
         for attachment in attachments_data.getlist('attachments'):
             ChatAttachment.objects.create(
@@ -152,3 +192,43 @@ class GroupChatSerializer(serializers.ModelSerializer):
             )
         
         return chat
+
+
+class PresencePingSerializer(serializers.Serializer):
+    groups = serializers.ListField(
+        child=serializers.IntegerField(), required=False,
+        help_text='Member groups to be online in; all of them when omitted',
+    )
+    ttl = serializers.IntegerField(read_only=True, help_text='Seconds until the next ping is due')
+
+
+class GroupOnlineSerializer(serializers.Serializer):
+    group = serializers.IntegerField()
+    count = serializers.IntegerField()
+    users = serializers.ListField(child=serializers.IntegerField())
+
+
+class OnlineCountsSerializer(serializers.Serializer):
+    counts = serializers.DictField(child=serializers.IntegerField(), help_text='Members online, by group id')
+
+
+class MarkReadSerializer(serializers.Serializer):
+    chat = serializers.IntegerField(
+        write_only=True, required=False, help_text='Message read up to; now when omitted',
+    )
+    group = serializers.IntegerField(read_only=True)
+    last_read_at = serializers.DateTimeField(read_only=True)
+
+
+class UnreadCountSerializer(serializers.Serializer):
+    group = serializers.IntegerField()
+    unread = serializers.IntegerField(help_text='Capped at 100')
+    label = serializers.CharField(help_text='Badge text, e.g. "3" or "99+"')
+
+
+class UnreadCountsSerializer(serializers.Serializer):
+    results = UnreadCountSerializer(many=True)
+
+
+class CalendarFeedURLSerializer(serializers.Serializer):
+    url = serializers.URLField(help_text='Private iCal feed URL; revoked by logging out everywhere')
@@ -1,6 +1,15 @@
-from django.db.models.signals import post_save
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from .models import StudyGroup, GroupMembership
+from users.avatars import schedule_renditions
+from .models import StudyGroup, GroupMembership, GroupChat, ChatAttachment, Session, Subject
+from . import visibility
+from .messaging import publish_messages
+from .recent import recent_messages
+from .search import chat_index, group_index, index_chats, index_groups
+
+User = get_user_model()
 
 @receiver(post_save, sender=StudyGroup)
 def add_creator_as_admin(sender, instance, created, **kwargs):
@@ -9,4 +18,107 @@ def add_creator_as_admin(sender, instance, created, **kwargs):
             user=instance.creator,
             group=instance,
             role='ADMIN'
-        )
\ No newline at end of file
+        )
+
+
+@receiver(post_save, sender=StudyGroup)
+def build_avatar_renditions(sender, instance, **kwargs):
+    schedule_renditions(instance)
+
+
+@receiver(post_save, sender=StudyGroup)
+def bump_activity_on_group_update(sender, instance, created, **kwargs):
+    if not created:
+        StudyGroup.objects.filter(pk=instance.pk).bump_last_activity(instance.updated_at)
+
+
+@receiver(post_save, sender=GroupChat)
+def bump_activity_on_chat(sender, instance, created, **kwargs):
+    if created:
+        StudyGroup.objects.filter(pk=instance.group_id).bump_last_activity(instance.created_at)
+
+
+@receiver(post_save, sender=Session)
+def bump_activity_on_session(sender, instance, **kwargs):
+    StudyGroup.objects.filter(pk=instance.group_id).bump_last_activity(instance.updated_at)
+
+
+@receiver(post_save, sender=GroupMembership)
+@receiver(post_delete, sender=GroupMembership)
+def invalidate_member_groups(sender, instance, **kwargs):
+    visibility.invalidate(instance.user_id)
+
+
+@receiver(m2m_changed, sender=StudyGroup.members.through)
+def invalidate_member_groups_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            visibility.invalidate(instance.pk)
+    elif action == 'pre_clear':
+        instance._cleared_member_ids = list(instance.memberships_set.values_list('user_id', flat=True))
+    elif action == 'post_clear':
+        for user_id in getattr(instance, '_cleared_member_ids', ()):
+            visibility.invalidate(user_id)
+    elif action in ('post_add', 'post_remove'):
+        for user_id in pk_set or ():
+            visibility.invalidate(user_id)
+
+
+@receiver(post_save, sender=StudyGroup)
+def index_group(sender, instance, **kwargs):
+    index_groups([instance])
+
+
+@receiver(post_delete, sender=StudyGroup)
+def unindex_group(sender, instance, **kwargs):
+    group_index.remove([instance.pk])
+
+
+@receiver(post_save, sender=Subject)
+def reindex_subject_groups(sender, instance, created, **kwargs):
+    if not created:
+        index_groups(instance.study_groups.select_related('subject').iterator(chunk_size=500))
+
+
+@receiver(post_save, sender=GroupChat)
+def index_chat(sender, instance, **kwargs):
+    index_chats([instance])
+
+
+@receiver(post_delete, sender=GroupChat)
+def unindex_chat(sender, instance, **kwargs):
+    chat_index.remove([instance.pk])
+
+
+@receiver(post_save, sender=GroupChat)
+def publish_recent_chat(sender, instance, created, **kwargs):
+    # On commit, so that attachments saved in the same transaction are included.
+    if created:
+        transaction.on_commit(lambda: publish_messages([instance]))
+    else:
+        transaction.on_commit(lambda: recent_messages.invalidate(instance.group_id))
+
+
+@receiver(post_delete, sender=GroupChat)
+def forget_recent_chat(sender, instance, **kwargs):
+    recent_messages.invalidate(instance.group_id)
+
+
+@receiver(post_save, sender=ChatAttachment)
+@receiver(post_delete, sender=ChatAttachment)
+def forget_recent_attachment(sender, instance, created=False, **kwargs):
+    # New attachments are saved with their message, before it is published.
+    if created:
+        return
+    group_id = GroupChat.objects.filter(pk=instance.chat_id).values_list('group_id', flat=True).first()
+    if group_id is not None:
+        recent_messages.invalidate(group_id)
+
+
+@receiver(post_save, sender=User)
+def forget_recent_sender(sender, instance, created, update_fields=None, **kwargs):
+    # Cached messages embed the sender's name and avatar.
+    if created or (update_fields is not None and not {'full_name', 'email', 'avatar'} & set(update_fields)):
+        return
+    for group_id in visibility.member_group_ids(instance.pk):
+        recent_messages.invalidate(group_id)
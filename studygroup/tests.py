@@ -1,3 +1,978 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.exceptions import ChannelFull
+from channels.routing import URLRouter
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from resource.models import Resource, StudyGroup as ResourceGroup
+from studyBuddy.channel_layer import ChannelBroker, UnixSocketChannelLayer, _encode, _messages_frame, _read_frame
+from studyBuddy.pagination import KeysetPagination
+from users.tokens import revoke_all_tokens
+from . import visibility
+from .messaging import ChatWriteBuffer, persist_messages
+from .models import ChatAttachment, GroupChat, GroupMembership, Session, StudyGroup, Subject
+from .presence import TimerWheel, presence
+from .recent import recent_messages
+from .routing import websocket_urlpatterns
+from .search import chat_index, group_index, index_groups
+from .unread import read_pointer_buffer, unread_counts
+
+User = get_user_model()
+
+
+class StudyGroupListQueryCountTests(TestCase):
+    """List endpoints must not issue queries per group."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        cls.other = User.objects.create_user(email='other@example.com', full_name='Other', password='pw-123456')
+        cls.subject = Subject.objects.create(name='Mathematics', code='MATH')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_groups(self, count):
+        groups = []
+        for i in range(count):
+            group = StudyGroup.objects.create(
+                name=f'Group {i}', description='d', subject=self.subject, creator=self.other
+            )
+            if i % 2 == 0:
+                GroupMembership.objects.create(user=self.user, group=group)
+            groups.append(group)
+        return groups
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()['results']
+
+    def test_group_list_query_count_is_independent_of_page_size(self):
+        url = reverse('study-group-list-create')
+        self.create_groups(2)
+        small, _ = self.count_queries(url)
+        self.create_groups(48)
+        large, data = self.count_queries(url)
+
+        self.assertEqual(len(data), 50)
+        self.assertEqual(small, large)
+        member_of = {group['id'] for group in data if group['is_member']}
+        self.assertEqual(member_of, set(self.user.study_groups_set.values_list('pk', flat=True)))
+        for group in data:
+            self.assertEqual(group['membership'] is not None, group['is_member'])
+
+    def test_my_groups_query_count_is_independent_of_page_size(self):
+        url = reverse('my-study-groups')
+        self.create_groups(2)
+        small, _ = self.count_queries(url)
+        self.create_groups(98)
+        large, data = self.count_queries(url)
+
+        self.assertEqual(len(data), 50)
+        self.assertEqual(small, large)
+        self.assertTrue(all(group['is_member'] and group['membership']['role'] == 'MEMBER' for group in data))
+        self.assertTrue(all(group['member_count'] == 2 for group in data))
+
+    def test_resource_list_nested_groups_query_count(self):
+        url = reverse('resource-list-create')
+        groups = [ResourceGroup.objects.create(name=f'Shared {i}') for i in range(10)]
+        groups[0].members.add(self.user)
+
+        def add_resources(count):
+            # bulk_create skips Resource.save(), which would stat the file.
+            resources = Resource.objects.bulk_create(
+                Resource(title=f'R{i}', file='resources/r.pdf', uploaded_by=self.user) for i in range(count)
+            )
+            for resource in resources:
+                resource.groups.set(groups)
+
+        add_resources(1)
+        small, _ = self.count_queries(url)
+        add_resources(9)
+        large, data = self.count_queries(url)
+
+        self.assertEqual(len(data), 10)
+        self.assertEqual(small, large)
+        self.assertEqual([group['is_member'] for group in data[0]['groups']], [True] + [False] * 9)
+
+
+class LastActivityTests(TestCase):
+    """The signals and the repair command agree on what moves last_activity_at."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        cls.subject = Subject.objects.create(name='Mathematics', code='MATH')
+
+    def setUp(self):
+        self.group = StudyGroup.objects.create(name='Group', description='d', subject=self.subject, creator=self.user)
+
+    def last_activity(self):
+        return StudyGroup.objects.values_list('last_activity_at', flat=True).get(pk=self.group.pk)
+
+    def repair(self):
+        out = io.StringIO()
+        call_command('repair_last_activity', stdout=out)
+        return out.getvalue()
+
+    def test_chat_session_and_group_edits_bump(self):
+        chat = GroupChat.objects.create(group=self.group, user=self.user, message='hi')
+        self.assertEqual(self.last_activity(), chat.created_at)
+
+        session = Session.objects.create(group=self.group, title='S', start_time=timezone.now(), created_by=self.user)
+        self.assertEqual(self.last_activity(), session.updated_at)
+        session.title = 'Renamed'
+        session.save()
+        self.assertEqual(self.last_activity(), session.updated_at)
+
+        self.group.description = 'changed'
+        self.group.save()
+        self.assertEqual(self.last_activity(), self.group.updated_at)
+
+    def test_bump_never_moves_backwards(self):
+        latest = timezone.now() + timedelta(hours=1)
+        groups = StudyGroup.objects.filter(pk=self.group.pk)
+        self.assertEqual(groups.bump_last_activity(latest), 1)
+        self.assertEqual(groups.bump_last_activity(latest - timedelta(minutes=5)), 0)
+        self.assertEqual(self.last_activity(), latest)
+
+    def test_repair_matches_the_signals(self):
+        session = Session.objects.create(group=self.group, title='S', start_time=timezone.now(), created_by=self.user)
+        session.title = 'Renamed'
+        session.save()
+        bumped = self.last_activity()
+        self.assertIn('checked 1 groups, repaired 0', self.repair())
+
+        StudyGroup.objects.filter(pk=self.group.pk).update(last_activity_at=timezone.now() - timedelta(days=30))
+        self.assertIn('checked 1 groups, repaired 1', self.repair())
+        self.assertEqual(self.last_activity(), bumped)
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursors walk both ways through ties, reject tampering and fall back to offsets."""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(email='owner@example.com', full_name='Owner', password='pw-123456')
+        subjects = [Subject.objects.create(name=name, code=name[:4].upper()) for name in ('Biology', 'Algebra')]
+        cls.groups = [
+            StudyGroup.objects.create(name=f'Group {i}', description='d', subject=subjects[i % 2], creator=owner)
+            for i in range(5)
+        ]
+        # Every group ties on the ordering key; the primary key breaks the tie.
+        StudyGroup.objects.update(last_activity_at=timezone.now())
+        cls.newest_first = [group.pk for group in reversed(cls.groups)]
+
+    def paginate(self, queryset, **params):
+        paginator = KeysetPagination()
+        request = Request(APIRequestFactory().get('/groups/', {'page_size': 2, **params}))
+        rows = paginator.paginate_queryset(queryset, request)
+        return [row.pk for row in rows], paginator
+
+    def walk(self, queryset):
+        pages, params = [], {}
+        while True:
+            ids, paginator = self.paginate(queryset, **params)
+            pages.append(ids)
+            if not paginator.get_next_link():
+                return pages, paginator
+            params = {'after': paginator.last_cursor}
+
+    def test_after_and_before_cursors_through_ties(self):
+        queryset = StudyGroup.objects.order_by('-last_activity_at')
+        pages, last = self.walk(queryset)
+        self.assertEqual(pages, [self.newest_first[:2], self.newest_first[2:4], self.newest_first[4:]])
+
+        ids, paginator = self.paginate(queryset, before=last.first_cursor)
+        self.assertEqual(ids, self.newest_first[2:4])
+        self.assertIsNotNone(paginator.get_next_link())
+        ids, paginator = self.paginate(queryset, before=paginator.first_cursor)
+        self.assertEqual(ids, self.newest_first[:2])
+        self.assertIsNone(paginator.get_previous_link())
+
+    def test_tampered_cursor_is_not_found(self):
+        queryset = StudyGroup.objects.order_by('-last_activity_at')
+        encode = KeysetPagination().encode_cursor
+        for cursor in ('not base64!', encode([1]), encode(['not a date', 1]), encode({'o': 2})):
+            with self.subTest(cursor=cursor), self.assertRaises(NotFound):
+                self.paginate(queryset, after=cursor)
+        with self.assertRaises(NotFound):
+            self.paginate(queryset, after=encode(['2026-01-01T00:00:00+00:00', 1]), before=encode(['2026-01-01T00:00:00+00:00', 1]))
+
+    def test_unsafe_ordering_falls_back_to_offsets(self):
+        queryset = StudyGroup.objects.order_by('subject__name', 'pk')
+        ids, paginator = self.paginate(queryset)
+        self.assertIsNone(paginator.ordering)
+        self.assertEqual(paginator.decode_cursor(paginator.last_cursor), {'o': 2})
+
+        pages, _ = self.walk(queryset)
+        expected = list(queryset.values_list('pk', flat=True))
+        self.assertEqual(sum(pages, []), expected)
+        with self.assertRaises(NotFound):
+            self.paginate(queryset, after=paginator.encode_cursor({'o': -1}))
+
+
+class GroupVisibilityCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        creator = User.objects.create_user(email='creator@example.com', full_name='Creator', password='pw-123456')
+        subject = Subject.objects.create(name='Mathematics', code='MATH')
+        self.group = StudyGroup.objects.create(
+            name='Private', description='d', subject=subject, creator=creator, privacy='PRIVATE'
+        )
+
+    def test_ids_cached_before_commit_are_dropped(self):
+        self.assertEqual(visibility.member_group_ids(self.user.pk), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            GroupMembership.objects.create(user=self.user, group=self.group)
+            # A listing on another worker read the memberships before the
+            # commit and cached them under the fresh stamp.
+            stamp = visibility._versions.get(self.user.pk)
+            cache.set(visibility._key(self.user.pk), (stamp, []))
+        self.assertEqual(visibility.member_group_ids(self.user.pk), [self.group.pk])
+
+    def test_timeout_is_bounded_without_a_shared_cache(self):
+        self.assertLessEqual(visibility.CACHE_TIMEOUT, 5)
+
+
+class GroupChatListQueryCountTests(TestCase):
+    """Chat pages render from prefetched rows without touching file storage."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        subject = Subject.objects.create(name='Mathematics', code='MATH')
+        cls.group = StudyGroup.objects.create(name='Group', description='d', subject=subject, creator=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('group-chat-list-create', kwargs={'group_id': self.group.pk}) + '?page_size=100'
+
+    def add_messages(self, count):
+        authors = [
+            User.objects.create_user(email=f'author{GroupChat.objects.count()}-{i}@example.com', full_name='A', password='pw-123456')
+            for i in range(3)
+        ]
+        chats = GroupChat.objects.bulk_create(
+            GroupChat(group=self.group, user=authors[i % 3], message=f'message {i}') for i in range(count)
+        )
+        # bulk_create skips ChatAttachment.save(), which would read the upload.
+        ChatAttachment.objects.bulk_create(
+            ChatAttachment(chat=chat, file=f'chat_attachments/{chat.pk}.pdf', file_type='DOCUMENT', size=1024, mime_type='application/pdf')
+            for chat in chats for _ in range(2)
+        )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx, \
+                mock.patch.object(FileSystemStorage, 'size', side_effect=AssertionError('storage stat')), \
+                mock.patch.object(FileSystemStorage, 'exists', side_effect=AssertionError('storage stat')):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()['results']
+
+    def test_chat_page_query_count_is_independent_of_page_size(self):
+        self.add_messages(2)
+        small, _ = self.count_queries()
+        self.add_messages(98)
+        large, data = self.count_queries()
+
+        self.assertEqual(len(data), 100)
+        self.assertEqual(small, large)
+        self.assertEqual(data[0]['attachments'][0]['file_size'], 1024)
+        self.assertEqual(data[0]['attachments'][0]['mime_type'], 'application/pdf')
+
+
+class RecentChatHistoryTests(TestCase):
+    """The newest chat page comes from memory once a group is warm."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        subject = Subject.objects.create(name='Mathematics', code='MATH')
+        cls.group = StudyGroup.objects.create(name='Group', description='d', subject=subject, creator=cls.user)
+        chats = GroupChat.objects.bulk_create(
+            GroupChat(group=cls.group, user=cls.user, message=f'message {i}') for i in range(30)
+        )
+        ChatAttachment.objects.bulk_create([
+            ChatAttachment(chat=chats[-1], file='chat_attachments/a.pdf', file_type='DOCUMENT', size=1, mime_type='application/pdf')
+        ])
+
+    def setUp(self):
+        cache.clear()
+        recent_messages.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('group-chat-list-create', kwargs={'group_id': self.group.pk})
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_warm_first_page_matches_database_without_queries(self):
+        _, from_database = self.get(self.url + '?page_size=20&ordering=-created_at')
+        self.get(self.url + '?page_size=20')
+        queries, from_memory = self.get(self.url + '?page_size=20')
+
+        self.assertEqual(queries, 0)
+        self.assertEqual(from_memory['results'], from_database['results'])
+        self.assertEqual(from_memory['results'][0]['attachments'][0]['file_url'], 'http://testserver/media/chat_attachments/a.pdf')
+        _, second_page = self.get(from_memory['next'])
+        self.assertEqual([m['message'] for m in second_page['results']], [f'message {i}' for i in range(9, -1, -1)])
+        self.assertIsNone(second_page['next'])
+
+    def test_new_message_is_appended_and_foreign_writes_reload(self):
+        self.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'group': self.group.pk, 'message': 'fresh'})
+        self.assertEqual(response.status_code, 201)
+
+        queries, data = self.get(self.url)
+        self.assertEqual(queries, 0)
+        self.assertEqual(data['results'][0]['message'], 'fresh')
+        self.assertEqual(len(data['results']), 31)
+
+        # Another worker storing a message bumps the shared version.
+        cache.incr(recent_messages.key(self.group.pk))
+        queries, _ = self.get(self.url)
+        self.assertGreater(queries, 0)
+
+    def test_ring_reloads_after_per_process_version_expires(self):
+        # With the per-process default cache, another worker's write never
+        # bumps this worker's counter; the counter expiring bounds staleness.
+        self.get(self.url)
+        self.assertIsNotNone(recent_messages.get(self.group.pk, 20))
+        later = time.time() + recent_messages.timeout + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertIsNone(recent_messages.get(self.group.pk, 20))
+
+
+class ChatWriteBufferTests(TestCase):
+    """Batches are written and broadcast together; a bad message is isolated."""
+
+    def setUp(self):
+        self.written = []
+
+    def persist(self, chats):
+        if any(chat.message == 'bad' for chat in chats):
+            raise ValueError('bad message')
+        self.written.append([chat.message for chat in chats])
+        return [{'group': chat.group_id, 'message': chat.message} for chat in chats]
+
+    def make_buffer(self, **kwargs):
+        buffer = ChatWriteBuffer(**{'interval': 60, 'max_batch': 3, 'max_pending': 10, 'persist': self.persist, **kwargs})
+        buffer.broadcast = mock.AsyncMock()
+        return buffer
+
+    def chats(self, *messages):
+        return [GroupChat(group_id=1, user_id=1, message=message) for message in messages]
+
+    async def test_full_batch_is_written_and_broadcast(self):
+        buffer = self.make_buffer()
+        for chat in self.chats('a', 'b', 'c', 'd'):
+            await buffer.add(chat)
+        self.assertEqual(self.written, [['a', 'b', 'c']])
+        buffer.broadcast.assert_awaited_once()
+        await buffer.flush()
+        self.assertEqual(self.written, [['a', 'b', 'c'], ['d']])
+
+    async def test_bad_message_is_isolated_then_dropped(self):
+        buffer = self.make_buffer(max_attempts=2)
+        for chat in self.chats('a', 'bad'):
+            await buffer.add(chat)
+        with self.assertLogs('studygroup.messaging', 'ERROR') as logs:
+            await buffer.flush()
+            self.assertEqual(self.written, [['a']])
+            self.assertEqual(len(buffer._pending), 1)
+            await buffer.flush()
+        self.assertEqual(buffer._pending, [])
+        self.assertIn('Dropping chat message', logs.output[-1])
+
+
+class ChatSocketTests(TransactionTestCase):
+    """Messages sent over the socket are stored, then broadcast with their ids."""
+
+    def setUp(self):
+        cache.clear()
+        recent_messages.clear()
+        self.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        self.outsider = User.objects.create_user(email='outsider@example.com', full_name='Outsider', password='pw-123456')
+        subject = Subject.objects.create(name='Mathematics', code='MATH')
+        self.group = StudyGroup.objects.create(name='Group', description='d', subject=subject, creator=self.user)
+        self.other_group = StudyGroup.objects.create(name='Other', description='d', subject=subject, creator=self.outsider)
+
+    async def connect(self, user):
+        communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), {
+            'type': 'websocket',
+            'path': f'/ws/chat/{self.group.pk}/',
+            'query_string': f'token={AccessToken.for_user(user)}'.encode(),
+            'headers': [(b'host', b'testserver')],
+            'subprotocols': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator, await communicator.receive_output(timeout=5)
+
+    async def send(self, communicator, content):
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(content)})
+        return json.loads((await communicator.receive_output(timeout=5))['text'])
+
+    async def test_message_is_stored_then_broadcast(self):
+        communicator, accepted = await self.connect(self.user)
+        self.assertEqual(accepted['type'], 'websocket.accept')
+        history = json.loads((await communicator.receive_output(timeout=5))['text'])
+        self.assertEqual(history, {'type': 'history', 'messages': []})
+
+        message = await self.send(communicator, {'message': 'hello'})
+        self.assertEqual(message['type'], 'message')
+        stored = await sync_to_async(GroupChat.objects.get)(pk=message['id'])
+        self.assertEqual((stored.group_id, stored.message), (self.group.pk, 'hello'))
+
+        other = await sync_to_async(GroupChat.objects.create)(group=self.other_group, user=self.outsider, message='x')
+        error = await self.send(communicator, {'message': 'reply', 'parent': other.pk})
+        self.assertEqual(error, {'type': 'error', 'detail': 'Parent message not found in this group.'})
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(timeout=5)
+
+    async def test_non_member_is_refused(self):
+        communicator, closed = await self.connect(self.outsider)
+        self.assertEqual(closed, {'type': 'websocket.close', 'code': 4403})
+        await communicator.wait(timeout=5)
+
+    def test_pks_are_read_back_when_bulk_insert_returns_none(self):
+        now = timezone.now()
+        chats = [
+            GroupChat(group=self.group, user=self.user, message=message, created_at=now, updated_at=now)
+            for message in ('same', 'same', 'other')
+        ]
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            payloads = persist_messages(chats)
+        self.assertEqual(sorted(chat.pk for chat in chats), sorted(GroupChat.objects.values_list('pk', flat=True)))
+        self.assertEqual([payload['id'] for payload in payloads], [chat.pk for chat in chats])
+
+
+class ChannelBrokerTests(TestCase):
+    """UnixSocketChannelLayer workers exchanging messages through an in-process broker."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+
+    @contextlib.asynccontextmanager
+    async def broker(self, **config):
+        path = os.path.join(self.tmpdir, 'broker.sock')
+        broker = ChannelBroker(path, **config)
+        serving = asyncio.create_task(broker.serve())
+        while broker.server is None:
+            await asyncio.sleep(0.01)
+        layers = []
+
+        def worker():
+            layers.append(UnixSocketChannelLayer(path, **config))
+            return layers[-1]
+
+        try:
+            yield broker, worker
+        finally:
+            for layer in layers:
+                await layer.close()
+            # Let the broker's connection handlers see EOF and finish.
+            await asyncio.sleep(0.05)
+            serving.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await serving
+
+    async def receive(self, layer, channel):
+        return await asyncio.wait_for(layer.receive(channel), timeout=5)
+
+    async def test_framing(self):
+        reader = asyncio.StreamReader()
+        reader.feed_data(_encode(['send', 1, 'channel', {'text': 'h\u00e9'}]))
+        reader.feed_data(_messages_frame(2, [b'{"a":1}', b'{"b":2}']))
+        reader.feed_data(b'\xff\xff\xff\xff')
+        self.assertEqual(await _read_frame(reader), ['send', 1, 'channel', {'text': 'h\u00e9'}])
+        self.assertEqual(await _read_frame(reader), [2, 'messages', [{'a': 1}, {'b': 2}]])
+        with self.assertRaises(ConnectionError):
+            await _read_frame(reader)
+
+    async def test_group_send_reaches_every_worker(self):
+        async with self.broker() as (broker, worker):
+            first, second = worker(), worker()
+            channels = [await first.new_channel(), await second.new_channel()]
+            await first.group_add('chat', channels[0])
+            await second.group_add('chat', channels[1])
+            await first.group_send('chat', {'type': 'chat.message', 'text': 'hi'})
+            self.assertEqual(await self.receive(first, channels[0]), {'type': 'chat.message', 'text': 'hi'})
+            self.assertEqual(await self.receive(second, channels[1]), {'type': 'chat.message', 'text': 'hi'})
+
+            await second.group_discard('chat', channels[1])
+            await first.group_send('chat', {'type': 'chat.message', 'text': 'again'})
+            self.assertEqual((await self.receive(first, channels[0]))['text'], 'again')
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(second.receive(channels[1]), timeout=0.2)
+
+    async def test_capacity(self):
+        async with self.broker(capacity=2) as (broker, worker):
+            layer = worker()
+            for i in range(2):
+                await layer.send('queue', {'type': 'x', 'n': i})
+            with self.assertRaises(ChannelFull):
+                await layer.send('queue', {'type': 'x', 'n': 2})
+            self.assertEqual((await self.receive(layer, 'queue'))['n'], 0)
+
+    async def test_reconnects_after_losing_the_broker_connection(self):
+        async with self.broker() as (broker, worker):
+            sender, receiver = worker(), worker()
+            channel = await receiver.new_channel()
+            waiting = asyncio.create_task(receiver.receive(channel))
+            await asyncio.sleep(0.05)
+            receiver._connection.writer.transport.abort()
+            with self.assertRaises(ConnectionError):
+                await asyncio.wait_for(waiting, timeout=5)
+
+            # Messages sent meanwhile wait in the broker for the next receive().
+            await sender.send(channel, {'type': 'x', 'text': 'queued'})
+            self.assertEqual((await self.receive(receiver, channel))['text'], 'queued')
+
+    async def test_expired_messages_are_dropped_and_their_channel_leaves_groups(self):
+        async with self.broker(expiry=0.05) as (broker, worker):
+            layer = worker()
+            channel = await layer.new_channel()
+            await layer.group_add('chat', channel)
+            await layer.group_send('chat', {'type': 'x', 'text': 'stale'})
+            await asyncio.sleep(0.1)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(layer.receive(channel), timeout=0.2)
+            self.assertNotIn('chat', broker.groups)
+
+
+class PresenceTests(TestCase):
+    """Presence answers from memory and expires users on the timer wheel."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        cls.other = User.objects.create_user(email='other@example.com', full_name='Other', password='pw-123456')
+        subject = Subject.objects.create(name='Mathematics', code='MATH')
+        cls.groups = [
+            StudyGroup.objects.create(name=f'Group {i}', description='d', subject=subject, creator=cls.user)
+            for i in range(3)
+        ]
+        GroupMembership.objects.create(user=cls.other, group=cls.groups[0])
+
+    def setUp(self):
+        cache.clear()
+        presence.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_ping_then_query_without_database(self):
+        response = self.client.post(reverse('presence-ping'), {'groups': [self.groups[0].pk, 999]}, format='json')
+        self.assertEqual(response.json()['groups'], [self.groups[0].pk])
+        presence.touch(self.other.pk, [self.groups[0].pk])
+
+        with CaptureQueriesContext(connection) as ctx:
+            online = self.client.get(reverse('group-online', kwargs={'group_id': self.groups[0].pk})).json()
+            ids = ','.join(str(group.pk) for group in self.groups)
+            counts = self.client.get(reverse('group-online-counts') + f'?ids={ids},999').json()['counts']
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(online['users'], sorted([self.user.pk, self.other.pk]))
+        self.assertEqual(counts, {str(self.groups[0].pk): 2, str(self.groups[1].pk): 0, str(self.groups[2].pk): 0})
+
+    def test_non_member_cannot_see_who_is_online(self):
+        self.client.force_authenticate(self.other)
+        response = self.client.get(reverse('group-online', kwargs={'group_id': self.groups[1].pk}))
+        self.assertEqual(response.status_code, 403)
+
+    def test_timer_wheel_expires_after_ttl(self):
+        now = [1000.0]
+        expired = []
+        wheel = TimerWheel(ttl=60, tick=5, on_expire=expired.append, clock=lambda: now[0])
+        wheel.touch('a')
+        wheel.touch('b')
+        now[0] += 30
+        wheel.touch('b')
+        now[0] += 30
+        wheel.advance()
+        self.assertEqual(expired, [])
+        now[0] += 5
+        wheel.advance()
+        self.assertEqual(expired, ['a'])
+        now[0] += 3600
+        wheel.advance()
+        self.assertEqual(expired, ['a', 'b'])
+
+
+class UnreadCountsTests(TestCase):
+    """Sidebar badges for all of a user's groups cost one query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        cls.other = User.objects.create_user(email='other@example.com', full_name='Other', password='pw-123456')
+        subject = Subject.objects.create(name='Mathematics', code='MATH')
+        cls.groups = [
+            StudyGroup.objects.create(name=f'Group {i}', description='d', subject=subject, creator=cls.user)
+            for i in range(30)
+        ]
+        GroupMembership.objects.filter(user=cls.user).update(joined_at=timezone.now() - timedelta(days=1))
+        GroupChat.objects.bulk_create(
+            [GroupChat(group=cls.groups[0], user=cls.other, message='old') for _ in range(150)]
+            + [GroupChat(group=cls.groups[1], user=cls.other, message='new') for _ in range(3)]
+            + [GroupChat(group=cls.groups[1], user=cls.user, message='mine') for _ in range(2)]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.addCleanup(read_pointer_buffer.flush)
+
+    def unread(self):
+        self.client.get(reverse('group-unread-counts'))  # warm the membership cache
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('group-unread-counts'))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        return {row['group']: (row['unread'], row['label']) for row in response.json()['results']}
+
+    def test_counts_are_capped_and_skip_own_messages(self):
+        unread = self.unread()
+        self.assertEqual(len(unread), 30)
+        self.assertEqual(unread[self.groups[0].pk], (100, '99+'))
+        self.assertEqual(unread[self.groups[1].pk], (3, '3'))
+        self.assertEqual(unread[self.groups[2].pk], (0, '0'))
+
+    def test_no_limit_inside_an_in_subquery(self):
+        # MySQL rejects LIMIT inside IN (SELECT ...).
+        with CaptureQueriesContext(connection) as ctx:
+            unread_counts(self.user.pk, [group.pk for group in self.groups])
+        self.assertNotIn(' IN (SELECT', ctx.captured_queries[0]['sql'])
+
+    def test_count_just_below_the_cap(self):
+        GroupChat.objects.bulk_create(GroupChat(group=self.groups[2], user=self.other, message='m') for _ in range(99))
+        self.assertEqual(self.unread()[self.groups[2].pk], (99, '99'))
+
+    def test_mark_read_applies_before_and_after_flush(self):
+        chat = GroupChat.objects.filter(group=self.groups[1], user=self.other).order_by('created_at', 'pk').first()
+        url = reverse('group-chat-mark-read', kwargs={'group_id': self.groups[1].pk})
+        self.assertEqual(self.client.post(url, {'chat': chat.pk}, format='json').status_code, 202)
+        self.assertEqual(self.client.post(reverse('group-chat-mark-read', kwargs={'group_id': self.groups[0].pk})).status_code, 202)
+
+        self.assertEqual(self.unread()[self.groups[0].pk], (0, '0'))
+        read_pointer_buffer.flush()
+        self.assertEqual(GroupMembership.objects.get(user=self.user, group=self.groups[1]).last_read_at, chat.created_at)
+        self.assertEqual(self.unread()[self.groups[0].pk], (0, '0'))
+
+    def test_mark_read_rejects_other_groups_messages(self):
+        chat = GroupChat.objects.filter(group=self.groups[0]).first()
+        url = reverse('group-chat-mark-read', kwargs={'group_id': self.groups[1].pk})
+        self.assertEqual(self.client.post(url, {'chat': chat.pk}, format='json').status_code, 404)
+
+
+class GroupChatThreadTests(TestCase):
+    """Threads load in a fixed number of queries, however deep they are."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        subject = Subject.objects.create(name='Mathematics', code='MATH')
+        cls.group = StudyGroup.objects.create(name='Group', description='d', subject=subject, creator=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        recent_messages.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def chain(self, length, parent=None):
+        chats = []
+        for i in range(length):
+            parent = GroupChat.objects.create(group=self.group, user=self.user, message=f'reply {i}', parent=parent)
+            chats.append(parent)
+        return chats
+
+    def get_thread(self, root):
+        url = reverse('group-chat-thread', kwargs={'group_id': self.group.pk, 'pk': root.pk})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_thread_query_count_is_independent_of_depth(self):
+        short = self.chain(2)
+        self.get_thread(short[0])  # warm the membership cache
+        small, _ = self.get_thread(short[0])
+        deep = self.chain(15)
+        self.chain(3, parent=deep[4])
+        large, data = self.get_thread(deep[0])
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(data['results']), 18)
+        self.assertFalse(data['truncated'])
+        by_id = {item['id']: item for item in data['results']}
+        self.assertEqual(by_id[deep[4].pk]['reply_count'], 2)
+        self.assertEqual(by_id[deep[14].pk]['depth'], 14)
+        self.assertEqual(max(item['depth'] for item in data['results']), 14)
+
+    def test_replies_from_other_groups_are_left_out(self):
+        other_group = StudyGroup.objects.create(
+            name='Other', description='d', subject=self.group.subject, creator=self.user
+        )
+        root, reply = self.chain(2)
+        # Stored before replies were checked against the parent's group.
+        foreign = GroupChat.objects.create(group=other_group, user=self.user, message='elsewhere', parent=reply)
+        GroupChat.objects.create(group=other_group, user=self.user, message='deeper', parent=foreign)
+        _, data = self.get_thread(root)
+        self.assertEqual([item['id'] for item in data['results']], [root.pk, reply.pk])
+        self.assertFalse(data['truncated'])
+
+        url = reverse('group-chat-list-create', kwargs={'group_id': other_group.pk})
+        response = self.client.post(url, {'group': self.group.pk, 'message': 'reply', 'parent': root.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['parent'], ['Parent message not found in this group.'])
+
+    def test_depth_limit_truncates(self):
+        deep = self.chain(30)
+        _, data = self.get_thread(deep[0])
+        self.assertEqual(len(data['results']), 21)
+        self.assertTrue(data['truncated'])
+
+    def test_list_reply_stats_match_when_served_from_memory(self):
+        root = self.chain(1)[0]
+        url = reverse('group-chat-list-create', kwargs={'group_id': self.group.pk})
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'group': self.group.pk, 'message': 'reply', 'parent': root.pk})
+
+        from_memory = self.client.get(url).json()['results']
+        from_database = self.client.get(url + '?ordering=-created_at').json()['results']
+        self.assertEqual(from_memory, from_database)
+        self.assertEqual(from_memory[1]['reply_count'], 1)
+        self.assertEqual(from_memory[1]['last_reply_at'], from_memory[0]['created_at'])
+
+
+class GroupChatSearchTests(TestCase):
+    """Message search sees one group's messages, as they are edited and deleted."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        cls.outsider = User.objects.create_user(email='outsider@example.com', full_name='Outsider', password='pw-123456')
+        subject = Subject.objects.create(name='Mathematics', code='MATH')
+        cls.group = StudyGroup.objects.create(name='Group', description='d', subject=subject, creator=cls.user)
+        cls.other_group = StudyGroup.objects.create(name='Other', description='d', subject=subject, creator=cls.outsider)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('group-chat-list-create', kwargs={'group_id': self.group.pk})
+
+    def say(self, message, group=None):
+        return GroupChat.objects.create(group=group or self.group, user=self.user, message=message)
+
+    def search(self, query, **params):
+        response = self.client.get(self.url, {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.json()['results']]
+
+    def check_search(self):
+        notes = self.say('Lecture notes for the integration exam')
+        link = self.say('Exam link: notes and past papers')
+        chatter = self.say('See you at the exam')
+        self.say('Exam notes from another group', group=self.other_group)
+
+        self.assertEqual(set(self.search('exam notes')), {notes.pk, link.pk})
+        self.assertEqual(self.search('exam', ordering='-created_at'), [chatter.pk, link.pk, notes.pk])
+        self.assertEqual(self.search('exam', ordering='created_at'), [notes.pk, link.pk, chatter.pk])
+        self.assertEqual(self.search('integ'), [notes.pk])
+
+        notes.message = 'Lecture slides'
+        notes.save()
+        link.delete()
+        self.assertEqual(self.search('notes'), [])
+        self.assertEqual(self.search('slides'), [notes.pk])
+
+        self.client.force_authenticate(self.outsider)
+        self.assertEqual(self.search('slides'), [])
+
+    def test_search_with_fts(self):
+        self.assertTrue(chat_index.uses_fts())
+        self.check_search()
+
+    def test_search_with_posting_tables(self):
+        with mock.patch.object(chat_index, '_fts', False):
+            self.check_search()
+
+
+class StudyGroupSearchTests(TestCase):
+    """Ranked results are the best matches the user can see, not of the whole index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        cls.owner = User.objects.create_user(email='owner@example.com', full_name='Owner', password='pw-123456')
+        subject = Subject.objects.create(name='Mathematics', code='MATH')
+        # Hidden groups rank first: the term is in their (heavier) name.
+        cls.hidden = [
+            StudyGroup.objects.create(
+                name=f'Algebra {i}', description='d', subject=subject, creator=cls.owner, privacy='PRIVATE'
+            )
+            for i in range(3)
+        ]
+        cls.visible = [
+            StudyGroup.objects.create(name=f'Group {i}', description='algebra', subject=subject, creator=cls.owner)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, **params):
+        response = self.client.get(reverse('study-group-list-create'), {'q': 'algebra', **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.json()['results']]
+
+    def check_search(self):
+        with mock.patch('studygroup.filters.MAX_RESULTS', 2):
+            ranked = self.search()
+            self.assertEqual(len(ranked), 2)
+            self.assertLessEqual(set(ranked), {group.pk for group in self.visible})
+            # Not limited to the best-ranked matches when ordered otherwise.
+            self.assertEqual(self.search(ordering='created_at'), [group.pk for group in self.visible])
+
+    def test_search_with_fts(self):
+        self.assertTrue(group_index.uses_fts())
+        self.check_search()
+
+    def test_search_with_posting_tables(self):
+        with mock.patch.object(group_index, '_fts', False):
+            index_groups(StudyGroup.objects.select_related('subject'))
+            self.check_search()
+
+    def test_migration_indexes_existing_groups(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM search_fts_studygroup")
+        self.assertEqual(group_index.search('algebra'), [])
+        migration = importlib.import_module('studygroup.migrations.0005_search_index')
+        migration.create_fts_table(apps, mock.Mock(connection=connection))
+        self.check_search()
+
+
+class SessionCalendarTests(TestCase):
+    """Calendar ranges and iCal feeds cover only the user's groups."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        cls.outsider = User.objects.create_user(email='outsider@example.com', full_name='Outsider', password='pw-123456')
+        subject = Subject.objects.create(name='Mathematics', code='MATH')
+        cls.group = StudyGroup.objects.create(name='Group', description='d', subject=subject, creator=cls.user)
+        cls.other_group = StudyGroup.objects.create(name='Other', description='d', subject=subject, creator=cls.outsider)
+        cls.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        cls.sessions = [
+            Session.objects.create(group=cls.group, title=f'Session {i}', start_time=cls.start + timedelta(days=i))
+            for i in range(3)
+        ]
+        Session.objects.create(group=cls.other_group, title='Elsewhere', start_time=cls.start)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_range_is_half_open(self):
+        response = self.client.get(reverse('session-calendar'), {
+            'from': self.start.isoformat(), 'to': (self.start + timedelta(days=2)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['results']], [s.pk for s in self.sessions[:2]])
+
+        response = self.client.get(reverse('session-calendar'), {'from': self.start.isoformat()})
+        self.assertEqual(response.status_code, 400)
+
+    def feed(self, **headers):
+        url = self.client.get(reverse('session-calendar-feed-url')).json()['url']
+        self.client.force_authenticate(None)
+        try:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, headers=headers)
+        finally:
+            self.client.force_authenticate(self.user)
+        return response, len(ctx.captured_queries)
+
+    def test_feed_streams_and_revalidates(self):
+        self.sessions[1].title = 'A long title ' + 'é' * 80
+        self.sessions[1].save()
+        response, _ = self.feed()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(body.count(b'BEGIN:VEVENT'), 3)
+        self.assertNotIn(b'Elsewhere', body)
+        self.assertTrue(all(len(line) <= 75 for line in body.split(b'\r\n')))
+        self.assertIn('é' * 20, body.decode().replace('\r\n ', ''))
+
+        etag = response.headers['ETag']
+        response, queries = self.feed(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(queries, 2)
+        self.assertNotIn('Last-Modified', response.headers)
+
+        self.sessions[0].delete()
+        response, _ = self.feed(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+
+    async def test_feed_is_an_async_stream_under_asgi(self):
+        url = (await sync_to_async(self.client.get)(reverse('session-calendar-feed-url'))).json()['url']
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body.count(b'BEGIN:VEVENT'), 3)
+        self.assertTrue(body.endswith(b'END:VCALENDAR\r\n'))
+
+    def test_feed_rejects_forged_token(self):
+        url = reverse('session-calendar-feed', kwargs={'token': f'{self.outsider.pk}:forged'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_logging_out_everywhere_revokes_feed_url(self):
+        url = self.client.get(reverse('session-calendar-feed-url')).json()['url']
+        self.assertEqual(self.client.get(url).status_code, 200)
+        revoke_all_tokens(self.user)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        fresh = self.client.get(reverse('session-calendar-feed-url')).json()['url']
+        self.assertNotEqual(fresh, url)
+        self.assertEqual(self.client.get(fresh).status_code, 200)
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from users.activity import CoalescingBuffer
+from .models import GroupChat, GroupMembership
+
+# Unread counts stop here; the badge then reads "99+".
+UNREAD_CAP = 100
+
+
+def _write_read_pointers(pending):
+    with transaction.atomic():
+        for (user_id, group_id), read_at in pending.items():
+            # Pointers only move forward, whatever order writes land in.
+            GroupMembership.objects.filter(user_id=user_id, group_id=group_id).filter(
+                Q(last_read_at__isnull=True) | Q(last_read_at__lt=read_at)
+            ).update(last_read_at=read_at)
+
+
+read_pointer_buffer = CoalescingBuffer(
+    _write_read_pointers,
+    getattr(settings, 'READ_POINTER_FLUSH_INTERVAL', 5),
+)
+
+
+def mark_read(user_id, group_id, read_at):
+    """Move the user's read pointer in a group to ``read_at``; written in batches."""
+    read_pointer_buffer.add((user_id, group_id), read_at)
+
+
+def unread_counts(user_id, group_ids):
+    """
+    ``{group_id: unread}`` for the user's memberships in ``group_ids``, in
+    one query. Messages sent before the user joined or by the user do not
+    count, and counting stops at ``UNREAD_CAP``: each group reads at most
+    that many entries of the ``GroupChat(group, created_at)`` index,
+    however deep the history.
+    """
+    group_ids = list(group_ids)
+    # Pointers still waiting in the buffer override the stored ones.
+    pending = {
+        group_id: read_at for group_id in group_ids
+        if (read_at := read_pointer_buffer.get((user_id, group_id))) is not None
+    }
+    last_read = F('last_read_at')
+    if pending:
+        last_read = Case(
+            *(When(group_id=group_id, then=Value(read_at)) for group_id, read_at in pending.items()),
+            default=F('last_read_at'),
+        )
+
+    newer = GroupChat.objects.filter(
+        group_id=OuterRef('group_id'),
+        created_at__gt=OuterRef('read_at'),
+    ).exclude(user_id=user_id).order_by()
+    # A row at offset UNREAD_CAP - 1 means the cap is reached; only below
+    # it is the COUNT run, so it reads fewer than UNREAD_CAP index entries.
+    # (MySQL rejects a LIMIT inside an IN subquery, so the count cannot be
+    # taken over a sliced id list.)
+    count = newer.values('group_id').annotate(unread=Count('pk')).values('unread')
+
+    memberships = GroupMembership.objects.filter(user_id=user_id, group_id__in=group_ids).order_by().annotate(
+        read_at=Coalesce(last_read, F('joined_at')),
+    ).annotate(
+        unread=Case(
+            When(Exists(newer[UNREAD_CAP - 1:UNREAD_CAP]), then=Value(UNREAD_CAP)),
+            default=Coalesce(Subquery(count), 0),
+        ),
+    )
+    return dict(memberships.values_list('group_id', 'unread'))
+
+
+def unread_label(count):
+    return f'{UNREAD_CAP - 1}+' if count >= UNREAD_CAP else str(count)
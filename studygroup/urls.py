@@ -5,8 +5,14 @@ from . import views
 urlpatterns = [
     path('groups/<int:group_id>/chats/<int:pk>/', views.GroupChatDetailAPI.as_view(), name='group-chat-detail'),
 
+    path('groups/<int:group_id>/chats/<int:pk>/thread/', views.GroupChatThreadAPI.as_view(), name='group-chat-thread'),
+
     path('groups/<int:group_id>/chats/', views.GroupChatListCreateAPI.as_view(), name='group-chat-list-create'),
 
+    path('groups/<int:group_id>/chats/read/', views.GroupChatMarkReadAPI.as_view(), name='group-chat-mark-read'),
+
+    path('groups/unread/', views.UnreadCountsAPI.as_view(), name='group-unread-counts'),
+
     path('subjects/', views.SubjectListAPI.as_view(), name='subject-list'),
 
     path('groups/', views.StudyGroupListCreateAPI.as_view(), name='study-group-list-create'),
@@ -14,4 +20,16 @@ urlpatterns = [
     path('groups/<int:pk>/', views.StudyGroupDetailAPI.as_view(), name='study-group-detail'),
 
     path('groups/my/', views.MyStudyGroupsAPI.as_view(), name='my-study-groups'),
+
+    path('groups/online/', views.OnlineCountsAPI.as_view(), name='group-online-counts'),
+
+    path('groups/<int:group_id>/online/', views.GroupOnlineAPI.as_view(), name='group-online'),
+
+    path('presence/ping/', views.PresencePingAPI.as_view(), name='presence-ping'),
+
+    path('sessions/calendar/', views.SessionCalendarAPI.as_view(), name='session-calendar'),
+
+    path('sessions/calendar/feed/', views.SessionCalendarFeedURLAPI.as_view(), name='session-calendar-feed-url'),
+
+    path('sessions/calendar/<str:token>.ics', views.SessionCalendarFeedAPI.as_view(), name='session-calendar-feed'),
 ]
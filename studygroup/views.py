@@ -1,18 +1,46 @@
-from rest_framework import generics, permissions, filters, status
+from collections import Counter
+from datetime import timedelta
+
+from rest_framework import generics, permissions, filters, serializers, status
 from django_filters.rest_framework import DjangoFilterBackend
+from drf_spectacular.utils import OpenApiParameter, OpenApiResponse, OpenApiTypes, extend_schema
 from rest_framework.response import Response
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from rest_framework.exceptions import PermissionDenied
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.views import APIView
 
-from .models import StudyGroup, Subject, GroupChat
+from .models import StudyGroup, Subject, GroupChat, Session
 from .serializers import (
     StudyGroupSerializer,
     StudyGroupCreateSerializer,
     SubjectSerializer,
     GroupChatSerializer,
+    SessionSerializer,
+    PresencePingSerializer,
+    GroupOnlineSerializer,
+    OnlineCountsSerializer,
+    MarkReadSerializer,
+    UnreadCountsSerializer,
+    CalendarFeedURLSerializer,
 )
-from .filters import StudyGroupFilter
+from .filters import RankedSearchFilter, StudyGroupFilter
+from .ical import aical_feed, feed_etag, feed_sessions, feed_token, feed_user, ical_feed
+from .messaging import recent_history
+from .recent import absolutize, recent_messages
+from .search import chat_index, group_index
 from .permissions import IsGroupMemberOrPublic
+from .presence import presence
+from .unread import mark_read, unread_counts, unread_label
+from .visibility import member_group_ids, member_groups, visible_groups
+
+_thread_config = getattr(settings, 'CHAT_THREAD', {})
+_calendar_config = getattr(settings, 'SESSION_CALENDAR', {})
 
 
 class GroupChatDetailAPI(generics.RetrieveAPIView):
@@ -32,23 +60,33 @@ class GroupChatDetailAPI(generics.RetrieveAPIView):
         if not group.members.filter(id=self.request.user.id).exists():
             raise PermissionDenied("You are not a member of this group")
         
-        chat = get_object_or_404(GroupChat, id=chat_id, group_id=group_id)
+        chat = get_object_or_404(
+            GroupChat.objects.select_related('user').prefetch_related('attachments').with_reply_stats(),
+            id=chat_id, group_id=group_id
+        )
         return chat
 
 
 class GroupChatListCreateAPI(generics.ListCreateAPIView):
     """
     GET /groups/<group_id>/chats/
-    List all chats for a study group.
+    List all chats for a study group. With ?q= only messages matching the
+    search come back, best match first, or newest first with
+    ?ordering=-created_at.
 
     POST /groups/<group_id>/chats/
     Create a new chat in the study group.
     """
     serializer_class = GroupChatSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [filters.OrderingFilter]
-    ordering_fields = ['timestamp']
-    ordering = ['-timestamp']
+    filter_backends = [filters.OrderingFilter, RankedSearchFilter]
+    search_index = chat_index
+    search_newest_orderings = ['-created_at']
+    ordering_fields = ['created_at']
+    ordering = ['-created_at']
+
+    def get_search_scope(self):
+        return self.kwargs['group_id']
 
     def get_queryset(self):
         group_id = self.kwargs['group_id']
@@ -58,7 +96,34 @@ class GroupChatListCreateAPI(generics.ListCreateAPIView):
         if not group.members.filter(id=self.request.user.id).exists():
             return GroupChat.objects.none()
         
-        return GroupChat.objects.filter(group_id=group_id)
+        return GroupChat.objects.filter(group_id=group_id) \
+                                .select_related('user').prefetch_related('attachments') \
+                                .with_reply_stats()
+
+    def list(self, request, *args, **kwargs):
+        response = self.list_recent(request)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return response
+
+    def list_recent(self, request):
+        """
+        The newest page, which every client opening the chat asks for, is
+        served from ``recent_messages``; other pages go to the database.
+        """
+        group_id = self.kwargs['group_id']
+        limit = self.paginator.get_page_size(request)
+        if set(request.query_params) - {'page_size', 'format'} or limit >= recent_messages.per_group:
+            return None
+        if group_id not in member_group_ids(request.user.pk):
+            return None
+
+        messages = recent_history(group_id, limit + 1)
+        page = messages[:limit]
+        last_cursor = [page[-1]['created_at'], page[-1]['id']] if page else None
+        self.paginator.paginate_first_page(request, page, len(messages) > limit, last_cursor)
+        base_url = request.build_absolute_uri('/')
+        return self.paginator.get_paginated_response([absolutize(message, base_url) for message in page])
 
     def perform_create(self, serializer):
         group_id = self.kwargs['group_id']
@@ -68,7 +133,51 @@ class GroupChatListCreateAPI(generics.ListCreateAPIView):
         if not group.members.filter(id=self.request.user.id).exists():
             raise PermissionDenied("You are not a member of this group")
         
-        serializer.save(user=self.request.user, group=group)
+        chat = serializer.save(user=self.request.user, group=group)
+        mark_read(self.request.user.pk, group.pk, chat.created_at)
+
+
+class GroupChatThreadAPI(generics.GenericAPIView):
+    """
+    GET /groups/<group_id>/chats/<pk>/thread/
+    A message and its replies, oldest first, each with its "depth" below
+    the root. Replies deeper than CHAT_THREAD['MAX_DEPTH'] or beyond
+    CHAT_THREAD['MAX_MESSAGES'] are left out and "truncated" is set; load
+    the thread of a message with remaining replies to continue.
+    """
+    serializer_class = GroupChatSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    max_depth = _thread_config.get('MAX_DEPTH', 20)
+    max_messages = _thread_config.get('MAX_MESSAGES', 500)
+
+    def get(self, request, group_id, pk):
+        if group_id not in member_group_ids(request.user.pk):
+            raise PermissionDenied("You are not a member of this group")
+        chats = list(
+            GroupChat.objects.thread(pk, group_id, self.max_depth, self.max_messages)
+            .select_related('user').prefetch_related('attachments').with_reply_stats()
+            .order_by('created_at', 'pk')
+        )
+        if not chats:
+            raise NotFound("Chat message not found in this group")
+
+        # Every reply's parent is in the thread, so each chain ends at the root.
+        parents = {chat.pk: chat.parent_id for chat in chats}
+        depth = {pk: 0}
+        for chat_id in parents:
+            chain = []
+            while chat_id not in depth:
+                chain.append(chat_id)
+                chat_id = parents[chat_id]
+            for level, reply_id in enumerate(reversed(chain), depth[chat_id] + 1):
+                depth[reply_id] = level
+        loaded_replies = Counter(chat.parent_id for chat in chats)
+        truncated = any(chat.reply_count > loaded_replies[chat.pk] for chat in chats)
+
+        results = self.get_serializer(chats, many=True).data
+        for item in results:
+            item['depth'] = depth[item['id']]
+        return Response({'root': pk, 'truncated': truncated, 'results': results})
 
 
 class SubjectListAPI(generics.ListAPIView):
@@ -93,10 +202,10 @@ class StudyGroupListCreateAPI(generics.ListCreateAPIView):
     Create a new study group. Authenticated users only.
     """
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, RankedSearchFilter]
     filterset_class = StudyGroupFilter
-    search_fields = ['name', 'description', 'subject__name']
-    ordering_fields = ['name', 'created_at', 'updated_at', 'member_count']
+    search_index = group_index
+    ordering_fields = ['name', 'created_at', 'updated_at', 'member_count', 'last_activity_at']
     ordering = ['-created_at']
 
     def get_serializer_class(self):
@@ -105,18 +214,13 @@ class StudyGroupListCreateAPI(generics.ListCreateAPIView):
         return StudyGroupSerializer
 
     def get_queryset(self):
-        queryset = StudyGroup.objects.annotate_member_count()
+        queryset = StudyGroup.objects.for_listing(self.request.user)
         
-        if self.request.user.is_authenticated:
-            if self.request.query_params.get('my_groups'):
-                return queryset.filter(members=self.request.user)
-            return queryset.filter(
-                models.Q(privacy='PUBLIC') | 
-                models.Q(members=self.request.user)
-            ).distinct()
+        if self.request.user.is_authenticated and self.request.query_params.get('my_groups'):
+            return member_groups(queryset, self.request.user)
         
-        # For anonymous users, only show public groups
-        return queryset.filter(privacy='PUBLIC')
+        # Public groups plus the user's own; anonymous users only see public groups
+        return visible_groups(queryset, self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(creator=self.request.user)
@@ -133,14 +237,16 @@ class StudyGroupDetailAPI(generics.RetrieveUpdateDestroyAPIView):
     DELETE /groups/<id>/
     Delete a study group.
     """
-    queryset = StudyGroup.objects.annotate_member_count()
     serializer_class = StudyGroupSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsGroupMemberOrPublic]
 
+    def get_queryset(self):
+        return StudyGroup.objects.for_listing(self.request.user)
+
     def perform_update(self, serializer):
         # Only allow creator or admins to update
         if (self.request.user != serializer.instance.creator and 
-            not serializer.instance.memberships.filter(
+            not serializer.instance.memberships_set.filter(
                 user=self.request.user, 
                 role__in=['ADMIN', 'MODERATOR']
             ).exists()):
@@ -155,12 +261,208 @@ class MyStudyGroupsAPI(generics.ListAPIView):
     """
     serializer_class = StudyGroupSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['name', 'description', 'subject__name']
-    ordering_fields = ['name', 'created_at', 'updated_at']
+    filter_backends = [filters.OrderingFilter, RankedSearchFilter]
+    search_index = group_index
+    ordering_fields = ['name', 'created_at', 'updated_at', 'last_activity_at']
     ordering = ['-created_at']
 
     def get_queryset(self):
-        return StudyGroup.objects.filter(
-            members=self.request.user
-        ).annotate_member_count()
+        return member_groups(
+            StudyGroup.objects.for_listing(self.request.user),
+            self.request.user
+        )
+
+
+class PresencePingAPI(APIView):
+    """
+    POST /presence/ping/
+    Mark the user online in their groups (or only in the member groups
+    listed in "groups") for PRESENCE['TTL'] seconds. Clients without a chat
+    socket open ping about twice per TTL. The user is only marked online
+    in the worker process that served the ping.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(request=PresencePingSerializer, responses=PresencePingSerializer)
+    def post(self, request):
+        group_ids = set(member_group_ids(request.user.pk))
+        requested = request.data.get('groups')
+        if requested is not None:
+            if not isinstance(requested, list) or not all(isinstance(group_id, int) for group_id in requested):
+                raise ValidationError({'groups': 'Must be a list of group ids.'})
+            group_ids = group_ids & set(requested)
+        presence.touch(request.user.pk, group_ids)
+        return Response({'groups': sorted(group_ids), 'ttl': presence.ttl})
+
+
+class GroupOnlineAPI(APIView):
+    """
+    GET /groups/<group_id>/online/
+    Ids of the members currently online in a group, as seen by this
+    worker process.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(responses=GroupOnlineSerializer)
+    def get(self, request, group_id):
+        if group_id not in member_group_ids(request.user.pk):
+            raise PermissionDenied("You are not a member of this group")
+        users = sorted(presence.online(group_id))
+        return Response({'group': group_id, 'count': len(users), 'users': users})
+
+
+class OnlineCountsAPI(APIView):
+    """
+    GET /groups/online/?ids=1,2,3
+    Number of members online in each listed group the user belongs to, as
+    seen by this worker process.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_groups = 100
+
+    @extend_schema(
+        parameters=[OpenApiParameter('ids', str, description='Comma-separated group ids (at most 100)')],
+        responses=OnlineCountsSerializer,
+    )
+    def get(self, request):
+        try:
+            requested = {int(group_id) for group_id in request.query_params.get('ids', '').split(',') if group_id}
+        except ValueError:
+            raise ValidationError({'ids': 'Must be a comma-separated list of group ids.'})
+        if len(requested) > self.max_groups:
+            raise ValidationError({'ids': f'At most {self.max_groups} groups at a time.'})
+        counts = presence.counts(requested & set(member_group_ids(request.user.pk)))
+        return Response({'counts': counts})
+
+
+class GroupChatMarkReadAPI(APIView):
+    """
+    POST /groups/<group_id>/chats/read/
+    Mark the group's chat as read up to the message in "chat", or up to
+    now when it is omitted.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(request=MarkReadSerializer, responses={202: MarkReadSerializer})
+    def post(self, request, group_id):
+        if group_id not in member_group_ids(request.user.pk):
+            raise PermissionDenied("You are not a member of this group")
+        chat_id = request.data.get('chat')
+        if chat_id is None:
+            read_at = timezone.now()
+        else:
+            read_at = GroupChat.objects.filter(pk=chat_id, group_id=group_id).values_list('created_at', flat=True).first()
+            if read_at is None:
+                raise NotFound("Chat message not found in this group")
+        mark_read(request.user.pk, group_id, read_at)
+        return Response({'group': group_id, 'last_read_at': read_at}, status=status.HTTP_202_ACCEPTED)
+
+
+class UnreadCountsAPI(APIView):
+    """
+    GET /groups/unread/
+    Unread chat messages in each of the user's groups, counted up to 99+.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(responses=UnreadCountsSerializer)
+    def get(self, request):
+        counts = unread_counts(request.user.pk, member_group_ids(request.user.pk))
+        return Response({'results': [
+            {'group': group_id, 'unread': count, 'label': unread_label(count)}
+            for group_id, count in sorted(counts.items())
+        ]})
+
+
+class SessionCalendarAPI(generics.ListAPIView):
+    """
+    GET /sessions/calendar/?from=<datetime>&to=<datetime>
+    Sessions of the user's groups starting in [from, to), soonest first;
+    ?group=<id> narrows them to one group. The window may be at most
+    SESSION_CALENDAR['MAX_WINDOW_DAYS'] long.
+    """
+    serializer_class = SessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    max_window = timedelta(days=_calendar_config.get('MAX_WINDOW_DAYS', 366))
+
+    def get_queryset(self):
+        start, end = self.get_datetime('from'), self.get_datetime('to')
+        if end <= start:
+            raise ValidationError({'to': 'Must be after "from".'})
+        if end - start > self.max_window:
+            raise ValidationError({'to': f'The window may be at most {self.max_window.days} days long.'})
+
+        group_ids = member_group_ids(self.request.user.pk)
+        group = self.request.query_params.get('group')
+        if group:
+            try:
+                group_ids = [int(group)] if int(group) in group_ids else []
+            except ValueError:
+                raise ValidationError({'group': 'Must be a group id.'})
+
+        # group_id IN (...) plus the start_time range is a range scan per
+        # group of the (group, start_time) index.
+        return Session.objects.filter(
+            group_id__in=group_ids, start_time__gte=start, start_time__lt=end,
+        ).select_related('created_by').order_by('start_time')
+
+    def get_datetime(self, param):
+        value = self.request.query_params.get(param)
+        if not value:
+            raise ValidationError({param: 'This parameter is required.'})
+        try:
+            return serializers.DateTimeField().to_internal_value(value)
+        except ValidationError as exc:
+            raise ValidationError({param: exc.detail})
+
+
+class SessionCalendarFeedURLAPI(APIView):
+    """
+    GET /sessions/calendar/feed/
+    The URL of the user's private iCal feed, to subscribe to from a
+    calendar app. Anyone with the URL can read the feed until the user
+    logs out everywhere, which issues a new one.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(responses=CalendarFeedURLSerializer)
+    def get(self, request):
+        path = reverse('session-calendar-feed', kwargs={'token': feed_token(request.user)})
+        return Response({'url': request.build_absolute_uri(path)})
+
+
+class SessionCalendarFeedAPI(APIView):
+    """
+    GET /sessions/calendar/<token>.ics
+    The user's sessions as an iCalendar feed, streamed as rows are read
+    (through an async iterator under ASGI). Calendar apps poll it, so it
+    carries an ETag and answers 304 Not Modified, after one aggregate
+    query, while it matches.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    @extend_schema(
+        responses={
+            (200, 'text/calendar'): OpenApiResponse(OpenApiTypes.STR, description='iCalendar (RFC 5545) feed'),
+            304: OpenApiResponse(description='Not modified since the ETag in If-None-Match'),
+            404: OpenApiResponse(description='Unknown or revoked feed token'),
+        },
+    )
+    def get(self, request, token):
+        user = feed_user(token)
+        if user is None:
+            raise NotFound()
+
+        group_ids = member_group_ids(user.pk)
+        sessions = feed_sessions(group_ids)
+        etag = feed_etag(group_ids, sessions)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            feed = aical_feed if isinstance(request._request, ASGIRequest) else ical_feed
+            response = StreamingHttpResponse(
+                feed(sessions, request.get_host()), content_type='text/calendar; charset=utf-8',
+            )
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
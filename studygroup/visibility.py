@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from users.caching import VersionStamps, invalidate_now_and_on_commit, invalidation_timeout
+from .models import GroupMembership
+
+CACHE_TIMEOUT = invalidation_timeout(getattr(settings, 'GROUP_VISIBILITY_CACHE_TIMEOUT', 3600))
+
+_versions = VersionStamps('group-visibility-version')
+
+
+def _key(user_id):
+    return f'group-visibility:{user_id}'
+
+
+def member_group_ids(user_id):
+    """
+    Ids of the groups ``user_id`` belongs to, served from the default
+    cache until one of their memberships changes.
+    """
+    stamp = _versions.get(user_id)
+    entry = cache.get(_key(user_id))
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+    ids = sorted(GroupMembership.objects.filter(user_id=user_id).values_list('group_id', flat=True))
+    cache.set(_key(user_id), (stamp, ids), CACHE_TIMEOUT)
+    return ids
+
+
+def invalidate(user_id):
+    """Drop ``user_id``'s cached group ids after a membership change."""
+    invalidate_now_and_on_commit(_versions.invalidate, user_id)
+
+
+def visible_groups(queryset, user):
+    """
+    Restrict a StudyGroup queryset to what ``user`` may list: public groups
+    plus the groups they belong to.
+
+    Membership is resolved to a list of ids up front, so the filter is
+    ``privacy = 'PUBLIC' OR id IN (...)``. Both sides are answered from an
+    index, and without a join to GroupMembership no DISTINCT is needed.
+    """
+    if not user.is_authenticated:
+        return queryset.filter(privacy='PUBLIC')
+    return queryset.filter(Q(privacy='PUBLIC') | Q(pk__in=member_group_ids(user.pk)))
+
+
+def member_groups(queryset, user):
+    """Restrict a StudyGroup queryset to the groups ``user`` belongs to."""
+    return queryset.filter(pk__in=member_group_ids(user.pk))
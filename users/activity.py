@@ -0,0 +1,113 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescingBuffer:
+    """
+    Collects keyed writes in memory and hands them to ``flush_func`` as one
+    batch every ``interval`` seconds (and once more at interpreter exit).
+
+    Only the newest value per key is kept, so a user who logs in ten times
+    between two flushes costs a single row update. An ``interval`` of 0
+    disables buffering and writes through on every call.
+    """
+
+    def __init__(self, flush_func, interval):
+        self.flush_func = flush_func
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        atexit.register(self.flush)
+
+    def add(self, key, value):
+        if not self.interval:
+            self.flush_func({key: value})
+            return
+
+        with self._lock:
+            current = self._pending.get(key)
+            if current is None or value > current:
+                self._pending[key] = value
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='coalescing-buffer', daemon=True)
+                self._thread.start()
+
+    def get(self, key, default=None):
+        """Return a value that has been added but not flushed yet."""
+        with self._lock:
+            return self._pending.get(key, default)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        try:
+            self.flush_func(pending)
+        except Exception:
+            logger.exception("Failed to flush %d buffered writes", len(pending))
+            # Put the batch back so the next flush retries it, without
+            # clobbering anything newer that arrived in the meantime.
+            with self._lock:
+                for key, value in pending.items():
+                    current = self._pending.get(key)
+                    if current is None or value > current:
+                        self._pending[key] = value
+
+    def stop(self):
+        """Flush, then end the background flusher (a later ``add()`` restarts it)."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopped.set()
+            thread.join()
+            self._stopped.clear()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+
+def _write_last_active(pending, chunk_size=500):
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    # One UPDATE per chunk, with a CASE keyed on pk. update() bypasses
+    # save(), so ``auto_now`` does not overwrite the buffered timestamps
+    # and only the one column is written. A save() since the timestamp was
+    # buffered has already stored a later one, which the guard keeps.
+    items = sorted(pending.items())
+    with transaction.atomic():
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            User.objects.filter(pk__in=[user_id for user_id, _ in chunk]).update(last_active=Case(
+                *(When(pk=user_id, last_active__lt=timestamp, then=Value(timestamp)) for user_id, timestamp in chunk),
+                default=F('last_active'),
+                output_field=DateTimeField(),
+            ))
+
+
+last_active_buffer = CoalescingBuffer(
+    _write_last_active,
+    getattr(settings, 'LAST_ACTIVE_FLUSH_INTERVAL', 5),
+)
+
+
+def record_activity(user, when):
+    """Mark ``user`` as active at ``when`` without writing the user row now."""
+    user.last_active = when
+    last_active_buffer.add(user.pk, when)
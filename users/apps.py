@@ -5,4 +5,6 @@ class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
     def ready(self):
-        import users.signals  
+        import users.checks
+        import users.schema
+        import users.signals
@@ -0,0 +1,63 @@
+import copy
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .caching import TTLCache, VersionStamps, invalidation_timeout
+from .tokens import is_revoked_by_watermark
+
+_config = getattr(settings, 'AUTH_USER_CACHE', {})
+_users = TTLCache(maxsize=_config.get('MAXSIZE', 10000), ttl=invalidation_timeout(_config.get('TTL', 60)))
+_versions = VersionStamps('auth-user-version')
+
+
+def invalidate_user(user_id):
+    """
+    Drop the cached user everywhere: entries cached by other processes stop
+    matching once the shared version stamp is gone.
+    """
+    _versions.invalidate(user_id)
+    _users.pop(user_id)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that serves the token's user from an in-process
+    TTL+LRU cache instead of loading it from the database on every request.
+
+    Each entry is tagged with the user's version stamp from the default
+    cache; saving or deleting the user deletes the stamp (see
+    ``users.signals``). That invalidates the entry in every process only if
+    the cache is shared; with a per-process cache, entries expire after
+    ``PROCESS_LOCAL_CACHE_TIMEOUT`` seconds instead.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        version = _versions.get(user_id)
+        entry = _users.get(user_id)
+        if entry is not None and entry[0] == version:
+            user = copy.copy(entry[1])
+            # The user is known to be active, but the password may have
+            # changed since this particular token was issued.
+            if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+        else:
+            user = super().get_user(validated_token)
+            _users.set(user_id, (version, copy.copy(user)))
+
+        if is_revoked_by_watermark(user, validated_token):
+            raise AuthenticationFailed(_("Token has been revoked."), code="token_revoked")
+        return user
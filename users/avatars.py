@@ -0,0 +1,181 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils.translation import gettext_lazy as _
+from PIL import Image, ImageOps
+
+from .authentication import invalidate_user
+
+logger = logging.getLogger(__name__)
+
+MAX_PIXELS = getattr(settings, 'AVATAR_MAX_PIXELS', 50_000_000)
+RENDITION_SIZES = getattr(settings, 'AVATAR_RENDITION_SIZES', (48, 128, 512))
+RENDITION_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+_worker = ThreadPoolExecutor(max_workers=getattr(settings, 'AVATAR_WORKERS', 1), thread_name_prefix='avatar-renditions')
+
+
+def open_bounded(fileobj):
+    """
+    Open an image without decoding it and refuse anything with more than
+    ``AVATAR_MAX_PIXELS`` pixels. ``Image.open`` only parses the header, so
+    the check happens before any pixel data is decompressed.
+    """
+    try:
+        image = Image.open(fileobj)
+    except (Image.DecompressionBombError, OSError):
+        raise ValidationError(_('Upload a valid image.'))
+    if image.width * image.height > MAX_PIXELS:
+        raise ValidationError(_('Image is too large; upload one under %(limit)d megapixels.') % {
+            'limit': MAX_PIXELS // 1_000_000,
+        })
+    return image
+
+
+def sanitize_image(upload):
+    """
+    Re-encode an uploaded image with EXIF orientation applied and all
+    metadata (EXIF, GPS, ICC comments) dropped. Returns a new file with the
+    same name, ready to assign to an ImageField.
+    """
+    upload.seek(0)
+    image = open_bounded(upload)
+    fmt = image.format if image.format in ('JPEG', 'PNG', 'WEBP', 'GIF') else 'PNG'
+    output = io.BytesIO()
+    options = {'quality': 90} if fmt in ('JPEG', 'WEBP') else {}
+    # The pixel data is only decoded here, so this is where truncated or
+    # corrupt uploads fail.
+    try:
+        image = ImageOps.exif_transpose(image)
+        if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(output, fmt, **options)
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError(_('Upload a valid image.'))
+    name = os.path.splitext(os.path.basename(upload.name))[0] + '.' + ('jpg' if fmt == 'JPEG' else fmt.lower())
+    return ContentFile(output.getvalue(), name=name)
+
+
+def _rendition_name(source_name, size, extension):
+    stem = os.path.splitext(source_name)[0]
+    return f"renditions/{stem}_{size}.{extension}"
+
+
+def build_renditions(instance, field_name='avatar'):
+    """
+    Render the square sizes in ``AVATAR_RENDITION_SIZES`` as WebP and JPEG
+    and record their storage names in ``<field>_renditions``. The record is
+    only written if the source image has not been replaced meanwhile; once
+    it commits, the files of the previous renditions are deleted.
+    """
+    field_file = getattr(instance, field_name)
+    model = type(instance)
+    previous = getattr(instance, f'{field_name}_renditions') or {}
+    if not field_file:
+        model.objects.filter(pk=instance.pk).update(**{f'{field_name}_renditions': {}})
+        _renditions_replaced(instance, field_name, previous, {})
+        return {}
+
+    storage = field_file.storage
+    with field_file.open('rb') as source:
+        image = ImageOps.exif_transpose(open_bounded(source))
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+        renditions = {'source': field_file.name}
+        for size in RENDITION_SIZES:
+            resized = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            renditions[str(size)] = {}
+            for extension, fmt in RENDITION_FORMATS.items():
+                output = io.BytesIO()
+                (resized.convert('RGB') if fmt == 'JPEG' else resized).save(output, fmt, quality=82)
+                name = _rendition_name(field_file.name, size, extension)
+                if storage.exists(name):
+                    storage.delete(name)
+                renditions[str(size)][extension] = storage.save(name, ContentFile(output.getvalue()))
+
+    updated = model.objects.filter(pk=instance.pk, **{field_name: field_file.name}).update(
+        **{f'{field_name}_renditions': renditions}
+    )
+    if updated:
+        _renditions_replaced(instance, field_name, previous, renditions)
+    else:
+        # The source was replaced while rendering; nothing refers to these.
+        _renditions_replaced(instance, field_name, renditions, {})
+    return renditions
+
+
+def _rendition_names(renditions):
+    return {name for size, names in renditions.items() if size != 'source' for name in names.values()}
+
+
+def _renditions_replaced(instance, field_name, old, new):
+    """
+    Once the ``.update()`` that replaced ``old`` with ``new`` commits, delete
+    the files only ``old`` refers to and, as ``.update()`` sends no
+    ``post_save``, drop the cached copy of a user.
+    """
+    storage = getattr(instance, field_name).storage
+    stale = _rendition_names(old) - _rendition_names(new)
+    user_id = instance.pk if isinstance(instance, get_user_model()) else None
+
+    def cleanup():
+        if user_id is not None:
+            invalidate_user(user_id)
+        for name in stale:
+            try:
+                storage.delete(name)
+            except OSError:
+                logger.warning("Could not delete stale rendition %s", name, exc_info=True)
+
+    transaction.on_commit(cleanup)
+
+
+def needs_renditions(instance, field_name='avatar'):
+    field_file = getattr(instance, field_name)
+    renditions = getattr(instance, f'{field_name}_renditions') or {}
+    return (field_file.name or None) != renditions.get('source')
+
+
+def _build_in_background(model_label, pk, field_name):
+    try:
+        instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+        if instance is not None and needs_renditions(instance, field_name):
+            build_renditions(instance, field_name)
+    except Exception:
+        logger.exception("Building %s renditions for %s %s failed", field_name, model_label, pk)
+    finally:
+        connection.close()
+
+
+def schedule_renditions(instance, field_name='avatar'):
+    """Queue rendition building for after the current transaction commits."""
+    if not needs_renditions(instance, field_name):
+        return
+    label, pk = instance._meta.label, instance.pk
+    transaction.on_commit(lambda: _worker.submit(_build_in_background, label, pk, field_name))
+
+
+def rendition_urls(instance, request=None, field_name='avatar'):
+    """``{size: {format: url}}`` for an instance's renditions, or None."""
+    renditions = getattr(instance, f'{field_name}_renditions', None) or {}
+    field_file = getattr(instance, field_name)
+    if not field_file or renditions.get('source') != field_file.name:
+        return None
+    storage = field_file.storage
+    urls = {}
+    for size, names in renditions.items():
+        if size == 'source':
+            continue
+        urls[size] = {
+            extension: request.build_absolute_uri(storage.url(name)) if request else storage.url(name)
+            for extension, name in names.items()
+        }
+    return urls
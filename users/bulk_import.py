@@ -0,0 +1,214 @@
+import csv
+import io
+import json
+import logging
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .hashing import HashingExecutor
+from .models import UserImportJob, UserProfile, UserSettings
+from .skills import sync_skills
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FIELDS = ('university', 'department', 'academic_level', 'skills')
+
+
+def read_rows(stream, fmt='csv'):
+    """Yield ``(line number, row dict)`` from a CSV or NDJSON text stream."""
+    if fmt == 'csv':
+        for line_no, row in enumerate(csv.DictReader(stream), start=2):
+            yield line_no, row
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError:
+                yield line_no, None
+    else:
+        raise ValueError(f"Unknown import format: {fmt}")
+
+
+def _field_error(row):
+    """Why a value in ``row`` would not fit its column, or None."""
+    User = get_user_model()
+    for model, fields in ((User, ('full_name', 'bio', 'password')), (UserProfile, PROFILE_FIELDS)):
+        for name in fields:
+            value = row.get(name)
+            if value is None:
+                continue
+            if not isinstance(value, str):
+                return f'{name} must be a string'
+            limit = model._meta.get_field(name).max_length
+            if name != 'password' and limit and len(value) > limit:
+                return f'{name} must be at most {limit} characters'
+    return None
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class UserImporter:
+    """
+    Create users, their profiles and settings from a stream of rows with
+    ``bulk_create``, one transaction per batch.
+
+    Passwords are hashed in parallel worker processes. Rows with an invalid
+    email or a value too long for its column are reported as errors, and
+    rows whose email is already taken (in the database or earlier in the
+    same file) are skipped and reported, rather than aborting the import.
+    An email registered after a batch was checked makes that batch's
+    insert fail; it is then retried row by row, so only the taken row is
+    skipped.
+    """
+
+    def __init__(self, batch_size=500, workers=None):
+        self.batch_size = batch_size
+        self.hasher = HashingExecutor(kind='process', max_workers=workers, max_queue_depth=batch_size)
+        self.created = 0
+        self.duplicates = []
+        self.errors = []
+        self.elapsed = 0.0
+        self._seen = set()
+
+    @property
+    def rows_per_second(self):
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+    def report(self):
+        return {
+            'created': self.created,
+            'duplicates': self.duplicates,
+            'errors': self.errors,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+    def run(self, rows):
+        started = time.monotonic()
+        try:
+            for batch in _batches(rows, self.batch_size):
+                self._import_batch(batch)
+                self.elapsed = time.monotonic() - started
+        finally:
+            self.hasher.shutdown()
+        self.elapsed = time.monotonic() - started
+        return self.report()
+
+    def _clean(self, batch):
+        User = get_user_model()
+        cleaned = []
+        for line_no, row in batch:
+            if not isinstance(row, dict):
+                self.errors.append((line_no, 'Invalid row'))
+                continue
+            email = User.objects.normalize_email((row.get('email') or '').strip())
+            if not email:
+                self.errors.append((line_no, 'Missing email'))
+                continue
+            try:
+                User._meta.get_field('email').run_validators(email)
+            except ValidationError:
+                self.errors.append((line_no, 'Invalid email'))
+                continue
+            error = _field_error(row)
+            if error:
+                self.errors.append((line_no, error))
+                continue
+            if email in self._seen:
+                self.duplicates.append(email)
+                continue
+            self._seen.add(email)
+            cleaned.append((email, row))
+
+        taken = set(User.objects.filter(email__in=[email for email, _ in cleaned]).values_list('email', flat=True))
+        self.duplicates.extend(email for email, _ in cleaned if email in taken)
+        return [(email, row) for email, row in cleaned if email not in taken]
+
+    def _import_batch(self, batch):
+        User = get_user_model()
+        rows = self._clean(batch)
+        if not rows:
+            return
+
+        futures = [self.hasher.submit(make_password, row.get('password') or None) for _, row in rows]
+        users = [
+            User(
+                email=email,
+                full_name=(row.get('full_name') or '').strip() or 'Unknown User',
+                bio=row.get('bio') or None,
+                password=future.result(),
+            )
+            for (email, row), future in zip(rows, futures)
+        ]
+
+        try:
+            self._insert(rows, users)
+        except IntegrityError:
+            for row, user in zip(rows, users):
+                user.pk = None
+                try:
+                    self._insert([row], [user])
+                except IntegrityError:
+                    self.duplicates.append(row[0])
+
+    def _insert(self, rows, users):
+        User = get_user_model()
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=self.batch_size)
+            # Not every backend returns primary keys from a bulk insert.
+            ids = dict(User.objects.filter(email__in=[user.email for user in users]).values_list('email', 'pk'))
+            UserProfile.objects.bulk_create([
+                UserProfile(user_id=ids[email], **{field: row.get(field) or '' for field in PROFILE_FIELDS})
+                for email, row in rows
+            ], batch_size=self.batch_size)
+            UserSettings.objects.bulk_create([UserSettings(user_id=ids[email]) for email, _ in rows], batch_size=self.batch_size)
+            # bulk_create skips the post_save handler that indexes skills.
+            sync_skills({ids[email]: row.get('skills') for email, row in rows if row.get('skills')})
+
+        self.created += len(rows)
+
+
+def claim_import_job():
+    """The oldest pending import, marked RUNNING, or None."""
+    with transaction.atomic():
+        job = UserImportJob.objects.select_for_update(skip_locked=True).filter(status='PENDING').first()
+        if job is not None:
+            job.status, job.started_at = 'RUNNING', timezone.now()
+            job.save(update_fields=['status', 'started_at'])
+    return job
+
+
+def run_import_job(job, batch_size=500, workers=None):
+    """
+    Import ``job``'s file and store the report. The upload holds plain-text
+    passwords, so it is deleted once read, whatever the outcome.
+    """
+    try:
+        with job.file.open('rb') as upload:
+            stream = io.TextIOWrapper(upload, encoding='utf-8', newline='')
+            report = UserImporter(batch_size=batch_size, workers=workers).run(read_rows(stream, job.format))
+    except Exception as exc:
+        logger.exception("User import %s failed", job.pk)
+        job.status, job.error = 'FAILED', str(exc)
+    else:
+        job.status, job.report = 'DONE', report
+    job.file.delete(save=False)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'report', 'error', 'file', 'finished_at'])
+    return job
@@ -0,0 +1,120 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Backends whose entries, and so whose invalidations, stay in one process.
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared():
+    """Whether the default cache reaches every worker process."""
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def invalidation_timeout(timeout):
+    """
+    How long to keep an entry that other processes invalidate through the
+    default cache: ``timeout`` (None for no expiry) with a shared cache;
+    otherwise at most ``PROCESS_LOCAL_CACHE_TIMEOUT`` seconds, since other
+    workers' invalidations never arrive.
+    """
+    if cache_is_shared():
+        return timeout
+    limit = getattr(settings, 'PROCESS_LOCAL_CACHE_TIMEOUT', 5)
+    return limit if timeout is None else min(timeout, limit)
+
+
+def invalidate_now_and_on_commit(invalidate, obj_id):
+    """
+    Call ``invalidate(obj_id)`` now and again once the current transaction
+    commits: a request that read the row before the commit may have cached
+    the old copy under the new version stamp meanwhile.
+    """
+    invalidate(obj_id)
+    transaction.on_commit(lambda: invalidate(obj_id))
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU mapping whose entries also expire ``ttl``
+    seconds after they were stored.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class VersionStamps:
+    """
+    Per-object version stamps kept in the shared Django cache.
+
+    Cached copies of an object are tagged with the stamp that was current
+    when they were read from the database, and are only trusted while the
+    stamp still matches. ``invalidate()`` deletes the stamp, so the next
+    reader mints a fresh one; a copy filled concurrently from a
+    pre-invalidation read can never match it.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.timeout = invalidation_timeout(None)
+
+    def key(self, obj_id):
+        return f'{self.prefix}:{obj_id}'
+
+    def get(self, obj_id):
+        return self.get_many([obj_id])[obj_id]
+
+    def get_many(self, obj_ids):
+        keys = {self.key(obj_id): obj_id for obj_id in obj_ids}
+        found = cache.get_many(keys)
+        missing = {key: uuid.uuid4().hex for key in keys if key not in found}
+        if missing:
+            cache.set_many(missing, timeout=self.timeout)
+            found.update(missing)
+        return {keys[key]: stamp for key, stamp in found.items()}
+
+    def invalidate(self, obj_id):
+        cache.delete(self.key(obj_id))
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from .caching import cache_is_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [Warning(
+        'The default cache is local to each process, so cached users, settings, '
+        'group visibility and chat history are only invalidated in the worker '
+        'that made the change. Their cache timeouts are capped at '
+        'PROCESS_LOCAL_CACHE_TIMEOUT (%s seconds), so other workers catch up '
+        'within that.' % getattr(settings, 'PROCESS_LOCAL_CACHE_TIMEOUT', 5),
+        hint='Set CACHE_BACKEND/CACHE_LOCATION to a shared cache, e.g. RedisCache or '
+             'DatabaseCache after `manage.py createcachetable`.',
+        id='users.W001',
+    )]
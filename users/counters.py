@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .authentication import invalidate_user
+
+
+def adjust_counter(user_ids, field, delta):
+    """Atomically add ``delta`` to a stored counter, never going below zero."""
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if not user_ids or not delta:
+        return
+    get_user_model().objects.filter(pk__in=user_ids).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+    for user_id in user_ids:
+        invalidate_user(user_id)
+
+
+def _counts(model_label, user_field, user_ids):
+    from django.apps import apps
+
+    model = apps.get_model(model_label)
+    rows = model.objects.filter(**{f'{user_field}__in': user_ids}).order_by().values(user_field).annotate(n=Count('pk'))
+    return {row[user_field]: row['n'] for row in rows}
+
+
+def _sum(*counts):
+    total = {}
+    for count in counts:
+        for user_id, n in count.items():
+            total[user_id] = total.get(user_id, 0) + n
+    return total
+
+
+# How each stored counter is derived from the source tables; used to repair
+# drift (bulk deletes and cascades do not send the signals that keep the
+# counters current).
+COUNTER_SOURCES = {
+    'groups_joined': lambda ids: _counts('studygroup.GroupMembership', 'user', ids),
+    'resources_shared': lambda ids: _counts('resource.Resource', 'uploaded_by', ids),
+    'sessions_attended': lambda ids: _sum(
+        _counts('users.SessionAttendance', 'user', ids),
+        _counts('dashboard.StudySession_attendees', 'customuser', ids),
+    ),
+}
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class HashingOverloaded(Exception):
+    """
+    ``max_queue_depth`` hashes are already queued or running. Views answer
+    it with a 503; other callers (commands, imports) see it as an error.
+    """
+
+
+def _init_worker():
+    # Spawned (non-forked) worker processes start without Django loaded.
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+class HashingExecutor:
+    """
+    Runs password hashing on a bounded pool of ``max_workers``.
+
+    ``run()`` waits for the hash in the calling thread; ``arun()`` awaits
+    it, so an async caller's event loop keeps serving other connections.
+    At most ``max_queue_depth`` hashes may be queued or running; anything
+    beyond that is rejected with ``HashingOverloaded`` so a login burst
+    sheds load instead of piling up behind PBKDF2.
+    """
+
+    def __init__(self, kind='thread', max_workers=None, max_queue_depth=64):
+        if kind not in ('thread', 'process'):
+            raise ValueError("Hashing executor must be 'thread' or 'process'")
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue_depth = max_queue_depth
+        self._slots = threading.BoundedSemaphore(max_queue_depth)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    if self.kind == 'process':
+                        self._pool = ProcessPoolExecutor(self.max_workers, initializer=_init_worker)
+                    else:
+                        self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='password-hashing')
+        return self._pool
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingOverloaded()
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    async def arun(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+_config = getattr(settings, 'PASSWORD_HASHING', {})
+executor = HashingExecutor(
+    kind=_config.get('EXECUTOR', 'thread'),
+    max_workers=_config.get('MAX_WORKERS'),
+    max_queue_depth=_config.get('MAX_QUEUE_DEPTH', 64),
+)
+
+
+def hash_password(raw_password):
+    return executor.run(hashers.make_password, raw_password)
+
+
+async def ahash_password(raw_password):
+    return await executor.arun(hashers.make_password, raw_password)
+
+
+def set_password(user, raw_password):
+    """Equivalent of ``user.set_password()`` that hashes on the executor."""
+    user.password = hash_password(raw_password)
+    user._password = raw_password
+
+
+async def aset_password(user, raw_password):
+    user.password = await ahash_password(raw_password)
+    user._password = raw_password
+
+
+def _verify_and_rehash(raw_password, encoded):
+    # One job, and so one queue slot, for the check and any re-hash that
+    # the check calls for.
+    is_correct, must_update = hashers.verify_password(raw_password, encoded)
+    return is_correct, hashers.make_password(raw_password) if is_correct and must_update else None
+
+
+def check_password(user, raw_password):
+    """
+    Equivalent of ``user.check_password()`` that hashes on the executor.
+
+    ``user`` may be None, in which case a dummy hash is still computed so
+    unknown emails take as long to reject as wrong passwords.
+    """
+    is_correct, upgraded = executor.run(_verify_and_rehash, raw_password, _encoded(user))
+    if upgraded is not None:
+        user.password = upgraded
+        user.save(update_fields=['password'])
+    return is_correct
+
+
+async def acheck_password(user, raw_password):
+    is_correct, upgraded = await executor.arun(_verify_and_rehash, raw_password, _encoded(user))
+    if upgraded is not None:
+        user.password = upgraded
+        await sync_to_async(user.save)(update_fields=['password'])
+    return is_correct
+
+
+def _encoded(user):
+    # An unusable hash makes verify_password() hash a dummy password.
+    return user.password if user is not None else hashers.UNUSABLE_PASSWORD_PREFIX
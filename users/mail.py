@@ -0,0 +1,110 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'MAIL_OUTBOX', {})
+BATCH_SIZE = _config.get('BATCH_SIZE', 50)
+MAX_PER_MINUTE = _config.get('MAX_PER_MINUTE', 60)
+MAX_ATTEMPTS = _config.get('MAX_ATTEMPTS', 5)
+RETRY_BACKOFF = _config.get('RETRY_BACKOFF', 30)
+# How long a claimed message stays invisible to other workers. If the worker
+# dies mid-batch, the message becomes due again once the lease runs out.
+CLAIM_LEASE = timedelta(minutes=5)
+# How long sent and failed messages are kept before prune_auth_tokens deletes them.
+RETENTION = timedelta(seconds=_config.get('RETENTION', 24 * 60 * 60))
+
+
+def enqueue_mail(subject, message, recipient_list, from_email=None):
+    """Queue a message in the outbox; ``send_queued_mail`` delivers it."""
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipient_list),
+    )
+
+
+def _claim(limit):
+    now = timezone.now()
+    with transaction.atomic():
+        due = OutgoingEmail.objects.select_for_update(skip_locked=True).filter(
+            status='PENDING', next_attempt_at__lte=now
+        ).order_by('next_attempt_at')
+        messages = list(due[:limit])
+        OutgoingEmail.objects.filter(pk__in=[m.pk for m in messages]).update(next_attempt_at=now + CLAIM_LEASE)
+    return messages
+
+
+def _sent_last_minute():
+    return OutgoingEmail.objects.filter(sent_at__gte=timezone.now() - timedelta(minutes=1)).count()
+
+
+def drain_outbox(batch_size=BATCH_SIZE, max_per_minute=MAX_PER_MINUTE, backend=None):
+    """
+    Send one batch of due messages over a single mail connection.
+
+    Failed messages are retried with exponential backoff and marked FAILED
+    after ``MAX_ATTEMPTS``. Returns ``(sent, failed)`` for the batch.
+    """
+    limit = batch_size
+    if max_per_minute:
+        limit = min(limit, max(0, max_per_minute - _sent_last_minute()))
+    if not limit:
+        return 0, 0
+    messages = _claim(limit)
+    if not messages:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection(backend)
+    pending = list(messages)
+    try:
+        while pending:
+            try:
+                connection.open()
+            except Exception as exc:
+                # The server is unreachable; back the rest of the batch off.
+                for outgoing in pending:
+                    _record_failure(outgoing, exc)
+                failed += len(pending)
+                break
+
+            outgoing = pending.pop(0)
+            email = EmailMessage(
+                outgoing.subject, outgoing.body, outgoing.from_email, outgoing.recipients,
+                connection=connection,
+            )
+            try:
+                email.send()
+            except Exception as exc:
+                failed += 1
+                _record_failure(outgoing, exc)
+                # The SMTP session may be unusable after an error; the next
+                # message starts a fresh one.
+                connection.close()
+            else:
+                sent += 1
+                OutgoingEmail.objects.filter(pk=outgoing.pk).update(
+                    status='SENT', sent_at=timezone.now(), attempts=outgoing.attempts + 1, last_error=''
+                )
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def _record_failure(outgoing, exc):
+    attempts = outgoing.attempts + 1
+    logger.warning("Sending mail %s failed (attempt %d): %s", outgoing.pk, attempts, exc)
+    if attempts >= MAX_ATTEMPTS:
+        changes = {'status': 'FAILED'}
+    else:
+        changes = {'next_attempt_at': timezone.now() + timedelta(seconds=RETRY_BACKOFF * 2 ** (attempts - 1))}
+    OutgoingEmail.objects.filter(pk=outgoing.pk).update(attempts=attempts, last_error=str(exc), **changes)
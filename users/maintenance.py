@@ -0,0 +1,114 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from .authentication import invalidate_user
+from .counters import COUNTER_SOURCES
+from .mail import RETENTION as MAIL_RETENTION
+from .models import OutgoingEmail, PasswordResetToken
+
+
+def delete_in_chunks(queryset, chunk_size=1000, deadline=None):
+    """
+    Delete the rows of ``queryset`` in primary-key order, ``chunk_size`` at a
+    time, each chunk in its own short transaction.
+
+    Walking the keyset (``pk > last seen``) keeps every chunk query cheap no
+    matter how far along the table the prune is, and short transactions
+    keep write locks brief for the requests running alongside. Stops early
+    once ``deadline`` (a ``time.monotonic()`` value) has passed. Returns the
+    number of rows deleted, cascades included.
+    """
+    model = queryset.model
+    last_pk = None
+    deleted = 0
+    while deadline is None or time.monotonic() < deadline:
+        chunk = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        with transaction.atomic():
+            count, _ = model.objects.filter(pk__in=pks).delete()
+        deleted += count
+        last_pk = pks[-1]
+    return deleted
+
+
+def prune_expired_auth_rows(chunk_size=1000, time_budget=None):
+    """
+    Delete expired JWT bookkeeping, spent password-reset tokens and old
+    outbox messages.
+
+    Expired ``OutstandingToken`` rows take their ``BlacklistedToken`` rows
+    with them. Sent and failed ``OutgoingEmail`` rows are kept for
+    ``MAIL_OUTBOX['RETENTION']`` seconds, since they hold password-reset
+    links. Returns ``{label: (rows deleted, seconds)}``; with a
+    ``time_budget`` (seconds) the whole run stops once it is used up, and
+    the next run carries on where the data left off.
+    """
+    now = timezone.now()
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    targets = [
+        ('jwt tokens', OutstandingToken.objects.filter(expires_at__lt=now)),
+        ('password reset tokens', PasswordResetToken.objects.filter(Q(expires_at__lt=now) | Q(is_used=True))),
+        ('outgoing emails', OutgoingEmail.objects.filter(
+            Q(sent_at__lt=now - MAIL_RETENTION) | Q(status='FAILED', created_at__lt=now - MAIL_RETENTION)
+        )),
+    ]
+
+    report = {}
+    for label, queryset in targets:
+        started = time.monotonic()
+        deleted = delete_in_chunks(queryset, chunk_size, deadline)
+        report[label] = (deleted, time.monotonic() - started)
+    return report
+
+
+def reconcile_user_counters(chunk_size=1000, time_budget=None):
+    """
+    Recompute the stored per-user counters from their source tables and
+    fix any that drifted.
+
+    Users are walked in primary-key chunks; each chunk costs one grouped
+    COUNT query per counter plus a single bulk update for the users whose
+    values changed. Returns ``(users checked, users repaired)``.
+    """
+    User = get_user_model()
+    fields = list(COUNTER_SOURCES)
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    last_pk = 0
+    checked = repaired = 0
+
+    while deadline is None or time.monotonic() < deadline:
+        users = list(User.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', *fields)[:chunk_size])
+        if not users:
+            break
+        user_ids = [user.pk for user in users]
+        actual = {field: source(user_ids) for field, source in COUNTER_SOURCES.items()}
+
+        drifted = []
+        for user in users:
+            changed = False
+            for field in fields:
+                value = actual[field].get(user.pk, 0)
+                if getattr(user, field) != value:
+                    setattr(user, field, value)
+                    changed = True
+            if changed:
+                drifted.append(user)
+        if drifted:
+            with transaction.atomic():
+                User.objects.bulk_update(drifted, fields)
+            for user in drifted:
+                invalidate_user(user.pk)
+
+        checked += len(users)
+        repaired += len(drifted)
+        last_pk = user_ids[-1]
+    return checked, repaired
@@ -0,0 +1,52 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand
+
+from users.hashing import HashingExecutor
+
+
+class Command(BaseCommand):
+    help = 'Measure password verifications (logins) per second through the hashing executor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200, help='Number of password checks to run')
+        parser.add_argument('--executor', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--clients', type=int, default=32, help='Concurrent callers submitting checks')
+
+    def handle(self, *args, **options):
+        logins = options['logins']
+        workers = options['workers']
+        encoded = hashers.make_password('correct horse battery staple')
+
+        started = time.perf_counter()
+        for _ in range(min(logins, 20)):
+            hashers.verify_password('correct horse battery staple', encoded)
+        inline_rate = min(logins, 20) / (time.perf_counter() - started)
+        self.stdout.write(f"inline:   {inline_rate:8.1f} logins/s on one request worker")
+
+        executor = HashingExecutor(kind=options['executor'], max_workers=workers, max_queue_depth=logins)
+        # Warm the pool up so process start-up is not part of the measurement.
+        executor.run(hashers.verify_password, 'warm-up', encoded)
+
+        def login(_):
+            return executor.run(hashers.verify_password, 'correct horse battery staple', encoded)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['clients']) as clients:
+            results = list(clients.map(login, range(logins)))
+        elapsed = time.perf_counter() - started
+        executor.shutdown()
+
+        if not all(is_correct for is_correct, _ in results):
+            self.stderr.write('Some password checks failed')
+
+        cores = min(workers, os.cpu_count() or 1)
+        rate = logins / elapsed
+        self.stdout.write(
+            f"{options['executor']:8}: {rate:8.1f} logins/s with {workers} workers "
+            f"({rate / cores:.1f} logins/s per core)"
+        )
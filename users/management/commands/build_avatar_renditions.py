@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+
+from studygroup.models import StudyGroup
+from users.avatars import build_renditions, needs_renditions
+
+
+class Command(BaseCommand):
+    help = 'Generate missing or stale avatar renditions for users and study groups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild renditions that look up to date too')
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        for model in (get_user_model(), StudyGroup):
+            built = failed = 0
+            last_pk = 0
+            while True:
+                chunk = list(
+                    model.objects.exclude(avatar='').exclude(avatar__isnull=True)
+                    .filter(pk__gt=last_pk).order_by('pk')
+                    .only('pk', 'avatar', 'avatar_renditions')[:options['chunk_size']]
+                )
+                if not chunk:
+                    break
+                for instance in chunk:
+                    if options['force'] or needs_renditions(instance):
+                        try:
+                            build_renditions(instance)
+                            built += 1
+                        except Exception as exc:
+                            failed += 1
+                            self.stderr.write(f"{model._meta.label} {instance.pk}: {exc}")
+                last_pk = chunk[-1].pk
+            self.stdout.write(f"{model._meta.verbose_name_plural}: built {built}, failed {failed}")
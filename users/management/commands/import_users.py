@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from users.bulk_import import UserImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create users with profiles and settings from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default=None, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=None, help='Password hashing processes (default: CPU count)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        importer = UserImporter(batch_size=options['batch_size'], workers=options['workers'])
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            report = importer.run(read_rows(stream, fmt))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for email in report['duplicates']:
+            self.stderr.write(f"duplicate email skipped: {email}")
+        for line_no, message in report['errors']:
+            self.stderr.write(f"line {line_no}: {message}")
+        self.stdout.write(
+            f"created {report['created']} users in {report['seconds']}s ({report['rows_per_second']} rows/s), "
+            f"{len(report['duplicates'])} duplicates, {len(report['errors'])} errors"
+        )
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.bulk_import import claim_import_job, run_import_job
+
+
+class Command(BaseCommand):
+    help = 'Run user imports uploaded through the API, oldest first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=None, help='Password hashing processes (default: CPU count)')
+        parser.add_argument('--loop', action='store_true', help='Keep waiting for new imports until interrupted')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait when no import is pending')
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_import_job()
+            if job is not None:
+                run_import_job(job, options['batch_size'], options['workers'])
+                if job.status == 'DONE':
+                    self.stdout.write(
+                        f"import {job.pk}: created {job.report['created']} users, "
+                        f"{len(job.report['duplicates'])} duplicates, {len(job.report['errors'])} errors"
+                    )
+                else:
+                    self.stderr.write(f"import {job.pk} failed: {job.error}")
+            elif not options['loop']:
+                break
+            else:
+                time.sleep(options['interval'])
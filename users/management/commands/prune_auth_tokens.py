@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.maintenance import prune_expired_auth_rows
+
+
+class Command(BaseCommand):
+    help = 'Delete expired JWT outstanding/blacklisted tokens, spent password reset tokens and old outbox mail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows deleted per transaction')
+        parser.add_argument('--time-budget', type=float, default=None, help='Stop after this many seconds')
+        parser.add_argument(
+            '--every', type=float, default=None,
+            help='Keep running and prune again every this many seconds (for use without cron)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            report = prune_expired_auth_rows(options['chunk_size'], options['time_budget'])
+            for label, (deleted, elapsed) in report.items():
+                rate = deleted / elapsed if elapsed else 0
+                self.stdout.write(f"{label}: deleted {deleted} rows in {elapsed:.2f}s ({rate:.0f} rows/s)")
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.maintenance import reconcile_user_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored per-user counters (groups joined, resources shared, sessions attended)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Users checked per batch')
+        parser.add_argument('--time-budget', type=float, default=None, help='Stop after this many seconds')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        checked, repaired = reconcile_user_counters(options['chunk_size'], options['time_budget'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"checked {checked} users, repaired {repaired} in {elapsed:.2f}s")
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import mail
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outgoing email in batches over one mail connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=mail.BATCH_SIZE)
+        parser.add_argument('--max-per-minute', type=int, default=mail.MAX_PER_MINUTE, help='0 for no limit')
+        parser.add_argument('--backend', default=None, help='Email backend to send with instead of EMAIL_BACKEND')
+        parser.add_argument('--loop', action='store_true', help='Keep draining the outbox until interrupted')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait when the outbox is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = mail.drain_outbox(options['batch_size'], options['max_per_minute'], options['backend'])
+            if sent or failed:
+                self.stdout.write(f"sent {sent}, failed {failed}")
+            if not options['loop']:
+                break
+            if sent + failed < options['batch_size']:
+                time.sleep(options['interval'])
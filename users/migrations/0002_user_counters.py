@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-17 01:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    GroupMembership = apps.get_model('studygroup', 'GroupMembership')
+    Resource = apps.get_model('resource', 'Resource')
+
+    memberships = GroupMembership.objects.filter(user=OuterRef('pk')).order_by().values('user').annotate(c=Count('pk')).values('c')
+    resources = Resource.objects.filter(uploaded_by=OuterRef('pk')).order_by().values('uploaded_by').annotate(c=Count('pk')).values('c')
+    CustomUser.objects.update(
+        groups_joined=Coalesce(Subquery(memberships), 0),
+        resources_shared=Coalesce(Subquery(resources), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('studygroup', '0002_initial'),
+        ('resource', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='groups_joined',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='groups joined'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='resources_shared',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='resources shared'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 01:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='tokens_valid_after',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='tokens valid after'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.1.6 on 2026-10-17 01:52
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_skills(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    Skill = apps.get_model('users', 'Skill')
+    UserSkill = apps.get_model('users', 'UserSkill')
+
+    def parse(text):
+        names = (re.sub(r'\s+', ' ', name).strip().lower()[:100] for name in (text or '').split(','))
+        return {name for name in names if name}
+
+    profiles = UserProfile.objects.exclude(skills='').values_list('user_id', 'skills')
+    batch = []
+    for user_id, text in profiles.iterator(chunk_size=2000):
+        batch.append((user_id, parse(text)))
+        if len(batch) >= 2000:
+            _index(Skill, UserSkill, batch)
+            batch = []
+    if batch:
+        _index(Skill, UserSkill, batch)
+
+
+def _index(Skill, UserSkill, batch):
+    names = set().union(*(names for _, names in batch))
+    Skill.objects.bulk_create([Skill(name=name) for name in names], ignore_conflicts=True)
+    ids = dict(Skill.objects.filter(name__in=names).values_list('name', 'pk'))
+    UserSkill.objects.bulk_create([
+        UserSkill(user_id=user_id, skill_id=ids[name]) for user_id, names in batch for name in names
+    ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_avatar_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Skill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='name')),
+            ],
+            options={
+                'verbose_name': 'skill',
+                'verbose_name_plural': 'skills',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserSkill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'user skill',
+                'verbose_name_plural': 'user skills',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['university', 'department'], name='users_userp_univers_268838_idx'),
+        ),
+        migrations.AddField(
+            model_name='userskill',
+            name='skill',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_skills', to='users.skill', verbose_name='skill'),
+        ),
+        migrations.AddField(
+            model_name='userskill',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_skills', to=settings.AUTH_USER_MODEL, verbose_name='user'),
+        ),
+        migrations.AddConstraint(
+            model_name='userskill',
+            constraint=models.UniqueConstraint(fields=('skill', 'user'), name='unique_user_skill'),
+        ),
+        migrations.RunPython(backfill_skills, migrations.RunPython.noop),
+    ]
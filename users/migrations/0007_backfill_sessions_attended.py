@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-17 02:34
+
+from django.db import migrations
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_sessions_attended(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    SessionAttendance = apps.get_model('users', 'SessionAttendance')
+    Attendees = apps.get_model('dashboard', 'StudySession').attendees.through
+
+    attendances = SessionAttendance.objects.filter(user=OuterRef('pk')).order_by().values('user').annotate(c=Count('pk')).values('c')
+    dashboard = Attendees.objects.filter(customuser=OuterRef('pk')).order_by().values('customuser').annotate(c=Count('pk')).values('c')
+    CustomUser.objects.update(
+        sessions_attended=Coalesce(Subquery(attendances, output_field=IntegerField()), 0)
+        + Coalesce(Subquery(dashboard, output_field=IntegerField()), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_skills'),
+        ('dashboard', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_sessions_attended, migrations.RunPython.noop),
+    ]
@@ -5,6 +5,9 @@ from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator
 from django.conf import settings
 
+from .hashing import set_password
+
+
 class CustomUserManager(BaseUserManager):
     
     def create_user(self, email, full_name="Unknown User", password=None, **extra_fields):
@@ -15,7 +18,7 @@ class CustomUserManager(BaseUserManager):
 
         email = self.normalize_email(email)
         user = self.model(email=email, full_name=full_name, **extra_fields)
-        user.set_password(password)
+        set_password(user, password)
         user.save(using=self._db)
 
         
@@ -42,17 +45,21 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(_('email address'), unique=True)
     full_name = models.CharField(_('full name'), max_length=100, default="Unknown User")
     avatar = models.ImageField(_('avatar'), upload_to='avatars/%Y/%m/%d/', null=True, blank=True)
+    avatar_renditions = models.JSONField(_('avatar renditions'), default=dict, blank=True, editable=False)
     bio = models.TextField(_('biography'), blank=True, null=True, max_length=500)
     
     # User stats
     sessions_attended = models.PositiveIntegerField(_('sessions attended'), default=0, validators=[MinValueValidator(0)])
     study_hours = models.PositiveIntegerField(_('study hours'), default=0, validators=[MinValueValidator(0)])
+    groups_joined = models.PositiveIntegerField(_('groups joined'), default=0, editable=False)
+    resources_shared = models.PositiveIntegerField(_('resources shared'), default=0, editable=False)
     
     # User permissions and states
     is_staff = models.BooleanField(_('staff status'), default=False)
     is_active = models.BooleanField(_('active'), default=True)
     date_joined = models.DateTimeField(_('date joined'), default=timezone.now)
     last_active = models.DateTimeField(_('last active'), auto_now=True)
+    tokens_valid_after = models.DateTimeField(_('tokens valid after'), null=True, blank=True, editable=False)
 
     # Required fields for user login
     USERNAME_FIELD = 'email'
@@ -72,9 +79,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         return self.full_name.split()[0] if self.full_name else self.email
     @property
     def settings_safe(self):
-        from users.models import Settings
-        settings, created = Settings.objects.get_or_create(user=self)
-        return settings
+        """Return this user's UserSettings through the settings cache."""
+        from .preferences import get_user_settings
+        return get_user_settings(self.pk)
 
 
 class UserProfile(models.Model):
@@ -92,11 +99,45 @@ class UserProfile(models.Model):
     class Meta:
         verbose_name = _('user profile')
         verbose_name_plural = _('user profiles')
+        indexes = [
+            models.Index(fields=['university', 'department']),
+        ]
 
     def __str__(self):
         return f"Profile of {self.user.full_name}"
 
 
+class Skill(models.Model):
+    """Normalized skill vocabulary; ``name`` is lowercased and whitespace-collapsed."""
+
+    name = models.CharField(_('name'), max_length=100, unique=True)
+
+    class Meta:
+        verbose_name = _('skill')
+        verbose_name_plural = _('skills')
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class UserSkill(models.Model):
+    """Index of ``UserProfile.skills``, kept in sync on profile save."""
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='user_skills', verbose_name=_('user'))
+    skill = models.ForeignKey(Skill, on_delete=models.CASCADE, related_name='user_skills', verbose_name=_('skill'))
+
+    class Meta:
+        verbose_name = _('user skill')
+        verbose_name_plural = _('user skills')
+        constraints = [
+            models.UniqueConstraint(fields=['skill', 'user'], name='unique_user_skill'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.skill_id}"
+
+
 class Group(models.Model):
     
     name = models.CharField(_('group name'), max_length=255)
@@ -232,7 +273,76 @@ class PasswordResetToken(models.Model):
         return f"Password reset token for {self.user.email}"
     def is_valid(self):
         return not self.is_used and timezone.now() < self.expires_at
-    
+
+
+class OutgoingEmail(models.Model):
+
+    STATUS_CHOICES = [
+        ('PENDING', _('Pending')),
+        ('SENT', _('Sent')),
+        ('FAILED', _('Failed')),
+    ]
+
+    subject = models.CharField(_('subject'), max_length=255)
+    body = models.TextField(_('body'))
+    from_email = models.CharField(_('from email'), max_length=254)
+    recipients = models.JSONField(_('recipients'), default=list)
+    status = models.CharField(_('status'), max_length=7, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(_('attempts'), default=0)
+    next_attempt_at = models.DateTimeField(_('next attempt at'), default=timezone.now)
+    last_error = models.TextField(_('last error'), blank=True)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    sent_at = models.DateTimeField(_('sent at'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('outgoing email')
+        verbose_name_plural = _('outgoing emails')
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['sent_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} ({self.status})"
+
+
+class UserImportJob(models.Model):
+    """An uploaded user import, run by ``manage.py process_user_imports``."""
+
+    STATUS_CHOICES = [
+        ('PENDING', _('Pending')),
+        ('RUNNING', _('Running')),
+        ('DONE', _('Done')),
+        ('FAILED', _('Failed')),
+    ]
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    ]
+
+    file = models.FileField(_('file'), upload_to='user_imports/', blank=True)
+    format = models.CharField(_('format'), max_length=6, choices=FORMAT_CHOICES)
+    status = models.CharField(_('status'), max_length=7, choices=STATUS_CHOICES, default='PENDING')
+    report = models.JSONField(_('report'), null=True, blank=True)
+    error = models.TextField(_('error'), blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+', verbose_name=_('created by')
+    )
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    started_at = models.DateTimeField(_('started at'), null=True, blank=True)
+    finished_at = models.DateTimeField(_('finished at'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('user import job')
+        verbose_name_plural = _('user import jobs')
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Import {self.pk} ({self.status})"
 
 
 
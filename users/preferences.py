@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import VersionStamps, invalidation_timeout
+from .models import UserSettings
+
+CACHE_TIMEOUT = invalidation_timeout(getattr(settings, 'USER_SETTINGS_CACHE_TIMEOUT', 3600))
+
+_versions = VersionStamps('user-settings-version')
+_field_names = [field.attname for field in UserSettings._meta.concrete_fields]
+
+
+def _key(user_id):
+    return f'user-settings:{user_id}'
+
+
+def _load(values):
+    return UserSettings.from_db('default', _field_names, values)
+
+
+def get_many(user_ids):
+    """
+    Return ``{user_id: UserSettings}`` for ``user_ids``.
+
+    Cached entries are served as-is; the rest are read with one query (rows
+    missing for any user are created in one bulk insert) and written back to
+    the cache. The returned instances can be saved like any other.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+    versions = _versions.get_many(user_ids)
+    cached = cache.get_many([_key(user_id) for user_id in user_ids])
+
+    result = {}
+    for user_id in user_ids:
+        entry = cached.get(_key(user_id))
+        if entry is not None and entry[0] == versions[user_id]:
+            result[user_id] = _load(entry[1])
+
+    missing = [user_id for user_id in user_ids if user_id not in result]
+    if missing:
+        rows = {row.user_id: row for row in UserSettings.objects.filter(user_id__in=missing)}
+        absent = [user_id for user_id in missing if user_id not in rows]
+        if absent:
+            UserSettings.objects.bulk_create([UserSettings(user_id=user_id) for user_id in absent], ignore_conflicts=True)
+            rows.update((row.user_id, row) for row in UserSettings.objects.filter(user_id__in=absent))
+
+        cache.set_many({
+            _key(user_id): (versions[user_id], [getattr(row, name) for name in _field_names])
+            for user_id, row in rows.items()
+        }, CACHE_TIMEOUT)
+        result.update(rows)
+    return result
+
+
+def get_user_settings(user_id):
+    return get_many([user_id])[user_id]
+
+
+def invalidate(user_id):
+    _versions.invalidate(user_id)
@@ -1,10 +1,14 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import PasswordResetToken,UserSettings
-from rest_framework_simplejwt.tokens import RefreshToken
+from .models import PasswordResetToken, UserImportJob, UserSettings
+from .hashing import check_password, set_password
+from .avatars import rendition_urls, sanitize_image
+from .tokens import RefreshToken, is_revoked_by_watermark
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
-from resource.models import Resource
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 
 User = get_user_model()
 
@@ -22,11 +26,14 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             raise ValidationError("Passwords do not match.")
         return data
 
+    def validate_avatar(self, value):
+        return sanitize_image(value) if value else value
+
     def create(self, validated_data):
         validated_data.pop('confirm_password')
         password = validated_data.pop('password')
         user = User(**validated_data)
-        user.set_password(password)
+        set_password(user, password)
         user.save()
         return user
 
@@ -38,8 +45,11 @@ class UserLoginSerializer(serializers.Serializer):
         email = data.get("email")
         password = data.get("password")
         
-        user = User.objects.filter(email=email).first()
-        if not user or not user.check_password(password):
+        try:
+            user = User.objects.get(email=email)
+        except User.DoesNotExist:
+            user = None
+        if not check_password(user, password):
             raise serializers.ValidationError("Invalid email or password.")
         
         data['user'] = user
@@ -48,19 +58,41 @@ class UserLoginSerializer(serializers.Serializer):
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
-    resources_shared = serializers.SerializerMethodField()
-    
+    sessions_attended = serializers.IntegerField(read_only=True)
+    resources_shared = serializers.IntegerField(read_only=True)
+    avatar_renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = User  
         fields = (
-            'id', 'email', 'full_name', 'bio', 'avatar', 
+            'id', 'email', 'full_name', 'bio', 'avatar', 'avatar_renditions',
             'study_hours', 'sessions_attended', 'resources_shared'
         )
         read_only_fields = ('id', 'email')  
-    
-    def get_resources_shared(self, obj):
-        # Calculate the number of resources uploaded by the user
-        return Resource.objects.filter(uploaded_by=obj).count()
+
+    def validate_avatar(self, value):
+        return sanitize_image(value) if value else value
+
+    def update(self, instance, validated_data):
+        # Only the submitted columns: ``instance`` may be the cached
+        # request.user, whose counters can be behind the stored ones.
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
+    def get_avatar_renditions(self, obj):
+        return rendition_urls(obj, self.context.get('request'))
+
+
+class SkillMatchSerializer(serializers.ModelSerializer):
+    university = serializers.CharField(source='profile.university', default='', read_only=True)
+    department = serializers.CharField(source='profile.department', default='', read_only=True)
+    skills = serializers.CharField(source='profile.skills', default='', read_only=True)
+
+    class Meta:
+        model = User
+        fields = ('id', 'full_name', 'avatar', 'university', 'department', 'skills')
 
 
 class PasswordResetRequestSerializer(serializers.Serializer):
@@ -94,8 +126,70 @@ class LogoutSerializer(serializers.Serializer):
 
 
 
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    """
+    Refresh serializer that loads the user once (so the global-logout
+    watermark is read fresh, not from the authentication cache), rejects
+    tokens issued before a global logout and checks the blacklist through
+    the in-memory filter. A rotated token is claimed in the database, so
+    it cannot be used again on any worker; on that path the filter only
+    rejects known-blacklisted tokens early, since the claim's writes are
+    the authoritative check and cannot be skipped.
+    """
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM, None)
+        try:
+            user = User.objects.get(**{api_settings.USER_ID_FIELD: user_id}) if user_id else None
+        except User.DoesNotExist:
+            user = None
+        if user_id and (
+            not api_settings.USER_AUTHENTICATION_RULE(user) or is_revoked_by_watermark(user, refresh)
+        ):
+            raise AuthenticationFailed(
+                self.error_messages['no_active_account'],
+                'no_active_account',
+            )
+
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            refresh.claim()
+        else:
+            refresh.check_blacklist(exact=True)
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+
+            data['refresh'] = str(refresh)
+
+        return data
+
+
 class UserSettingsSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserSettings
         fields = '__all__'
         read_only_fields = ['user']
+
+
+class UserImportUploadSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    format = serializers.ChoiceField(
+        choices=['csv', 'ndjson'], required=False,
+        help_text='Defaults to ndjson for .ndjson/.jsonl uploads, csv otherwise',
+    )
+
+
+class UserImportJobSerializer(serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='user-bulk-import-job')
+
+    class Meta:
+        model = UserImportJob
+        fields = ('id', 'url', 'format', 'status', 'report', 'error', 'created_at', 'started_at', 'finished_at')
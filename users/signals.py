@@ -1,9 +1,71 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.conf import settings
-from .models import UserSettings
+from .models import UserProfile, UserSettings
+from .authentication import invalidate_user
+from .caching import invalidate_now_and_on_commit
+from . import preferences
+from .counters import adjust_counter
+from .avatars import schedule_renditions
+from .skills import sync_skills
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_user_settings(sender, instance, created, **kwargs):
     if created:
         UserSettings.objects.create(user=instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_now_and_on_commit(invalidate_user, instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def build_avatar_renditions(sender, instance, **kwargs):
+    schedule_renditions(instance)
+
+
+@receiver(post_save, sender=UserProfile)
+def index_profile_skills(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'skills' in update_fields:
+        sync_skills({instance.user_id: instance.skills})
+
+
+@receiver(post_save, sender=UserSettings)
+@receiver(post_delete, sender=UserSettings)
+def invalidate_cached_settings(sender, instance, **kwargs):
+    invalidate_now_and_on_commit(preferences.invalidate, instance.user_id)
+
+
+@receiver(post_save, sender='studygroup.GroupMembership')
+def count_joined_group(sender, instance, created, **kwargs):
+    if created:
+        adjust_counter([instance.user_id], 'groups_joined', 1)
+
+
+@receiver(post_delete, sender='studygroup.GroupMembership')
+def count_left_group(sender, instance, **kwargs):
+    adjust_counter([instance.user_id], 'groups_joined', -1)
+
+
+@receiver(post_save, sender='resource.Resource')
+def count_shared_resource(sender, instance, created, **kwargs):
+    if created:
+        adjust_counter([instance.uploaded_by_id], 'resources_shared', 1)
+
+
+@receiver(post_delete, sender='resource.Resource')
+def count_removed_resource(sender, instance, **kwargs):
+    adjust_counter([instance.uploaded_by_id], 'resources_shared', -1)
+
+
+@receiver(post_save, sender='users.SessionAttendance')
+def count_attended_session(sender, instance, created, **kwargs):
+    if created:
+        adjust_counter([instance.user_id], 'sessions_attended', 1)
+
+
+@receiver(post_delete, sender='users.SessionAttendance')
+def count_removed_attendance(sender, instance, **kwargs):
+    adjust_counter([instance.user_id], 'sessions_attended', -1)
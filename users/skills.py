@@ -0,0 +1,80 @@
+import re
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Skill, UserSkill
+
+MAX_SKILL_LENGTH = Skill._meta.get_field('name').max_length
+
+
+def normalize_skill(name):
+    return re.sub(r'\s+', ' ', name).strip().lower()[:MAX_SKILL_LENGTH]
+
+
+def parse_skills(text):
+    """Split a comma-separated skills string into a set of normalized names."""
+    return {skill for skill in map(normalize_skill, (text or '').split(',')) if skill}
+
+
+def _skill_ids(names, create=False):
+    if not names:
+        return {}
+    if create:
+        Skill.objects.bulk_create([Skill(name=name) for name in names], ignore_conflicts=True)
+    return dict(Skill.objects.filter(name__in=names).order_by().values_list('name', 'pk'))
+
+
+def sync_skills(skills_by_user):
+    """
+    Bring ``UserSkill`` in line with ``{user_id: skills text}``.
+
+    Only the difference from the current index is written, so re-saving an
+    unchanged profile costs a single read.
+    """
+    wanted = {user_id: parse_skills(text) for user_id, text in skills_by_user.items()}
+    current = {user_id: {} for user_id in wanted}
+    for pk, user_id, name in UserSkill.objects.filter(user_id__in=list(wanted)).values_list('pk', 'user_id', 'skill__name'):
+        current[user_id][name] = pk
+
+    stale = [pk for user_id, names in current.items() for name, pk in names.items() if name not in wanted[user_id]]
+    missing = {user_id: names - current[user_id].keys() for user_id, names in wanted.items()}
+    if not stale and not any(missing.values()):
+        return
+
+    with transaction.atomic():
+        if stale:
+            UserSkill.objects.filter(pk__in=stale).delete()
+        ids = _skill_ids(set().union(*missing.values()), create=True)
+        UserSkill.objects.bulk_create([
+            UserSkill(user_id=user_id, skill_id=ids[name])
+            for user_id, names in missing.items() for name in names
+        ], ignore_conflicts=True)
+
+
+def users_with_skills(skills, match='all', university=None, department=None):
+    """
+    A ``user_id`` subquery of users with all (or any) of ``skills``,
+    optionally limited to a university and department, for use as
+    ``pk__in``.
+
+    ``UserSkill`` is read through its ``(skill, user)`` index and grouped
+    by user; with ``match='all'`` only users with every skill are kept
+    (``HAVING COUNT = n``). The university filter joins the profile on its
+    ``(university, department)`` index, so filtering, ordering and paging
+    all happen in the database.
+    """
+    names = {normalize_skill(skill) for skill in skills} - {''}
+    skill_ids = _skill_ids(names)
+    if not skill_ids or (match == 'all' and len(skill_ids) < len(names)):
+        return UserSkill.objects.none().values('user_id')
+
+    rows = UserSkill.objects.filter(skill_id__in=list(skill_ids.values()))
+    if university:
+        rows = rows.filter(user__profile__university=university)
+        if department:
+            rows = rows.filter(user__profile__department=department)
+    rows = rows.order_by().values('user_id')
+    if match == 'all':
+        return rows.annotate(matched=Count('skill_id')).filter(matched=len(skill_ids)).values('user_id')
+    return rows.distinct()
@@ -1,3 +1,559 @@
-from django.test import TestCase
+import importlib
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core import mail as django_mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from dashboard.models import StudyGroup as DashboardGroup, StudySession as DashboardSession
+from . import authentication, mail, preferences
+from .activity import CoalescingBuffer, _write_last_active
+from .authentication import CachedJWTAuthentication
+from .checks import check_shared_cache
+from .avatars import build_renditions
+from .skills import users_with_skills
+from .bulk_import import UserImporter
+from .hashing import HashingOverloaded, acheck_password, check_password, executor
+from .models import OutgoingEmail, UserImportJob
+from .tokens import BlacklistFilter, RefreshToken, blacklist_filter
+
+User = get_user_model()
+
+
+class LastActiveBufferTests(TestCase):
+    """Buffered last_active writes never move the timestamp backwards."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        # Flushed by hand: the background flusher would write from another
+        # connection while the test transaction holds the table.
+        self.buffer = CoalescingBuffer(_write_last_active, interval=3600)
+        self.addCleanup(self.buffer.stop)
+
+    def test_flush_keeps_newer_saved_value(self):
+        stale = timezone.now() - timedelta(minutes=5)
+        self.buffer.add(self.user.pk, stale)
+        self.user.save()  # auto_now stores a later timestamp
+        saved = User.objects.get(pk=self.user.pk).last_active
+        self.buffer.flush()
+        self.assertEqual(User.objects.get(pk=self.user.pk).last_active, saved)
+
+        newer = timezone.now() + timedelta(minutes=5)
+        self.buffer.add(self.user.pk, newer)
+        self.buffer.flush()
+        self.assertEqual(User.objects.get(pk=self.user.pk).last_active, newer)
+
+    def test_flush_is_one_update(self):
+        other = User.objects.create_user(email='other@example.com', full_name='Other', password='pw-123456')
+        later = timezone.now() + timedelta(minutes=5)
+        self.buffer.add(self.user.pk, later)
+        self.buffer.add(other.pk, later + timedelta(seconds=1))
+        with CaptureQueriesContext(connection) as ctx:
+            _write_last_active(self.buffer._pending)
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in ctx.captured_queries), 1)
+        self.assertEqual(
+            list(User.objects.order_by('pk').values_list('last_active', flat=True)),
+            [later, later + timedelta(seconds=1)],
+        )
+
+
+class PasswordHashingTests(TestCase):
+    def test_outdated_hash_is_upgraded_in_one_job(self):
+        user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        user.password = PBKDF2PasswordHasher().encode('pw-123456', 'saltsaltsalt', iterations=1000)
+        user.save(update_fields=['password'])
+
+        with mock.patch.object(executor, 'submit', wraps=executor.submit) as submit:
+            self.assertTrue(check_password(user, 'pw-123456'))
+        self.assertEqual(submit.call_count, 1)
+        stored = User.objects.get(pk=user.pk).password
+        self.assertNotIn('$1000$', stored)
+        self.assertTrue(check_password(User.objects.get(pk=user.pk), 'pw-123456'))
+        self.assertFalse(check_password(None, 'pw-123456'))
+
+    async def test_async_check_awaits_the_pool(self):
+        user = await sync_to_async(User.objects.create_user)(
+            email='member@example.com', full_name='Member', password='pw-123456'
+        )
+        self.assertTrue(await acheck_password(user, 'pw-123456'))
+        self.assertFalse(await acheck_password(None, 'pw-123456'))
+
+    def test_full_pool_is_a_503_only_in_views(self):
+        with mock.patch.object(executor, 'submit', side_effect=HashingOverloaded()):
+            response = APIClient().post(reverse('login'), {'email': 'member@example.com', 'password': 'pw-123456'})
+            self.assertEqual(response.status_code, 503)
+            with self.assertRaises(HashingOverloaded):
+                User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    """Cached users are dropped in every process through their version stamp."""
+
+    def setUp(self):
+        cache.clear()
+        authentication._users.clear()
+        self.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        self.token = AccessToken.for_user(self.user)
+        self.auth = CachedJWTAuthentication()
+
+    def test_user_is_served_from_cache(self):
+        self.auth.get_user(self.token)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.auth.get_user(self.token).pk, self.user.pk)
+
+    def test_deactivation_invalidates(self):
+        self.auth.get_user(self.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.get_user(self.token)
+
+    def test_stamp_dropped_by_another_process_invalidates(self):
+        self.auth.get_user(self.token)
+        # Another worker deactivated the user: the row changed and the
+        # shared stamp is gone, but this process still holds its entry.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        authentication._versions.invalidate(self.user.pk)
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.get_user(self.token)
+
+    def test_deletion_invalidates(self):
+        self.auth.get_user(self.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.get_user(self.token)
+
+
+class RefreshTokenRevocationTests(TestCase):
+    """Rotated, logged-out and globally revoked refresh tokens stay dead on every worker."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post(reverse('token_refresh'), {'refresh': str(token)}, format='json')
+
+    def test_rotated_token_is_rejected_even_if_the_filter_missed_it(self):
+        token = RefreshToken.for_user(self.user)
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('refresh', response.json())
+        # Another worker whose filter has not pulled the blacklist row yet.
+        with mock.patch.object(blacklist_filter, 'contains', return_value=False):
+            self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertEqual(self.refresh(response.json()['refresh']).status_code, 200)
+
+    def test_logout_blacklists_token(self):
+        token = RefreshToken.for_user(self.user)
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('logout'), {'refresh_token': str(token)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_logout_all_revokes_refresh_and_access_tokens(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.assertEqual(self.client.get(reverse('user-settings')).status_code, 200)  # cache the user
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('logout-all')).status_code, 200)
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+        self.assertEqual(self.client.get(reverse('user-settings')).status_code, 401)
+
+
+class BlacklistFilterTests(TestCase):
+    """The filter pulls the blacklist without blocking lookups in other threads."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        self.filter = BlacklistFilter(capacity=1000, refresh_interval=3600)
+
+    def test_rebuild_runs_outside_the_lock(self):
+        token = RefreshToken.for_user(self.user)
+        token.blacklist()
+        rebuild = self.filter._rebuild
+
+        def unlocked_rebuild():
+            self.assertFalse(self.filter._lock.locked())
+            return rebuild()
+
+        with mock.patch.object(self.filter, '_rebuild', side_effect=unlocked_rebuild):
+            self.assertTrue(self.filter.contains(token['jti']))
+        self.assertFalse(self.filter.contains('never-issued'))
+
+    def test_tokens_blacklisted_during_a_rebuild_survive_the_swap(self):
+        rebuild = self.filter._rebuild
+
+        def racing_rebuild():
+            result = rebuild()
+            token = RefreshToken.for_user(self.user)
+            token.blacklist()
+            self.filter.add(token['jti'])
+            self.raced = token['jti']
+            return result
+
+        with mock.patch.object(self.filter, '_rebuild', side_effect=racing_rebuild):
+            self.filter._sync()
+        self.assertIn(self.raced, self.filter._bloom)
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionResetError('connection reset by peer')
+
+
+class MailOutboxTests(TestCase):
+    """The outbox delivers over the configured backend and backs off on failure."""
+
+    def queue(self, count):
+        for i in range(count):
+            mail.enqueue_mail(f'Subject {i}', 'Body', [f'user{i}@example.com'])
+
+    def test_enqueue_and_send(self):
+        self.queue(3)
+        self.assertEqual(django_mail.outbox, [])
+        self.assertEqual(mail.drain_outbox(max_per_minute=0), (3, 0))
+        self.assertEqual([m.subject for m in django_mail.outbox], ['Subject 0', 'Subject 1', 'Subject 2'])
+        self.assertEqual(set(OutgoingEmail.objects.values_list('status', 'attempts')), {('SENT', 1)})
+        self.assertEqual(mail.drain_outbox(), (0, 0))
+
+    def test_rate_limit(self):
+        self.queue(3)
+        self.assertEqual(mail.drain_outbox(max_per_minute=2), (2, 0))
+        self.assertEqual(mail.drain_outbox(max_per_minute=2), (0, 0))
+
+    def test_retry_backoff_then_failure(self):
+        self.enterContext(self.assertLogs('users.mail', 'WARNING'))
+        self.queue(1)
+        backend = 'users.tests.FailingBackend'
+        self.assertEqual(mail.drain_outbox(backend=backend), (0, 1))
+        outgoing = OutgoingEmail.objects.get()
+        self.assertEqual((outgoing.status, outgoing.attempts), ('PENDING', 1))
+        self.assertIn('connection reset', outgoing.last_error)
+        self.assertAlmostEqual(
+            (outgoing.next_attempt_at - timezone.now()).total_seconds(), mail.RETRY_BACKOFF, delta=5
+        )
+        self.assertEqual(mail.drain_outbox(backend=backend), (0, 0))  # not due yet
+
+        for attempt in range(2, mail.MAX_ATTEMPTS + 1):
+            OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(mail.drain_outbox(backend=backend), (0, 1))
+        outgoing.refresh_from_db()
+        self.assertEqual((outgoing.status, outgoing.attempts), ('FAILED', mail.MAX_ATTEMPTS))
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(mail.drain_outbox(), (0, 0))
+
+    def test_smtp_batch_uses_one_connection(self):
+        self.queue(3)
+        with mock.patch('smtplib.SMTP') as smtp:
+            smtp.return_value.sendmail.return_value = {}
+            self.assertEqual(mail.drain_outbox(backend='django.core.mail.backends.smtp.EmailBackend'), (3, 0))
+        self.assertEqual(smtp.call_count, 1)
+        self.assertEqual(smtp.return_value.sendmail.call_count, 3)
+
+    def test_unreachable_smtp_server_backs_off_batch(self):
+        self.queue(2)
+        with self.assertLogs('users.mail', 'WARNING'), \
+                mock.patch('smtplib.SMTP', side_effect=ConnectionRefusedError('refused')):
+            self.assertEqual(mail.drain_outbox(backend='django.core.mail.backends.smtp.EmailBackend'), (0, 2))
+        self.assertEqual(set(OutgoingEmail.objects.values_list('status', 'attempts')), {('PENDING', 1)})
+
+    def test_command_with_console_backend(self):
+        self.queue(1)
+        with mock.patch('sys.stdout') as stdout:
+            call_command('send_queued_mail', backend='django.core.mail.backends.console.EmailBackend', stdout=stdout)
+        written = ''.join(str(call.args[0]) for call in stdout.write.call_args_list)
+        self.assertIn('Subject: Subject 0', written)
+        self.assertIn('sent 1, failed 0', written)
+
+
+class UserSettingsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+
+    def test_copy_cached_before_commit_is_dropped(self):
+        settings_obj = preferences.get_user_settings(self.user.pk)
+        stale = [getattr(settings_obj, name) for name in preferences._field_names]
+        with self.captureOnCommitCallbacks(execute=True):
+            settings_obj.email_notifications = False
+            settings_obj.save()
+            # A request on another worker read the row before the commit
+            # and cached it under the fresh stamp.
+            stamp = preferences._versions.get(self.user.pk)
+            cache.set(preferences._key(self.user.pk), (stamp, stale))
+        self.assertFalse(preferences.get_user_settings(self.user.pk).email_notifications)
+
+
+class SharedCacheCheckTests(TestCase):
+    @override_settings(PROCESS_LOCAL_CACHE_TIMEOUT=7)
+    def test_warning_names_the_timeout_cap(self):
+        [warning] = check_shared_cache(None)
+        self.assertEqual(warning.id, 'users.W001')
+        self.assertIn('PROCESS_LOCAL_CACHE_TIMEOUT (7 seconds)', warning.msg)
+
+
+class SessionsAttendedCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+        group = DashboardGroup.objects.create(name='Group', subject='Maths', description='d')
+        session = DashboardSession.objects.create(
+            title='Session', group=group, start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1)
+        )
+        session.attendees.add(self.user)
+
+    def test_profile_cannot_write_counter(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.patch(reverse('user-profile'), {'sessions_attended': 99}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # self.user (the request's user) still holds 0, and must not be saved back.
+        self.assertEqual(User.objects.get(pk=self.user.pk).sessions_attended, 1)
+
+    def test_migration_backfills_counter(self):
+        User.objects.update(sessions_attended=0)
+        migration = importlib.import_module('users.migrations.0007_backfill_sessions_attended')
+        migration.populate_sessions_attended(apps, None)
+        self.assertEqual(User.objects.get(pk=self.user.pk).sessions_attended, 1)
+
+
+class MaintenanceCommandTests(TestCase):
+    """Pruning walks expired rows in chunks and both commands respect their time budget."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+
+    def expired_tokens(self, count):
+        for _ in range(count):
+            RefreshToken.for_user(self.user).blacklist()
+        OutstandingToken.objects.update(expires_at=timezone.now() - timedelta(days=1))
+
+    def test_prune_deletes_in_chunks(self):
+        self.expired_tokens(5)
+        live = RefreshToken.for_user(self.user)
+        old = timezone.now() - mail.RETENTION - timedelta(hours=1)
+        sent = mail.enqueue_mail('Reset', 'link', ['member@example.com'])
+        OutgoingEmail.objects.filter(pk=sent.pk).update(status='SENT', sent_at=old)
+        pending = mail.enqueue_mail('Reset', 'link', ['member@example.com'])
+        OutgoingEmail.objects.filter(pk=pending.pk).update(created_at=old)
+
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('prune_auth_tokens', chunk_size=2, stdout=out)
+        outstanding = OutstandingToken._meta.db_table
+        deletes = [q for q in queries if q['sql'].startswith(f'DELETE FROM "{outstanding}"')]
+        self.assertEqual(len(deletes), 3)
+        self.assertIn('jwt tokens: deleted 10 rows', out.getvalue())  # with their blacklist rows
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']])
+        self.assertEqual(list(OutgoingEmail.objects.values_list('pk', flat=True)), [pending.pk])
+
+    def test_zero_budget_stops_before_the_first_chunk(self):
+        self.expired_tokens(2)
+        out = io.StringIO()
+        call_command('prune_auth_tokens', time_budget=0, stdout=out)
+        self.assertIn('jwt tokens: deleted 0 rows', out.getvalue())
+        self.assertEqual(OutstandingToken.objects.count(), 2)
+
+        call_command('reconcile_user_counters', time_budget=0, stdout=out)
+        self.assertIn('checked 0 users', out.getvalue())
+
+    def test_reconcile_repairs_drifted_counters(self):
+        other = User.objects.create_user(email='other@example.com', full_name='Other', password='pw-123456')
+        group = DashboardGroup.objects.create(name='Group', subject='Maths', description='d')
+        session = DashboardSession.objects.create(
+            title='Session', group=group, start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1)
+        )
+        session.attendees.add(self.user)
+        User.objects.filter(pk=self.user.pk).update(sessions_attended=7)
+
+        out = io.StringIO()
+        call_command('reconcile_user_counters', chunk_size=1, stdout=out)
+        self.assertIn('checked 2 users, repaired 1', out.getvalue())
+        self.assertEqual(User.objects.get(pk=self.user.pk).sessions_attended, 1)
+        self.assertEqual(User.objects.get(pk=other.pk).sessions_attended, 0)
+
+
+class UserImportTests(TestCase):
+    """Uploads are queued, and an email taken mid-import only skips its own row."""
+
+    CSV = 'email,full_name,password\na@example.com,A,pw-123456\nb@example.com,B,pw-123456\n'
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.admin = User.objects.create_superuser(email='admin@example.com', full_name='Admin', password='pw-123456')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_upload_is_queued_and_processed(self):
+        upload = SimpleUploadedFile('users.csv', self.CSV.encode(), content_type='text/csv')
+        response = self.client.post(reverse('user-bulk-import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'PENDING')
+        self.assertFalse(User.objects.filter(email='a@example.com').exists())
+
+        call_command('process_user_imports', workers=1, stdout=mock.Mock())
+        job = self.client.get(response.json()['url']).json()
+        self.assertEqual(job['status'], 'DONE')
+        self.assertEqual(job['report']['created'], 2)
+        self.assertFalse(UserImportJob.objects.get().file)
+        self.assertTrue(User.objects.get(email='b@example.com').check_password('pw-123456'))
+
+    def test_email_registered_during_import_is_reported_as_duplicate(self):
+        clean = UserImporter._clean
+
+        def clean_then_register(importer, batch):
+            rows = clean(importer, batch)
+            User.objects.create_user(email='b@example.com', full_name='Racer', password='pw-123456')
+            return rows
+
+        rows = [(2, {'email': 'a@example.com', 'password': 'pw'}), (3, {'email': 'b@example.com', 'password': 'pw'})]
+        with mock.patch.object(UserImporter, '_clean', clean_then_register):
+            report = UserImporter(workers=1).run(rows)
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['duplicates'], ['b@example.com'])
+        self.assertEqual(User.objects.get(email='b@example.com').full_name, 'Racer')
+        self.assertTrue(User.objects.filter(email='a@example.com').exists())
+
+    def test_invalid_rows_are_reported_not_inserted(self):
+        rows = [
+            (2, {'email': 'not-an-email', 'full_name': 'A'}),
+            (3, {'email': 'b@example.com', 'full_name': 'B' * 101}),
+            (4, {'email': 'c@example.com', 'full_name': 'C', 'academic_level': 'x' * 51}),
+            (5, {'email': 'd@example.com', 'full_name': 42}),
+            (6, {'email': 'e@example.com', 'full_name': 'E' * 100}),
+        ]
+        report = UserImporter(workers=1).run(rows)
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['errors'], [
+            (2, 'Invalid email'),
+            (3, 'full_name must be at most 100 characters'),
+            (4, 'academic_level must be at most 50 characters'),
+            (5, 'full_name must be a string'),
+        ])
+        self.assertEqual(list(User.objects.filter(is_superuser=False).values_list('email', flat=True)), ['e@example.com'])
+
+
+class AvatarRenditionTests(TestCase):
+    """Replacing an avatar deletes the old renditions and the cached user."""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        authentication._users.clear()
+        self.user = User.objects.create_user(email='member@example.com', full_name='Member', password='pw-123456')
+
+    def set_avatar(self, name, color):
+        output = io.BytesIO()
+        Image.new('RGB', (64, 64), color).save(output, 'PNG')
+        self.user.refresh_from_db()
+        self.user.avatar = SimpleUploadedFile(name, output.getvalue(), content_type='image/png')
+        self.user.save()
+        self.user.refresh_from_db()
+
+    def test_old_renditions_are_deleted_after_commit(self):
+        self.set_avatar('first.png', 'red')
+        with self.captureOnCommitCallbacks(execute=True):
+            first = build_renditions(self.user)
+        self.set_avatar('second.png', 'blue')
+        with self.captureOnCommitCallbacks(execute=True):
+            second = build_renditions(self.user)
+        storage = self.user.avatar.storage
+        for extension, name in first['48'].items():
+            self.assertFalse(storage.exists(name), name)
+            self.assertTrue(storage.exists(second['48'][extension]))
+
+    def test_rendition_write_invalidates_cached_user(self):
+        self.set_avatar('avatar.png', 'red')
+        auth = CachedJWTAuthentication()
+        token = AccessToken.for_user(self.user)
+        self.assertEqual(auth.get_user(token).avatar_renditions, {})
+        with self.captureOnCommitCallbacks(execute=True):
+            renditions = build_renditions(self.user)
+        self.assertEqual(auth.get_user(token).avatar_renditions, renditions)
+
+    def test_truncated_upload_is_rejected(self):
+        output = io.BytesIO()
+        Image.effect_noise((256, 256), 64).convert('RGB').save(output, 'JPEG')
+        truncated = output.getvalue()[:len(output.getvalue()) // 2]
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.patch(
+            reverse('user-profile'),
+            {'avatar': SimpleUploadedFile('avatar.jpg', truncated, content_type='image/jpeg')},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('avatar', response.json())
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+
+class SkillSearchTests(TestCase):
+    """Skill matches are a subquery, so the database filters and pages them."""
+
+    def setUp(self):
+        self.users = {}
+        for name, skills, university in [
+            ('ada', 'Python, SQL', 'AAU'),
+            ('bo', 'python', 'AAU'),
+            ('cy', 'SQL, python, go', 'ASTU'),
+            ('di', 'go', 'AAU'),
+        ]:
+            user = User.objects.create_user(email=f'{name}@example.com', full_name=name, password='pw-123456')
+            user.profile.skills = skills
+            user.profile.university = university
+            user.profile.save()
+            self.users[name] = user.pk
+
+    def matches(self, *args, **kwargs):
+        pks = User.objects.filter(pk__in=users_with_skills(*args, **kwargs)).values_list('pk', flat=True)
+        return sorted(pks)
+
+    def ids(self, *names):
+        return sorted(self.users[name] for name in names)
+
+    def test_all_any_and_university(self):
+        self.assertEqual(self.matches(['python', 'sql']), self.ids('ada', 'cy'))
+        self.assertEqual(self.matches(['sql', 'go'], match='any'), self.ids('ada', 'cy', 'di'))
+        self.assertEqual(self.matches(['python', 'sql'], university='AAU'), self.ids('ada'))
+        self.assertEqual(self.matches(['python', 'cobol']), [])
+
+    def test_search_is_one_query_per_page(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.users['ada']))
+        # One query resolves the skill names; the page is read in one more.
+        with self.assertNumQueries(2):
+            response = client.get(reverse('skill-search'), {'skills': 'python'})
+        self.assertEqual([user['id'] for user in response.json()['results']], self.ids('ada', 'bo', 'cy'))
@@ -0,0 +1,208 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class BlacklistFilter:
+    """
+    In-memory membership filter for blacklisted token jtis.
+
+    A positive answer from the Bloom filter is confirmed against
+    ``BlacklistedToken``; a negative one costs no query but may miss
+    tokens another process blacklisted since the last pull. New blacklist
+    rows are pulled in by primary key at most every ``refresh_interval``
+    seconds, by one thread at a time. Each pull re-reads a few ids below
+    the last one seen, because ids can commit out of order across
+    processes.
+
+    The filter only rejects blacklisted tokens early. What stops a token
+    from being used twice is ``RefreshToken.claim()``, or an exact check.
+    """
+
+    SYNC_OVERLAP = 256
+
+    def __init__(self, capacity, refresh_interval):
+        self.capacity = capacity
+        self.refresh_interval = refresh_interval
+        self._bloom = None
+        self._last_id = 0
+        self._synced_at = 0.0
+        self._syncing = False
+        self._added = []
+        self._lock = threading.Lock()
+
+    def _rebuild(self):
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).values_list('id', 'token__jti')
+        count = rows.count()
+        capacity = self.capacity
+        while capacity < count * 2:
+            capacity *= 2
+        bloom = BloomFilter(capacity)
+        last_id = 0
+        for pk, jti in rows.iterator(chunk_size=5000):
+            bloom.add(jti)
+            last_id = max(last_id, pk)
+        return bloom, last_id
+
+    def _sync(self):
+        """
+        Pull new blacklist rows. The queries run outside the lock, so other
+        threads keep answering from the current filter meanwhile; the lock
+        is only held to add the pulled jtis or to swap in a rebuilt filter.
+        """
+        with self._lock:
+            if self._syncing:
+                return
+            self._syncing = True
+            bloom, last_id = self._bloom, self._last_id
+        try:
+            if bloom is None or bloom.count > bloom.capacity:
+                bloom, last_id = self._rebuild()
+                with self._lock:
+                    for jti in self._added:
+                        bloom.add(jti)
+                    self.capacity = bloom.capacity
+                    self._bloom, self._last_id = bloom, last_id
+            else:
+                rows = list(BlacklistedToken.objects.filter(
+                    id__gt=last_id - self.SYNC_OVERLAP
+                ).values_list('id', 'token__jti'))
+                with self._lock:
+                    for pk, jti in rows:
+                        self._bloom.add(jti)
+                        self._last_id = max(self._last_id, pk)
+        finally:
+            with self._lock:
+                self._added = []
+                self._syncing = False
+                self._synced_at = time.monotonic()
+
+    def add(self, jti):
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+            if self._syncing:
+                self._added.append(jti)
+
+    def contains(self, jti):
+        with self._lock:
+            due = time.monotonic() - self._synced_at >= self.refresh_interval
+        if due:
+            self._sync()
+        with self._lock:
+            # Until the first pull completes, every lookup goes to the database.
+            maybe = self._bloom is None or jti in self._bloom
+        if not maybe:
+            return False
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+_config = getattr(settings, 'TOKEN_BLACKLIST_FILTER', {})
+blacklist_filter = BlacklistFilter(
+    capacity=_config.get('CAPACITY', 100000),
+    refresh_interval=_config.get('REFRESH_INTERVAL', 1),
+)
+
+
+class RefreshToken(BaseRefreshToken):
+    """RefreshToken whose blacklist check goes through ``blacklist_filter``."""
+
+    def check_blacklist(self, exact=False):
+        """``exact`` also asks the database when the filter says no."""
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if blacklist_filter.contains(jti) or (exact and BlacklistedToken.objects.filter(token__jti=jti).exists()):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist_filter.add(self.payload[api_settings.JTI_CLAIM])
+        return result
+
+    def claim(self):
+        """
+        Blacklist the token as it is rotated, or raise ``TokenError`` if it
+        already was, by any process: the blacklist row is unique per token,
+        so of two concurrent claims only one creates it.
+        """
+        created = self.blacklist()[1]
+        if not created:
+            raise TokenError(_("Token is blacklisted"))
+
+
+def is_revoked_by_watermark(user, token):
+    """
+    True if ``token`` was issued no later than the user's last global logout.
+    ``iat`` only has second precision, so a token from the same second as
+    the logout is treated as revoked.
+    """
+    if user.tokens_valid_after is None:
+        return False
+    return token.get('iat', 0) <= int(user.tokens_valid_after.timestamp())
+
+
+def revoke_all_tokens(user):
+    """
+    Log ``user`` out everywhere.
+
+    Moving the watermark invalidates every token issued so far in O(1); the
+    outstanding refresh tokens are also blacklisted with a single
+    INSERT ... SELECT so the blacklist stays complete, without decoding any
+    of them.
+    """
+    now = timezone.now()
+    db_now = connection.ops.adapt_datetimefield_value(now)
+    blacklisted = connection.ops.quote_name(BlacklistedToken._meta.db_table)
+    outstanding = connection.ops.quote_name(OutstandingToken._meta.db_table)
+
+    with transaction.atomic():
+        user.tokens_valid_after = now
+        user.save(update_fields=['tokens_valid_after'])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {blacklisted} (token_id, blacklisted_at) "
+                f"SELECT o.id, %s FROM {outstanding} o "
+                f"WHERE o.user_id = %s AND o.expires_at > %s "
+                f"AND NOT EXISTS (SELECT 1 FROM {blacklisted} b WHERE b.token_id = o.id)",
+                [db_now, user.pk, db_now],
+            )
+            return cursor.rowcount
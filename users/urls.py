@@ -12,7 +12,10 @@ from .views import (
     PasswordResetConfirmView,
     LogoutView,
     LogoutAllView,
-    UserSettingsView
+    UserSettingsView,
+    BulkUserImportView,
+    UserImportJobView,
+    SkillSearchView
 )
 
 urlpatterns = [
@@ -22,6 +25,8 @@ urlpatterns = [
     path('profile/', UserProfileView.as_view(), name='user-profile'),
     path('profile/<int:user_id>/', UserProfileView.as_view(), name='user-profile-admin'),
 
+    path('skills/search/', SkillSearchView.as_view(), name='skill-search'),
+
     path('password-reset/', PasswordResetRequestView.as_view(), name='password-reset-request'),
     path('password-reset/confirm/', PasswordResetConfirmView.as_view(), name='password-reset-confirm'),
 
@@ -30,6 +35,9 @@ urlpatterns = [
 
     path('settings/', UserSettingsView.as_view(), name='user-settings'),
 
+    path('import/', BulkUserImportView.as_view(), name='user-bulk-import'),
+    path('import/<int:pk>/', UserImportJobView.as_view(), name='user-bulk-import-job'),
+
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),        
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),       
     path('token/verify/', TokenVerifyView.as_view(), name='token_verify'),         
@@ -1,9 +1,9 @@
 from rest_framework import generics, status,permissions
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from rest_framework.parsers import MultiPartParser
 from rest_framework_simplejwt.exceptions import TokenError
-from rest_framework.exceptions import ValidationError, PermissionDenied
+from rest_framework.exceptions import APIException, ValidationError, PermissionDenied
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -11,9 +11,14 @@ from datetime import timedelta
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
 from django.conf import settings
 import secrets
-from django.core.mail import send_mail
 
-from .models import UserSettings,PasswordResetToken
+from .activity import record_activity
+from .hashing import HashingOverloaded, set_password
+from .mail import enqueue_mail
+from .preferences import get_user_settings
+from .skills import users_with_skills
+from .tokens import RefreshToken, revoke_all_tokens
+from .models import PasswordResetToken, UserImportJob
 from rest_framework.views import APIView
 from .serializers import (
     UserRegistrationSerializer,
@@ -22,13 +27,31 @@ from .serializers import (
     PasswordResetRequestSerializer,
     PasswordResetConfirmSerializer,
     LogoutSerializer,
-    UserSettingsSerializer
+    UserSettingsSerializer,
+    SkillMatchSerializer,
+    UserImportJobSerializer,
+    UserImportUploadSerializer,
 )
 
 User = get_user_model()
 
 
-class RegisterView(generics.CreateAPIView):
+class HashingUnavailable(APIException):
+    status_code = 503
+    default_detail = 'The server is busy, please try again shortly.'
+    default_code = 'hashing_overloaded'
+
+
+class ShedHashingLoadMixin:
+    """Answer 503 when the password hashing pool refuses more work."""
+
+    def handle_exception(self, exc):
+        if isinstance(exc, HashingOverloaded):
+            exc = HashingUnavailable()
+        return super().handle_exception(exc)
+
+
+class RegisterView(ShedHashingLoadMixin, generics.CreateAPIView):
     serializer_class = UserRegistrationSerializer
     permission_classes = [AllowAny]
 
@@ -58,7 +81,7 @@ class RegisterView(generics.CreateAPIView):
         }, status=status.HTTP_201_CREATED)
 
 
-class LoginUserView(generics.GenericAPIView):
+class LoginUserView(ShedHashingLoadMixin, generics.GenericAPIView):
     serializer_class = UserLoginSerializer
     permission_classes = [AllowAny]
 
@@ -74,8 +97,7 @@ class LoginUserView(generics.GenericAPIView):
             return Response({"detail": str(e)}, status=status.HTTP_401_UNAUTHORIZED)
 
         user = serializer.validated_data['user']
-        user.last_active = timezone.now()
-        user.save()
+        record_activity(user, timezone.now())
 
         refresh = RefreshToken.for_user(user)
 
@@ -89,9 +111,9 @@ class LoginUserView(generics.GenericAPIView):
                 'avatar': request.build_absolute_uri(user.avatar.url) if user.avatar else None,
                 'bio': user.bio,
                 'study_hours': user.study_hours,
-                'groups_joined': user.group_memberships.count() if hasattr(user, 'group_memberships') else 0,
+                'groups_joined': user.groups_joined,
                 'sessions_attended': user.sessions_attended,
-                'resources_shared': user.uploaded_resources.count() if hasattr(user, 'uploaded_resources') else 0
+                'resources_shared': user.resources_shared
             }
         }, status=status.HTTP_200_OK)
 
@@ -139,6 +161,44 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
         return super().patch(request, *args, **kwargs)
 
 
+class SkillSearchView(generics.ListAPIView):
+    serializer_class = SkillMatchSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        params = self.request.query_params
+        skills = [skill for skill in params.get('skills', '').split(',') if skill.strip()]
+        if not skills:
+            raise ValidationError({"skills": "Provide a comma-separated list of skills."})
+        match = params.get('match', 'all')
+        if match not in ('all', 'any'):
+            raise ValidationError({"match": "Must be 'all' or 'any'."})
+        if params.get('department') and not params.get('university'):
+            raise ValidationError({"department": "Filtering by department requires a university."})
+
+        matches = users_with_skills(
+            skills,
+            match=match,
+            university=params.get('university', '').strip(),
+            department=params.get('department', '').strip(),
+        )
+        return User.objects.filter(pk__in=matches).select_related('profile').order_by('pk')
+
+    @extend_schema(
+        operation_id='search_users_by_skill',
+        description='Users with all (match=all, default) or any (match=any) of the given skills, '
+                    'optionally within a university and department',
+        parameters=[
+            OpenApiParameter(name='skills', type=OpenApiTypes.STR, required=True, description='Comma-separated skills'),
+            OpenApiParameter(name='match', type=OpenApiTypes.STR, enum=['all', 'any']),
+            OpenApiParameter(name='university', type=OpenApiTypes.STR),
+            OpenApiParameter(name='department', type=OpenApiTypes.STR),
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
 class PasswordResetRequestView(generics.GenericAPIView):
     serializer_class = PasswordResetRequestSerializer
     permission_classes = [AllowAny]
@@ -167,12 +227,11 @@ class PasswordResetRequestView(generics.GenericAPIView):
 
             reset_link = f"{settings.FRONTEND_URL}/reset-password?token={token}"
 
-            send_mail(
+            enqueue_mail(
                 subject='Reset Your Password',
                 message=f'Hi {user.full_name},\n\nClick the link below to reset your password:\n\n{reset_link}\n\nIf you didn’t request this, please ignore this email.',
                 from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=[user.email],
-                fail_silently=False,
             )
 
         return Response(
@@ -181,7 +240,7 @@ class PasswordResetRequestView(generics.GenericAPIView):
         )
 
 
-class PasswordResetConfirmView(generics.GenericAPIView):
+class PasswordResetConfirmView(ShedHashingLoadMixin, generics.GenericAPIView):
     serializer_class = PasswordResetConfirmSerializer
     permission_classes = [AllowAny]
 
@@ -199,7 +258,7 @@ class PasswordResetConfirmView(generics.GenericAPIView):
             return Response({"token": "Invalid or expired token"}, status=status.HTTP_400_BAD_REQUEST)
 
         user = reset_token.user
-        user.set_password(new_password)
+        set_password(user, new_password)
         user.save()
 
         reset_token.is_used = True
@@ -236,12 +295,7 @@ class LogoutAllView(generics.GenericAPIView):
         description='Logout user from all devices by blacklisting all tokens'
     )
     def post(self, request, *args, **kwargs):
-        user = request.user
-        for token in user.outstandingtoken_set.all():
-            try:
-                RefreshToken(token.token).blacklist()
-            except TokenError:
-                pass
+        revoke_all_tokens(request.user)
         return Response({"message": "Logged out from all sessions"}, status=status.HTTP_200_OK)
 
 
@@ -250,14 +304,45 @@ class UserSettingsView(generics.GenericAPIView):
     serializer_class = UserSettingsSerializer
 
     def get(self, request):
-        settings_obj, _ = UserSettings.objects.get_or_create(user=request.user)
+        settings_obj = get_user_settings(request.user.pk)
         serializer = self.get_serializer(settings_obj)
         return Response(serializer.data)
 
     def put(self, request):
-        settings_obj, _ = UserSettings.objects.get_or_create(user=request.user)
+        settings_obj = get_user_settings(request.user.pk)
         serializer = self.get_serializer(settings_obj, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=400)
+
+
+class BulkUserImportView(APIView):
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    @extend_schema(
+        operation_id='bulk_import_users',
+        description='Admin only: queue an import of users from an uploaded CSV or NDJSON file ("file" field); '
+                    'poll the returned job for its report',
+        request={'multipart/form-data': UserImportUploadSerializer},
+        responses={202: UserImportJobSerializer, 400: OpenApiTypes.OBJECT},
+    )
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"file": "This field is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get('format') or ('ndjson' if upload.name.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if fmt not in ('csv', 'ndjson'):
+            return Response({"format": "Must be 'csv' or 'ndjson'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = UserImportJob.objects.create(file=upload, format=fmt, created_by=request.user)
+        return Response(UserImportJobSerializer(job, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
+
+
+class UserImportJobView(generics.RetrieveAPIView):
+    """Admin only: the status of an import and, once done, its report."""
+    permission_classes = [IsAdminUser]
+    serializer_class = UserImportJobSerializer
+    queryset = UserImportJob.objects.all()